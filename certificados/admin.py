@@ -7,3 +7,4 @@ class CertificadoAdmin(admin.ModelAdmin):
     search_fields = ('aluno__username', 'curso__nome', 'codigo')
     list_filter = ('curso', 'criado_em')
     readonly_fields = ('codigo', 'criado_em')
+    list_select_related = ('aluno', 'curso')
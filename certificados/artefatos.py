@@ -0,0 +1,226 @@
+import hashlib
+import io
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import get_template, render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Certificado
+from .qr import imagem_qr
+
+try:
+    from reportlab import rl_config
+    from xhtml2pdf import pisa
+except ImportError:  # PDF só com o xhtml2pdf (requirements.txt) instalado
+    pisa = None
+else:
+    # Sem data de criação nem ID aleatório no PDF: os mesmos dados geram os mesmos bytes
+    rl_config.invariant = 1
+
+try:
+    import PIL  # noqa: F401 (o pypdfium2 grava o PNG com o Pillow)
+    import pypdfium2
+except ImportError:  # PNG só com o pypdfium2 e o Pillow instalados; o PDF não depende deles
+    pypdfium2 = None
+
+# Modelo do certificado; a versão dos artefatos sai do hash dele (ver versao_modelo)
+MODELO = 'certificados/certificado.html'
+# Escala do PNG em relação aos pontos do PDF
+ESCALA_PNG = 2
+
+
+@cache
+def versao_modelo():
+    """
+    Versão do modelo do certificado: o início do SHA-256 do template. Muda
+    sozinha a cada alteração do layout, e com ela a pasta e a URL dos
+    artefatos, que são todos gerados de novo
+    """
+    return hashlib.sha256(get_template(MODELO).template.source.encode()).hexdigest()[:12]
+
+
+def renderizar_pdf(dados):
+    """
+    Gera o PDF do certificado renderizando o MODELO com o xhtml2pdf, a partir
+    de um dict com codigo, aluno, curso, escola, emitido_em e url_verificacao
+    (o QR Code aponta para ela; sem URL, vai sem QR Code). Não usa o banco,
+    para rodar em processos separados, e é determinístico: os mesmos dados
+    geram os mesmos bytes.
+    """
+    html = render_to_string(MODELO, {**dados, 'qr_code': imagem_qr(dados.get('url_verificacao'))})
+    saida = io.BytesIO()
+    if pisa.CreatePDF(html, dest=saida, encoding='utf-8').err:
+        raise RuntimeError(f"Falha ao gerar o PDF do certificado {dados['codigo']}")
+    return saida.getvalue()
+
+
+def renderizar_png(dados):
+    """O PDF do certificado rasterizado em PNG (requer o pypdfium2 e o Pillow)"""
+    documento = pypdfium2.PdfDocument(renderizar_pdf(dados))
+    try:
+        pagina = documento[0]
+        imagem = pagina.render(scale=ESCALA_PNG).to_pil()
+        pagina.close()
+    finally:
+        documento.close()
+    saida = io.BytesIO()
+    imagem.save(saida, 'PNG', optimize=True)
+    return saida.getvalue()
+
+
+RENDERIZADORES = {'pdf': renderizar_pdf, 'png': renderizar_png}
+TIPOS = {'pdf': 'application/pdf', 'png': 'image/png'}
+
+
+def formatos_disponiveis():
+    if pisa is None:
+        return []
+    return ['pdf', 'png'] if pypdfium2 is not None else ['pdf']
+
+
+def dados_certificado(certificado):
+    """Dados usados na renderização (carregue aluno, aluno__escola e curso com select_related)"""
+    aluno = certificado.aluno
+    escola = aluno.escola
+    return {
+        'codigo': certificado.codigo,
+        'aluno': aluno.get_full_name() or aluno.username,
+        'curso': certificado.curso.nome,
+        'escola': (escola.get_full_name() or escola.username) if escola else '',
+        'emitido_em': timezone.localtime(certificado.criado_em).strftime('%d/%m/%Y'),
+        'url_verificacao': url_verificacao(certificado.codigo),
+    }
+
+
+def pasta_artefatos(versao=None):
+    return Path(settings.CERTIFICADOS_ROOT) / f'v{versao or versao_modelo()}'
+
+
+def caminho_artefato(codigo, formato='pdf'):
+    """Artefato do certificado na versão atual do modelo: CERTIFICADOS_ROOT/v<versão>/<código>.<formato>"""
+    return pasta_artefatos() / f'{codigo}.{formato}'
+
+
+def url_artefato(codigo, formato='pdf'):
+    """URL versionada do artefato (muda com o modelo, então pode ser cacheada como imutável)"""
+    return reverse('certificado_artefato', kwargs={'codigo': codigo, 'versao': versao_modelo(), 'formato': formato})
+
+
+def url_verificacao(codigo):
+    """URL absoluta da página pública de verificação, impressa no QR Code; vazia sem SITE_URL"""
+    site = getattr(settings, 'SITE_URL', '')
+    if not site:
+        return ''
+    return site.rstrip('/') + reverse('verificar_certificado', kwargs={'codigo': codigo})
+
+
+def _caminho_digest(caminho):
+    return caminho.with_name(f'{caminho.name}.sha256')
+
+
+def _gravar_atomico(caminho, conteudo):
+    temporario = caminho.with_name(f'.{caminho.name}.{os.getpid()}.tmp')
+    temporario.write_bytes(conteudo)
+    os.replace(temporario, caminho)
+
+
+def gravar_artefato(tarefa):
+    """
+    Renderiza e grava o artefato de forma atômica, junto com o SHA-256 do
+    conteúdo (<arquivo>.sha256, usado como ETag); recebe (caminho, formato,
+    dados) para rodar no pool
+    """
+    caminho, formato, dados = tarefa
+    caminho = Path(caminho)
+    conteudo = RENDERIZADORES[formato](dados)
+    _gravar_atomico(_caminho_digest(caminho), hashlib.sha256(conteudo).hexdigest().encode())
+    _gravar_atomico(caminho, conteudo)
+    return str(caminho)
+
+
+def digest_artefato(caminho):
+    """
+    SHA-256 do conteúdo do artefato, lido do arquivo gravado ao lado dele.
+    Igual em todos os servidores e em toda nova renderização (a saída é
+    determinística), ao contrário de mtime e tamanho. Artefatos de antes do
+    digest têm o hash calculado uma vez e guardado.
+    """
+    try:
+        return _caminho_digest(caminho).read_text()
+    except FileNotFoundError:
+        digest = hashlib.sha256(caminho.read_bytes()).hexdigest()
+        _gravar_atomico(_caminho_digest(caminho), digest.encode())
+        return digest
+
+
+def obter_artefato(codigo, formato='pdf'):
+    """
+    Caminho do artefato, renderizado só na primeira vez (sem consulta ao
+    banco quando já existe). None se o código não existir.
+    """
+    caminho = caminho_artefato(codigo, formato)
+    if not caminho.exists():
+        certificado = Certificado.objects.select_related('aluno__escola', 'curso').filter(codigo=codigo).first()
+        if certificado is None:
+            return None
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        gravar_artefato((caminho, formato, dados_certificado(certificado)))
+    return caminho
+
+
+def renderizar_certificados(certificados, processos=None, formato='pdf'):
+    """
+    Gera os artefatos dos certificados num pool de processos (a renderização
+    não usa o banco: os dados são lidos antes) e retorna quantos foram gravados.
+    Sem a biblioteca do formato não gera nada; o artefato fica para quando for pedido.
+    """
+    if formato not in formatos_disponiveis():
+        return 0
+    tarefas = [(str(caminho_artefato(certificado.codigo, formato)), formato, dados_certificado(certificado))
+               for certificado in certificados]
+    if not tarefas:
+        return 0
+    pasta_artefatos().mkdir(parents=True, exist_ok=True)
+
+    processos = min(processos or os.cpu_count() or 1, len(tarefas))
+    if processos == 1:
+        return len([gravar_artefato(tarefa) for tarefa in tarefas])
+    with ProcessPoolExecutor(max_workers=processos) as pool:
+        return len(list(pool.map(gravar_artefato, tarefas, chunksize=max(1, len(tarefas) // (processos * 4)))))
+
+
+def aquecer_artefatos(formato='pdf', processos=None, batch_size=2000):
+    """
+    Renderiza os artefatos que faltam na versão atual do modelo (ex.: depois
+    de mudar o template), em lotes e num pool de processos. Retorna quantos
+    foram gerados.
+    """
+    pasta = pasta_artefatos()
+    sufixo = f'.{formato}'
+    existentes = {nome[:-len(sufixo)] for nome in os.listdir(pasta) if nome.endswith(sufixo)} if pasta.is_dir() else set()
+    faltando = [
+        codigo for codigo in Certificado.objects.values_list('codigo', flat=True).iterator(chunk_size=batch_size)
+        if codigo not in existentes
+    ]
+    total = 0
+    for inicio in range(0, len(faltando), batch_size):
+        certificados = Certificado.objects.filter(
+            codigo__in=faltando[inicio:inicio + batch_size]
+        ).select_related('aluno__escola', 'curso')
+        total += renderizar_certificados(certificados, processos, formato)
+    return total
+
+
+def remover_versoes_antigas():
+    """Apaga as pastas de artefatos de versões anteriores do modelo; retorna quantas foram removidas"""
+    raiz = Path(settings.CERTIFICADOS_ROOT)
+    antigas = [pasta for pasta in raiz.glob('v*') if pasta.is_dir() and pasta != pasta_artefatos()] if raiz.is_dir() else []
+    for pasta in antigas:
+        shutil.rmtree(pasta, ignore_errors=True)
+    return len(antigas)
@@ -0,0 +1,101 @@
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from cursos.matriculas import Matricula
+from cursos.models import ResumoProgresso
+from cursos.progresso import resumos_do_aluno
+
+from .artefatos import renderizar_certificados
+from .models import Certificado, gerar_codigo
+from .verificacao import invalidar_verificacao
+
+TAMANHO_LOTE = 1000
+# Rodadas de emissão antes de desistir dos pares que colidiram (ex.: emissão concorrente)
+TENTATIVAS = 3
+
+# Certificados criados nesta emissão e quantos PDFs foram gerados
+ResultadoEmissao = namedtuple('ResultadoEmissao', ['emitidos', 'renderizados'])
+
+
+def pares_elegiveis(cursos_ids=None, alunos_ids=None):
+    """
+    (aluno_id, curso_id) de quem concluiu o curso (resumo em 100%), está
+    matriculado e ainda não tem certificado, numa única consulta.
+    """
+    resumos = ResumoProgresso.objects.filter(percentual=100, aluno__tipo='aluno').filter(
+        Exists(Matricula.objects.filter(usuario_id=OuterRef('aluno_id'), curso_id=OuterRef('curso_id')))
+    ).exclude(
+        Exists(Certificado.objects.filter(aluno_id=OuterRef('aluno_id'), curso_id=OuterRef('curso_id')))
+    )
+    if cursos_ids is not None:
+        resumos = resumos.filter(curso_id__in=list(cursos_ids))
+    if alunos_ids is not None:
+        resumos = resumos.filter(aluno_id__in=list(alunos_ids))
+    return list(resumos.order_by('curso_id', 'aluno_id').values_list('aluno_id', 'curso_id'))
+
+
+def codigos_unicos(quantidade):
+    """Gera `quantidade` códigos distintos entre si e dos já gravados (uma consulta por lote)"""
+    codigos = set()
+    while len(codigos) < quantidade:
+        novos = set()
+        while len(novos) < min(quantidade - len(codigos), TAMANHO_LOTE):
+            codigo = gerar_codigo()
+            if codigo not in codigos:
+                novos.add(codigo)
+        codigos |= novos - set(Certificado.objects.filter(codigo__in=novos).values_list('codigo', flat=True))
+    return list(codigos)
+
+
+def emitir_certificados(cursos_ids=None, alunos_ids=None, renderizar=True, processos=None):
+    """
+    Emite os certificados de todos os pares elegíveis (ver pares_elegiveis)
+    com bulk_create e gera os PDFs num pool de processos. Pares que
+    conflitarem na gravação (emissão concorrente ou código repetido) são
+    ignorados pelo banco e tentados de novo na rodada seguinte.
+    """
+    emitidos = []
+    for _ in range(TENTATIVAS):
+        pares = pares_elegiveis(cursos_ids, alunos_ids)
+        if not pares:
+            break
+        codigos = codigos_unicos(len(pares))
+        with transaction.atomic():
+            Certificado.objects.bulk_create(
+                [
+                    Certificado(aluno_id=aluno_id, curso_id=curso_id, codigo=codigo)
+                    for (aluno_id, curso_id), codigo in zip(pares, codigos)
+                ],
+                batch_size=TAMANHO_LOTE,
+                ignore_conflicts=True
+            )
+        # O bulk_create não dispara sinais: descarta "não encontrado" guardado para os códigos novos
+        invalidar_verificacao(codigos)
+        # Com ignore_conflicts os ids não voltam: relê pelos códigos, que são desta emissão
+        for inicio in range(0, len(codigos), TAMANHO_LOTE):
+            emitidos.extend(
+                Certificado.objects.filter(codigo__in=codigos[inicio:inicio + TAMANHO_LOTE])
+                .select_related('aluno__escola', 'curso')
+            )
+
+    renderizados = renderizar_certificados(emitidos, processos) if renderizar and emitidos else 0
+    return ResultadoEmissao(emitidos, renderizados)
+
+
+def emitir_certificado(aluno, curso, processos=1):
+    """
+    Certificado do aluno no curso: o existente, ou um emitido agora (pelo
+    mesmo caminho da emissão em lote) se ele concluiu; None se não concluiu.
+    """
+    certificado = Certificado.objects.filter(aluno=aluno, curso=curso).first()
+    if certificado is not None:
+        return certificado
+    # Garante o resumo de quem tem progresso anterior à tabela de resumos
+    resumos_do_aluno(aluno, [curso])
+    emitidos = emitir_certificados([curso.id], [aluno.id], processos=processos).emitidos
+    if emitidos:
+        return emitidos[0]
+    # Emitido por outra requisição ao mesmo tempo, ou o aluno não concluiu
+    return Certificado.objects.filter(aluno=aluno, curso=curso).first()
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from certificados.artefatos import aquecer_artefatos, formatos_disponiveis, remover_versoes_antigas, versao_modelo
+
+
+class Command(BaseCommand):
+    help = (
+        'Pré-renderiza, num pool de processos, os artefatos (PDF/PNG) dos certificados que ainda não '
+        'existem na versão atual do modelo'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', action='append', dest='formatos', choices=['pdf', 'png'],
+                            help='Formato a gerar (pode ser repetido). Padrão: pdf')
+        parser.add_argument('--processos', type=int, help='Padrão: núcleos da máquina')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--limpar', action='store_true', help='Remove os artefatos de versões antigas do modelo')
+
+    def handle(self, *args, **options):
+        formatos = options['formatos'] or ['pdf']
+        indisponiveis = set(formatos) - set(formatos_disponiveis())
+        if indisponiveis:
+            raise CommandError(
+                "Formato indisponível (instale o xhtml2pdf para PDF e também o pypdfium2 e o Pillow para PNG): "
+                f"{', '.join(sorted(indisponiveis))}"
+            )
+
+        for formato in formatos:
+            inicio = time.perf_counter()
+            total = aquecer_artefatos(formato, options['processos'], options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{total} artefatos {formato.upper()} gerados (modelo v{versao_modelo()}) "
+                f"em {time.perf_counter() - inicio:.1f}s"
+            ))
+        if options['limpar']:
+            self.stdout.write(f"{remover_versoes_antigas()} pastas de versões antigas removidas")
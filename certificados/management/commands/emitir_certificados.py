@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from certificados.emissao import emitir_certificados
+from cursos.models import Curso
+from cursos.progresso import reconstruir_resumos
+from usuarios.models import Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        'Emite os certificados de todos os alunos que concluíram seus cursos (uma consulta de elegíveis, '
+        'bulk_create com códigos curtos únicos) e gera os PDFs num pool de processos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--curso',
+            type=int,
+            action='append',
+            dest='cursos',
+            help='ID do curso (pode ser repetido). Padrão: todos'
+        )
+        parser.add_argument('--escola', help='Username ou ID da escola: só os alunos dela')
+        parser.add_argument('--processos', type=int, help='Processos para gerar os PDFs. Padrão: núcleos da máquina')
+        parser.add_argument('--sem-pdf', action='store_true', help='Só grava os certificados, sem gerar os PDFs')
+        parser.add_argument(
+            '--recalcular-resumos',
+            action='store_true',
+            help='Reconstrói os resumos de progresso dos cursos antes (a elegibilidade usa os resumos)'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        alunos_ids = None
+        if options['escola']:
+            escolas = Usuario.objects.filter(tipo='escola')
+            escola = escolas.filter(username=options['escola']).first()
+            if escola is None and options['escola'].isdigit():
+                escola = escolas.filter(id=options['escola']).first()
+            if escola is None:
+                raise CommandError(f"Escola não encontrada: {options['escola']}")
+            alunos_ids = Usuario.objects.filter(escola=escola, tipo='aluno').values_list('id', flat=True)
+
+        if options['cursos']:
+            encontrados = set(Curso.objects.filter(id__in=options['cursos']).values_list('id', flat=True))
+            faltando = set(options['cursos']) - encontrados
+            if faltando:
+                raise CommandError(f"Cursos não encontrados: {', '.join(map(str, sorted(faltando)))}")
+
+        if options['recalcular_resumos']:
+            self.stdout.write(f"{reconstruir_resumos(options['cursos'])} resumos reconstruídos")
+
+        resultado = emitir_certificados(
+            cursos_ids=options['cursos'],
+            alunos_ids=alunos_ids,
+            renderizar=not options['sem_pdf'],
+            processos=options['processos'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(resultado.emitidos)} certificados emitidos e {resultado.renderizados} PDFs gerados "
+            f"em {time.perf_counter() - inicio:.1f}s"
+        ))
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+import certificados.models
+
+
+def substituir_codigos_invalidos(apps, schema_editor):
+    # Códigos do default antigo ('TEMPORARIO') ou do formato CERT-{aluno}-{curso}-{timestamp}
+    Certificado = apps.get_model('certificados', 'Certificado')
+    existentes = set(Certificado.objects.values_list('codigo', flat=True))
+    for certificado in Certificado.objects.filter(
+            models.Q(codigo='TEMPORARIO') | models.Q(codigo__startswith='CERT-')):
+        codigo = certificados.models.gerar_codigo()
+        while codigo in existentes:
+            codigo = certificados.models.gerar_codigo()
+        existentes.add(codigo)
+        certificado.codigo = codigo
+        certificado.save(update_fields=['codigo'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificados', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='certificado',
+            name='codigo',
+            field=models.CharField(default=certificados.models.gerar_codigo, editable=False, max_length=20, unique=True),
+        ),
+        migrations.RunPython(substituir_codigos_invalidos, migrations.RunPython.noop),
+    ]
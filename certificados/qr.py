@@ -0,0 +1,49 @@
+"""
+QR Code do link de verificação impresso nos certificados, gerado com o segno
+(requirements.txt). Sem o segno, ou com um texto que não caiba, o certificado
+sai sem o QR Code, só com o link escrito.
+"""
+import logging
+
+try:
+    import segno
+except ImportError:  # O QR Code é opcional no certificado; sem o segno ele só não é impresso
+    segno = None
+
+logger = logging.getLogger(__name__)
+
+# Maior versão aceita (57 módulos): acima disso os módulos ficam pequenos
+# demais para a câmera no tamanho em que o QR Code é impresso
+VERSAO_MAXIMA = 10
+# Pixels por módulo no PNG embutido no certificado
+ESCALA_PNG = 10
+
+
+def _gerar_qr(texto):
+    """
+    QR Code do texto com correção de erros nível M, na menor versão em que
+    couber. None quando não há texto, o segno não está instalado ou o texto
+    não cabe até a VERSAO_MAXIMA (ex.: SITE_URL longo demais).
+    """
+    if not texto or segno is None:
+        return None
+    try:
+        qr = segno.make_qr(texto, error='m')
+    except segno.DataOverflowError:
+        qr = None
+    if qr is None or qr.version > VERSAO_MAXIMA:
+        logger.warning('Texto longo demais para o QR Code do certificado (%s bytes)', len(texto.encode()))
+        return None
+    return qr
+
+
+def matriz_qr(texto):
+    """Módulos do QR Code do texto, linha a linha (True = escuro, sem a zona de silêncio), ou None"""
+    qr = _gerar_qr(texto)
+    return None if qr is None else [[bool(modulo) for modulo in linha] for linha in qr.matrix]
+
+
+def imagem_qr(texto):
+    """PNG do QR Code do texto, com a zona de silêncio, como data URI para o <img> do modelo; '' sem QR Code"""
+    qr = _gerar_qr(texto)
+    return '' if qr is None else qr.png_data_uri(scale=ESCALA_PNG)
@@ -0,0 +1,16 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Certificado
+from .verificacao import invalidar_verificacao
+
+
+@receiver(post_save, sender=Certificado)
+@receiver(post_delete, sender=Certificado)
+def invalidar_verificacao_do_certificado(sender, instance, **kwargs):
+    # Derruba também o "não encontrado" guardado para o código antes da emissão
+    invalidar_verificacao([instance.codigo])
+    transaction.on_commit(partial(invalidar_verificacao, [instance.codigo]))
@@ -1,3 +1,299 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import skipUnless
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from cursos.models import Capitulo, Curso, Progresso
+from cursos.progresso import reconstruir_resumos
+from usuarios.models import Usuario
+
+from .artefatos import (
+    caminho_artefato, dados_certificado, gravar_artefato, pasta_artefatos, pisa, pypdfium2, renderizar_pdf,
+    renderizar_png, versao_modelo,
+)
+from .emissao import emitir_certificados, pares_elegiveis
+from .models import Certificado
+from .qr import matriz_qr, segno
+
+try:
+    import cv2
+    import numpy
+except ImportError:  # Só para o teste que lê o QR Code gerado
+    cv2 = None
+
+try:
+    import pypdf
+except ImportError:  # Vem com o xhtml2pdf; usado para ler o texto e as imagens dos PDFs
+    pypdf = None
+
+
+def ler_pdf(pdf):
+    """(texto, quantidade de imagens) da primeira página do PDF"""
+    pagina = pypdf.PdfReader(io.BytesIO(pdf)).pages[0]
+    return pagina.extract_text(), len(pagina.images)
+
+CACHE_LOCAL = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'sessoes': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sessoes'},
+    'verificacao': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'verificacao'},
+}
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class EmissaoCertificadosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.escola = Usuario.objects.create(username='escola_teste', first_name='Escola Modelo', tipo='escola')
+        cls.curso = Curso.objects.create(nome="Informática Básica", descricao="Curso")
+        cls.aula = Capitulo.objects.create(curso=cls.curso, ordem=1, tipo='aula', titulo="Aula 1", url="a")
+        cls.alunos = [
+            Usuario.objects.create(username=f'aluno_{i}', first_name='João', last_name=f'Silva {i}',
+                                   tipo='aluno', escola=cls.escola)
+            for i in range(6)
+        ]
+        cls.curso.alunos.add(*cls.alunos[:5])
+        # Concluíram: 0 a 3 e o 5, que não está matriculado; o 4 não concluiu
+        for aluno in cls.alunos[:4] + cls.alunos[5:]:
+            Progresso.objects.create(aluno=aluno, capitulo=cls.aula, concluido=True)
+        Certificado.objects.create(aluno=cls.alunos[0], curso=cls.curso)
+        reconstruir_resumos([cls.curso.id])
+
+    def setUp(self):
+        caches['default'].clear()
+        self.pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.pasta, ignore_errors=True)
+        configuracao = override_settings(CERTIFICADOS_ROOT=self.pasta)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def test_elegiveis_numa_consulta(self):
+        with self.assertNumQueries(1):
+            pares = pares_elegiveis()
+        self.assertEqual(pares, [(aluno.id, self.curso.id) for aluno in self.alunos[1:4]])
+
+    @skipUnless(pisa, 'requer o xhtml2pdf')
+    def test_emissao_em_lote_com_codigos_curtos_e_pdfs(self):
+        resultado = emitir_certificados(processos=2)
+        self.assertEqual(sorted(c.aluno_id for c in resultado.emitidos), [a.id for a in self.alunos[1:4]])
+        self.assertEqual(resultado.renderizados, 3)
+        codigos = list(Certificado.objects.values_list('codigo', flat=True))
+        self.assertEqual(len(set(codigos)), 4)
+        self.assertTrue(all(len(codigo) <= 20 for codigo in codigos))
+        for certificado in resultado.emitidos:
+            self.assertTrue(caminho_artefato(certificado.codigo).read_bytes().startswith(b'%PDF-1.4'))
+
+        self.assertEqual(emitir_certificados().emitidos, [])
+
+    @skipUnless(pisa, 'requer o xhtml2pdf')
+    def test_pdf_deterministico_com_acentos(self):
+        dados = {'codigo': 'ABC123', 'aluno': 'João (Silva)', 'curso': 'Informática', 'escola': '',
+                 'emitido_em': '01/02/2026'}
+        pdf = renderizar_pdf(dados)
+        self.assertEqual(pdf, renderizar_pdf(dados))
+        texto, _ = ler_pdf(pdf)
+        self.assertIn('João (Silva)', texto)
+        self.assertIn('Informática', texto)
+        self.assertNotIn('oferecido por', texto)
+
+    @skipUnless(pypdfium2, 'requer o pypdfium2 e o Pillow')
+    def test_png_e_o_pdf_rasterizado(self):
+        dados = {'codigo': 'ABC123', 'aluno': 'Ana', 'curso': 'Excel', 'escola': '', 'emitido_em': '01/02/2026'}
+        png = renderizar_png(dados)
+        self.assertTrue(png.startswith(b'\x89PNG'))
+        self.assertEqual(png, renderizar_png(dados))
+
+    def test_versao_vem_do_hash_do_modelo(self):
+        modelo = Path(__file__).parent / 'templates' / 'certificados' / 'certificado.html'
+        self.assertEqual(versao_modelo(), hashlib.sha256(modelo.read_text(encoding='utf-8').encode()).hexdigest()[:12])
+        self.assertEqual(pasta_artefatos().name, f'v{versao_modelo()}')
+
+    def test_view_do_aluno_usa_o_servico(self):
+        self.client.force_login(self.alunos[1])
+        self.client.post(f'/cursos/curso/{self.curso.id}/gerar_certificado/')
+        certificado = Certificado.objects.get(aluno=self.alunos[1], curso=self.curso)
+        self.assertEqual(len(certificado.codigo), 10)
+
+        self.client.force_login(self.alunos[4])
+        self.client.post(f'/cursos/curso/{self.curso.id}/gerar_certificado/')
+        self.assertFalse(Certificado.objects.filter(aluno=self.alunos[4]).exists())
+
+    @skipUnless(pisa, 'requer o xhtml2pdf')
+    def test_comando(self):
+        saida = io.StringIO()
+        call_command('emitir_certificados', '--escola', 'escola_teste', '--processos', '1', stdout=saida)
+        self.assertIn('3 certificados emitidos e 3 PDFs gerados', saida.getvalue())
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ArtefatoCertificadoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = Usuario.objects.create(username='aluno_teste', first_name='Ana', tipo='aluno')
+        cls.curso = Curso.objects.create(nome="Excel", descricao="Curso")
+        cls.certificado = Certificado.objects.create(aluno=cls.aluno, curso=cls.curso)
+        cls.url = f'/certificados/{cls.certificado.codigo}/v{versao_modelo()}.pdf'
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.pasta, ignore_errors=True)
+        configuracao = override_settings(CERTIFICADOS_ROOT=self.pasta)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    @skipUnless(pisa, 'requer o xhtml2pdf')
+    def test_renderiza_uma_vez_e_serve_do_disco(self):
+        primeira = self.client.get(self.url)
+        self.assertEqual(primeira['Content-Type'], 'application/pdf')
+        self.assertIn('immutable', primeira['Cache-Control'])
+        self.assertTrue(b''.join(primeira.streaming_content).startswith(b'%PDF'))
+
+        with self.assertNumQueries(0):
+            segunda = self.client.get(self.url)
+        self.assertEqual(segunda['ETag'], primeira['ETag'])
+        segunda.close()
+
+        nao_modificado = self.client.get(self.url, HTTP_IF_NONE_MATCH=primeira['ETag'])
+        self.assertEqual(nao_modificado.status_code, 304)
+
+        # Renderizar de novo (outro servidor, ou dois primeiros acessos ao mesmo tempo) não muda o ETag
+        caminho = caminho_artefato(self.certificado.codigo)
+        caminho.with_name(f'{caminho.name}.sha256').unlink()
+        gravar_artefato((caminho, 'pdf', dados_certificado(self.certificado)))
+        os.utime(caminho, ns=(1, 1))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=primeira['ETag']).status_code, 304)
+
+    def test_versao_antiga_redireciona_e_codigo_desconhecido_da_404(self):
+        antiga = f'/certificados/{self.certificado.codigo}/v0.pdf'
+        self.assertRedirects(self.client.get(antiga), self.url, fetch_redirect_response=False)
+        self.assertRedirects(self.client.get(f'/certificados/{self.certificado.codigo}.pdf'), self.url,
+                             fetch_redirect_response=False)
+        self.assertEqual(self.client.get(f'/certificados/NAOEXISTE/v{versao_modelo()}.pdf').status_code, 404)
+
+    def test_visualizar_do_aluno_redireciona_para_o_pdf(self):
+        self.client.force_login(self.aluno)
+        resposta = self.client.get(f'/cursos/{self.certificado.id}/visualizar/')
+        self.assertRedirects(resposta, self.url, fetch_redirect_response=False)
+
+    @skipUnless(pisa, 'requer o xhtml2pdf')
+    def test_aquecimento_gera_so_os_que_faltam(self):
+        self.client.get(self.url).close()
+        outro = Certificado.objects.create(aluno=self.aluno, curso=Curso.objects.create(nome="Word", descricao="x"))
+        saida = io.StringIO()
+        call_command('aquecer_certificados', '--processos', '1', '--limpar', stdout=saida)
+        self.assertIn('1 artefatos PDF gerados', saida.getvalue())
+        self.assertTrue(caminho_artefato(outro.codigo).exists())
+        self.assertEqual(sorted(p.name for p in pasta_artefatos().parent.iterdir()), [f'v{versao_modelo()}'])
+
+
+@override_settings(CACHES=CACHE_LOCAL, VERIFICACAO_CACHE='verificacao', VERIFICACAO_LIMITE=60, VERIFICACAO_PROXIES=0,
+                   SITE_URL='https://cursos.exemplo.com.br')
+class VerificacaoCertificadoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = Usuario.objects.create(username='aluno_teste', first_name='Ana', last_name='Lima', tipo='aluno')
+        cls.curso = Curso.objects.create(nome="Excel", descricao="Curso")
+        cls.certificado = Certificado.objects.create(aluno=cls.aluno, curso=cls.curso)
+        cls.url = f'/certificados/verificar/{cls.certificado.codigo}/'
+
+    def setUp(self):
+        caches['verificacao'].clear()
+
+    @skipUnless(segno, 'requer o segno')
+    def test_qr_code(self):
+        url = f'https://cursos.exemplo.com.br{self.url}'
+        matriz = matriz_qr(url)
+        # Versão v tem 17 + 4v módulos de lado; os localizadores ficam em três cantos
+        lado = len(matriz)
+        self.assertEqual((lado - 17) % 4, 0)
+        self.assertTrue(all(len(linha) == lado for linha in matriz))
+        localizador = [[True] * 7] + [[True] + [False] * 5 + [True]] + [[True, False] + [True] * 3 + [False, True]] * 3
+        localizador += [[True] + [False] * 5 + [True], [True] * 7]
+        for x, y in ((0, 0), (lado - 7, 0), (0, lado - 7)):
+            self.assertEqual([linha[x:x + 7] for linha in matriz[y:y + 7]], localizador)
+        with self.assertLogs('certificados.qr', 'WARNING'):
+            self.assertIsNone(matriz_qr('x' * 3000))
+
+    @skipUnless(segno and cv2, 'requer o segno e o OpenCV para ler o QR Code')
+    def test_qr_code_e_lido_pela_camera(self):
+        url = f'https://cursos.exemplo.com.br{self.url}'
+        # Módulos de 8 pixels e zona de silêncio de 4 módulos, como impresso
+        modulos = numpy.pad(numpy.array(matriz_qr(url), dtype=numpy.uint8), 4)
+        imagem = numpy.kron(1 - modulos, numpy.ones((8, 8), dtype=numpy.uint8)) * 255
+        texto, _, _ = cv2.QRCodeDetector().detectAndDecode(imagem)
+        self.assertEqual(texto, url)
+
+    @skipUnless(segno and pisa, 'requer o segno e o xhtml2pdf')
+    def test_site_url_longo_sai_sem_qr_code(self):
+        with self.settings(SITE_URL='https://cursos.exemplo.com.br/' + 'x' * 400), \
+                self.assertLogs('certificados.qr', 'WARNING'):
+            texto, imagens = ler_pdf(renderizar_pdf(dados_certificado(self.certificado)))
+        self.assertIn('Verifique em', texto)
+        self.assertIn('https://cursos.exemplo.com.br/xxx', texto)
+        self.assertEqual(imagens, 0)
+
+    @skipUnless(segno and pisa, 'requer o segno e o xhtml2pdf')
+    def test_pdf_tem_qr_code_da_url_de_verificacao(self):
+        dados = dados_certificado(self.certificado)
+        self.assertEqual(dados['url_verificacao'], f'https://cursos.exemplo.com.br{self.url}')
+        texto, imagens = ler_pdf(renderizar_pdf(dados))
+        self.assertIn(f'Verifique em https://cursos.exemplo.com.br{self.url}', texto)
+        self.assertEqual(imagens, 1)
+        with self.settings(SITE_URL=''):
+            texto, imagens = ler_pdf(renderizar_pdf(dados_certificado(self.certificado)))
+        self.assertNotIn('Verifique em', texto)
+        self.assertEqual(imagens, 0)
+
+    def test_verificacao_cacheada(self):
+        resposta = self.client.get(self.url)
+        self.assertContains(resposta, 'Ana Lima')
+        self.assertContains(resposta, 'Excel')
+        self.assertIn('public', resposta['Cache-Control'])
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        resposta = self.client.get(self.url, HTTP_ACCEPT='application/json')
+        self.assertEqual(resposta.json()['aluno'], 'Ana Lima')
+        self.assertTrue(resposta.json()['valido'])
+
+    def test_codigo_inexistente_em_cache_negativo(self):
+        self.assertEqual(self.client.get('/certificados/verificar/NAOEXISTE1/').status_code, 404)
+        with self.assertNumQueries(0):
+            resposta = self.client.get('/certificados/verificar/NAOEXISTE1/?formato=json')
+        self.assertEqual(resposta.status_code, 404)
+        self.assertEqual(resposta.json(), {'codigo': 'NAOEXISTE1', 'valido': False})
+        with self.assertNumQueries(0):
+            self.client.get('/certificados/verificar/codigo-invalido/')
+
+        # Emitir o certificado derruba o "não encontrado" guardado
+        Certificado.objects.create(aluno=self.aluno, curso=Curso.objects.create(nome="Word", descricao="x"),
+                                   codigo='NAOEXISTE1')
+        self.assertEqual(self.client.get('/certificados/verificar/NAOEXISTE1/').status_code, 200)
+
+    @override_settings(VERIFICACAO_LIMITE=3)
+    def test_limite_por_ip_so_para_consultas_fora_do_cache(self):
+        inexistente = '/certificados/verificar/NAOEXISTE{}/'
+        for i in range(3):
+            self.assertEqual(self.client.get(inexistente.format(i), REMOTE_ADDR='10.0.0.1').status_code, 404)
+        resposta = self.client.get(inexistente.format(9), REMOTE_ADDR='10.0.0.1', HTTP_ACCEPT='application/json')
+        self.assertEqual(resposta.status_code, 429)
+        self.assertIn('Retry-After', resposta)
+        # Respostas em cache não contam: o portal que repete códigos conhecidos não é barrado
+        for _ in range(2):
+            self.assertEqual(self.client.get(self.url, REMOTE_ADDR='10.0.0.2').status_code, 200)
+        for _ in range(10):
+            self.assertEqual(self.client.get(self.url, REMOTE_ADDR='10.0.0.1').status_code, 200)
+            self.assertEqual(self.client.get(inexistente.format(0), REMOTE_ADDR='10.0.0.1').status_code, 404)
+
+        # Atrás de um proxy vale o IP que ele acrescentou, não o que o cliente mandou
+        with self.settings(VERIFICACAO_PROXIES=1):
+            for i, ip_forjado in enumerate(('1.1.1.1', '2.2.2.2', '3.3.3.3')):
+                self.client.get(f'/certificados/verificar/OUTRO{i}/', HTTP_X_FORWARDED_FOR=f'{ip_forjado}, 10.0.0.3')
+            resposta = self.client.get('/certificados/verificar/OUTRO9/', HTTP_X_FORWARDED_FOR='4.4.4.4, 10.0.0.3')
+            self.assertEqual(resposta.status_code, 429)
@@ -1,6 +1,11 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 urlpatterns = [
+    path('verificar/<str:codigo>/', views.verificar_certificado, name='verificar_certificado'),
     path('<int:certificado_id>/visualizar/', views.visualizar_certificado, name='visualizar_certificado'),
+    re_path(r'^(?P<codigo>[0-9A-Za-z]{1,20})\.(?P<formato>pdf|png)$', views.arquivo_certificado,
+            name='certificado_arquivo'),
+    re_path(r'^(?P<codigo>[0-9A-Za-z]{1,20})/v(?P<versao>[0-9a-f]+)\.(?P<formato>pdf|png)$', views.artefato_certificado,
+            name='certificado_artefato'),
 ]
@@ -0,0 +1,96 @@
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .artefatos import dados_certificado
+from .models import Certificado
+
+TIMEOUT_VERIFICACAO = 60 * 60
+# Códigos inexistentes ficam menos tempo, para um certificado recém-emitido logo aparecer
+TIMEOUT_NAO_ENCONTRADO = 60 * 5
+# Valor guardado para códigos inexistentes (None é o "não está no cache")
+NAO_ENCONTRADO = False
+# Códigos novos têm 10 caracteres; os antigos (CERT-...) foram convertidos para até 20
+FORMATO_CODIGO = re.compile(r'^[0-9A-Za-z]{1,20}$')
+
+
+class LimiteExcedido(Exception):
+    """O IP passou do limite de consultas que chegam ao banco"""
+
+
+def _cache():
+    return caches[getattr(settings, 'VERIFICACAO_CACHE', 'default')]
+
+
+def _chave(codigo):
+    return f'certificados:verificacao:{codigo}'
+
+
+def invalidar_verificacao(codigos):
+    _cache().delete_many([_chave(codigo) for codigo in set(codigos)])
+
+
+def verificar_codigo(codigo, request=None):
+    """
+    Dados públicos do certificado (os mesmos impressos nele) ou None se o
+    código não existir. As duas respostas ficam em cache, então rajadas de
+    consultas ao mesmo código, válido ou não, não chegam ao banco. Com
+    `request`, só as consultas que não estão em cache contam no limite do IP
+    (ver excedeu_limite); passando dele, levanta LimiteExcedido.
+    """
+    if not FORMATO_CODIGO.match(codigo):
+        return None
+    guardado = _cache().get(_chave(codigo))
+    if guardado is not None:
+        return guardado or None
+
+    if request is not None and excedeu_limite(request):
+        raise LimiteExcedido
+    certificado = Certificado.objects.select_related('aluno__escola', 'curso').filter(codigo=codigo).first()
+    if certificado is None:
+        _cache().set(_chave(codigo), NAO_ENCONTRADO, TIMEOUT_NAO_ENCONTRADO)
+        return None
+    dados = dados_certificado(certificado)
+    _cache().set(_chave(codigo), dados, TIMEOUT_VERIFICACAO)
+    return dados
+
+
+def ip_do_cliente(request):
+    """
+    IP de quem fez a requisição. Atrás de proxies (VERIFICACAO_PROXIES), usa
+    o endereço que o proxy mais externo acrescentou ao X-Forwarded-For, e não
+    o primeiro da lista, que o cliente pode forjar.
+    """
+    proxies = getattr(settings, 'VERIFICACAO_PROXIES', 0)
+    encaminhado = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+    if proxies and len(encaminhado) >= proxies:
+        return encaminhado[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def excedeu_limite(request):
+    """
+    Conta a consulta na janela fixa atual do IP e diz se ele passou de
+    VERIFICACAO_LIMITE consultas por VERIFICACAO_JANELA segundos. Só as
+    consultas que chegam ao banco são contadas: os portais que conferem em
+    rajada códigos já consultados não gastam o limite. O contador é exato
+    com Redis; no cache em arquivos o incr é leitura seguida de gravação e
+    rajadas simultâneas podem contar a menos, o que só atrasa o bloqueio.
+    """
+    limite = getattr(settings, 'VERIFICACAO_LIMITE', 300)
+    if not limite:
+        return False
+    janela = getattr(settings, 'VERIFICACAO_JANELA', 60)
+    chave = f'certificados:limite:{ip_do_cliente(request)}:{int(time.time()) // janela}'
+    cache = _cache()
+    # add só grava se a chave não existir: o primeiro acesso da janela abre o contador
+    if cache.add(chave, 1, janela):
+        return False
+    try:
+        return cache.incr(chave) > limite
+    except ValueError:
+        # A janela expirou entre o add e o incr
+        cache.add(chave, 1, janela)
+        return False
@@ -1,6 +1,88 @@
-from django.shortcuts import render, get_object_or_404
+from django.conf import settings
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+from .artefatos import TIPOS, digest_artefato, formatos_disponiveis, obter_artefato, url_artefato, versao_modelo
 from .models import Certificado
+from .verificacao import TIMEOUT_NAO_ENCONTRADO, LimiteExcedido, verificar_codigo
+
+# Artefatos versionados nunca mudam: o navegador e a CDN podem guardá-los por um ano
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+# Por quanto tempo o navegador/CDN guarda a página de verificação de um certificado válido
+MAX_AGE_VERIFICACAO = 60 * 10
+
 
 def visualizar_certificado(request, certificado_id):
     certificado = get_object_or_404(Certificado, id=certificado_id)
-    return render(request, 'certificados/certificado.html', {'certificado': certificado})
+    return redirect(url_artefato(certificado.codigo))
+
+
+def arquivo_certificado(request, codigo, formato):
+    """URL estável do certificado: redireciona para o artefato da versão atual do modelo"""
+    return redirect(url_artefato(codigo, formato))
+
+
+def artefato_certificado(request, codigo, versao, formato):
+    """
+    PDF/PNG do certificado, renderizado uma única vez e servido do disco com
+    FileResponse (usa o sendfile do servidor quando disponível), ETag forte
+    (o SHA-256 do conteúdo) e cache imutável. Versões antigas redirecionam para a atual.
+    """
+    if versao != versao_modelo():
+        return redirect(url_artefato(codigo, formato))
+    if formato not in formatos_disponiveis():
+        raise Http404('Formato indisponível')
+    caminho = obter_artefato(codigo, formato)
+    if caminho is None:
+        raise Http404('Certificado não encontrado')
+
+    etag = f'"{digest_artefato(caminho)[:32]}"'
+    resposta = get_conditional_response(request, etag=etag)
+    if resposta is None:
+        resposta = FileResponse(open(caminho, 'rb'), content_type=TIPOS[formato],
+                                filename=f'certificado-{codigo}.{formato}')
+    resposta['ETag'] = etag
+    resposta['Cache-Control'] = CACHE_IMUTAVEL
+    return resposta
+
+
+def verificar_certificado(request, codigo):
+    """
+    Página pública de verificação (destino do QR Code impresso no
+    certificado), em HTML ou em JSON (?formato=json ou Accept:
+    application/json). A consulta é cacheada inclusive para códigos
+    inexistentes, e cada IP tem um limite de consultas por minuto que
+    chegam ao banco (as respondidas pelo cache não contam).
+    """
+    em_json = request.GET.get('formato') == 'json' or 'application/json' in request.headers.get('Accept', '')
+
+    try:
+        dados = verificar_codigo(codigo, request)
+    except LimiteExcedido:
+        if em_json:
+            resposta = JsonResponse({'erro': 'Muitas consultas. Tente novamente em instantes.'}, status=429)
+        else:
+            resposta = render(request, 'certificados/verificar.html', {'codigo': codigo, 'limite': True}, status=429)
+        resposta['Retry-After'] = getattr(settings, 'VERIFICACAO_JANELA', 60)
+        patch_cache_control(resposta, no_store=True)
+        return resposta
+
+    status = 200 if dados else 404
+    if em_json:
+        resposta = JsonResponse({
+            'codigo': codigo,
+            'valido': dados is not None,
+            **({
+                'aluno': dados['aluno'],
+                'curso': dados['curso'],
+                'escola': dados['escola'],
+                'emitido_em': dados['emitido_em'],
+            } if dados else {}),
+        }, status=status)
+    else:
+        resposta = render(request, 'certificados/verificar.html', {'codigo': codigo, 'certificado': dados},
+                          status=status)
+    patch_cache_control(resposta, public=True, max_age=MAX_AGE_VERIFICACAO if dados else TIMEOUT_NAO_ENCONTRADO)
+    patch_vary_headers(resposta, ['Accept'])
+    return resposta
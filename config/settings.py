@@ -4,6 +4,7 @@ Django settings for config project.
 
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url
 from dotenv import load_dotenv
 
@@ -50,11 +51,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'cursos.middleware.PacotesWhiteNoiseMiddleware',
+    'cursos.middleware.OrcamentoConsultasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'usuarios.middleware.UsuarioEmCacheMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -86,6 +88,99 @@ DATABASES = {
     )
 }
 
+# Cache compartilhado entre os workers (estrutura dos cursos etc.)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cache_compartilhado',
+    }
+}
+
+# Fragmentos das páginas de curso por aluno (ver cursos/fragmentos.py). Com
+# FRAGMENTOS_REDIS_URL usam um Redis próprio; sem ele, o cache padrão
+if os.environ.get('FRAGMENTOS_REDIS_URL'):
+    CACHES['fragmentos'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['FRAGMENTOS_REDIS_URL'],
+    }
+    FRAGMENTOS_CACHE = 'fragmentos'
+else:
+    FRAGMENTOS_CACHE = 'default'
+FRAGMENTOS_TIMEOUT = int(os.environ.get('FRAGMENTOS_TIMEOUT', 60 * 60 * 24))
+
+# Estatísticas do dashboard da escola (cursos/estatisticas.py): recalculadas por
+# um único worker a cada ESTATISTICAS_TIMEOUT segundos, no cache compartilhado
+ESTATISTICAS_CACHE = 'default'
+ESTATISTICAS_TIMEOUT = int(os.environ.get('ESTATISTICAS_TIMEOUT', 60 * 5))
+
+# Mapa de calor dos professores (cursos.mapa_calor): uma matriz aluno × capítulo
+# por curso, atualizada no lugar a cada gravação de Progresso; o timeout só
+# limita quanto um mapa de curso sem acessos fica ocupando o cache
+MAPA_CALOR_CACHE = 'default'
+MAPA_CALOR_TIMEOUT = int(os.environ.get('MAPA_CALOR_TIMEOUT', 60 * 60 * 24))
+
+# Sessões (SESSAO_MODO): 'db' (uma leitura de django_session por requisição),
+# 'cached_db' (cache na frente do banco) ou 'cookies' (assinados, sem estado no
+# servidor). O cache 'sessoes' guarda também o usuário logado (usuarios/sessoes.py)
+# e é compartilhado pelos workers da máquina em arquivos locais; com mais de um
+# servidor, use SESSOES_REDIS_URL para que logout e troca de senha valham em todos
+SESSAO_MODO = os.environ.get('SESSAO_MODO', 'cached_db')
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSAO_MODO]
+# Cada usuário logado ocupa duas entradas (sessão e usuário); o padrão do
+# Django (300) começa a apagar sessões válidas com uns 150 alunos logados
+SESSOES_MAX_ENTRADAS = int(os.environ.get('SESSOES_MAX_ENTRADAS', 50000))
+if os.environ.get('SESSOES_REDIS_URL'):
+    CACHES['sessoes'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['SESSOES_REDIS_URL'],
+    }
+else:
+    CACHES['sessoes'] = {
+        # FileBasedCache sem a varredura do diretório a cada gravação (ver usuarios/cache.py)
+        'BACKEND': 'usuarios.cache.CacheArquivos',
+        'LOCATION': os.environ.get('SESSOES_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'interasoft-sessoes')),
+        'OPTIONS': {'MAX_ENTRIES': SESSOES_MAX_ENTRADAS},
+    }
+SESSION_CACHE_ALIAS = 'sessoes'
+USUARIOS_CACHE = 'sessoes'
+
+# Verificação pública de certificados (certificados/verificacao.py): consultas
+# e contadores do limite por IP ficam num cache próprio, fora do banco e longe
+# das sessões (quem varre códigos aleatórios não pode expulsar os alunos
+# logados): um Redis com VERIFICACAO_REDIS_URL, onde o contador é atômico, ou
+# arquivos locais. VERIFICACAO_LIMITE conta só as consultas que não estavam em
+# cache, por IP e janela. VERIFICACAO_PROXIES é quantos proxies confiáveis
+# acrescentam o IP do cliente ao X-Forwarded-For (1 no Render)
+if os.environ.get('VERIFICACAO_REDIS_URL'):
+    CACHES['verificacao'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['VERIFICACAO_REDIS_URL'],
+    }
+else:
+    CACHES['verificacao'] = {
+        'BACKEND': 'usuarios.cache.CacheArquivos',
+        'LOCATION': os.environ.get(
+            'VERIFICACAO_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'interasoft-verificacao')
+        ),
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('VERIFICACAO_MAX_ENTRADAS', 50000))},
+    }
+VERIFICACAO_CACHE = 'verificacao'
+VERIFICACAO_LIMITE = int(os.environ.get('VERIFICACAO_LIMITE', 300))
+VERIFICACAO_JANELA = int(os.environ.get('VERIFICACAO_JANELA', 60))
+VERIFICACAO_PROXIES = int(os.environ.get('VERIFICACAO_PROXIES', 1))
+
+# Modo assíncrono das notas: os endpoints só enfileiram (NotaPendente) e o
+# worker `python manage.py processar_notas` aplica em lotes
+NOTAS_ASSINCRONAS = os.environ.get('NOTAS_ASSINCRONAS', '').lower() in ('1', 'true', 'sim')
+
+# Processos para os hashes de senha na importação de alunos (padrão: núcleos da máquina)
+IMPORTACAO_PROCESSOS = int(os.environ['IMPORTACAO_PROCESSOS']) if os.environ.get('IMPORTACAO_PROCESSOS') else None
+# Linhas por upload na página da escola (os hashes rodam na requisição); mais que isso, só pelo comando
+IMPORTACAO_MAX_LINHAS_UPLOAD = int(os.environ.get('IMPORTACAO_MAX_LINHAS_UPLOAD', 40))
 
 AUTH_USER_MODEL = 'usuarios.Usuario'
 
@@ -117,6 +212,18 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Pacotes Captivate publicados com URLs versionadas por hash (python manage.py publicar_pacotes).
+# A publicação só é incremental se esta pasta (versões e indice.json) sobreviver entre os builds:
+# dentro do checkout ela some a cada clone novo e tudo é copiado e comprimido de novo
+PACOTES_URL = '/pacotes/'
+PACOTES_ROOT = Path(os.environ.get('PACOTES_ROOT', BASE_DIR / 'pacotes_publicados'))
+
+# PDFs dos certificados emitidos (certificados/artefatos.py)
+CERTIFICADOS_ROOT = os.environ.get('CERTIFICADOS_ROOT', BASE_DIR / 'certificados_gerados')
+# Endereço público do site, usado no QR Code de verificação impresso nos
+# certificados (ex.: https://cursos.exemplo.com.br); sem ele, sai sem QR Code
+SITE_URL = os.environ.get('SITE_URL', '')
+
 # Default primary key
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -126,6 +233,9 @@ LOGIN_REDIRECT_URL = 'cursos:meus_cursos'
 LOGOUT_REDIRECT_URL = 'login'
 
 # Logging
+# Fração das requisições com consultas medidas (quantidade, tempo, N+1) no log consultas.log
+CONSULTAS_AMOSTRAGEM = float(os.environ.get('CONSULTAS_AMOSTRAGEM', '0.01'))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -133,6 +243,20 @@ LOGGING = {
         'console': {
             'class': 'logging.StreamHandler',
         },
+        'consultas': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.environ.get('CONSULTAS_LOG', BASE_DIR / 'consultas.log'),
+            'maxBytes': 5 * 1024 * 1024,
+            'backupCount': 5,
+            'encoding': 'utf-8',
+        },
+    },
+    'loggers': {
+        'cursos.consultas': {
+            'handlers': ['consultas'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
     'root': {
         'handlers': ['console'],
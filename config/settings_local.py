@@ -7,4 +7,26 @@ ALLOWED_HOSTS = ['*']
 # Desativa segurança HTTPS para desenvolvimento
 SECURE_SSL_REDIRECT = False
 SESSION_COOKIE_SECURE = False
-CSRF_COOKIE_SECURE = False
\ No newline at end of file
+CSRF_COOKIE_SECURE = False
+
+# Cache em memória para desenvolvimento
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sessoes': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessoes',
+    },
+    'verificacao': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'verificacao',
+    },
+}
+
+# Mede as consultas de todas as requisições em desenvolvimento
+CONSULTAS_AMOSTRAGEM = 1.0
+
+# QR Code dos certificados apontando para o servidor de desenvolvimento
+SITE_URL = 'http://localhost:8000'
+VERIFICACAO_PROXIES = 0
@@ -1,15 +1,16 @@
 from django.contrib import admin
-from .models import Curso, Capitulo, Progresso
+from .models import Curso, Capitulo, Progresso, ResumoProgresso, NotaPendente
 from django import forms
 from django.core.exceptions import ValidationError
 from usuarios.models import Usuario
 from django.db import IntegrityError
 from django.db import transaction
-from django.db.models import Max
-import os
-from django.conf import settings
+from django.db.models import Count, Max
 from django.contrib import messages
-from pathlib import Path
+from certificados.emissao import emitir_certificados
+from .estrutura import invalidar_estrutura
+from .importacao import importar_pacotes
+from .progresso import atualizar_resumo
 
 class CursoAdminForm(forms.ModelForm):
     class Meta:
@@ -39,12 +40,20 @@ class CursoAdmin(admin.ModelAdmin):
     search_fields = ('nome', 'descricao')
     filter_horizontal = ('professores', 'alunos')
     actions = ['importar_capitulos_automaticamente',
-               'disponibilizar_para_todas_escolas']  # Todas ações em uma única lista
+               'disponibilizar_para_todas_escolas',
+               'emitir_certificados_concluintes']  # Todas ações em uma única lista
+
+    def get_queryset(self, request):
+        # Contagem e escolas de todos os cursos da página em duas consultas, não duas por linha
+        return super().get_queryset(request).annotate(
+            total_alunos=Count('alunos', distinct=True)
+        ).prefetch_related('escolas')
 
     def contagem_alunos(self, obj):
-        return obj.alunos.count()
+        return obj.total_alunos
 
     contagem_alunos.short_description = 'Alunos'
+    contagem_alunos.admin_order_field = 'total_alunos'
 
     def listar_escolas(self, obj):
         return ", ".join([e.username for e in obj.escolas.all()])
@@ -54,73 +63,29 @@ class CursoAdmin(admin.ModelAdmin):
 
     @admin.action(description="Importar capítulos automaticamente da pasta static")
     def importar_capitulos_automaticamente(self, request, queryset):
-        for curso in queryset:
-            try:
-                # Caminho base no diretório static
-                curso_path = curso.nome.replace(' ', '_')
-                base_path = Path(settings.BASE_DIR) / 'static' / 'cursos' / 'captivate_packages' / curso_path
-
-                if not base_path.exists():
-                    self.message_user(request, f"Pasta não encontrada para o curso {curso.nome} em {base_path}",
-                                      level=messages.ERROR)
-                    continue
-
-                created_count = 0
-                updated_count = 0
-
-                # Processa tanto capítulos quanto exercícios
-                for dir_name in os.listdir(base_path):
-                    dir_path = base_path / dir_name
-                    if not dir_path.is_dir() or not dir_name.startswith('cap'):
-                        continue
-
-                    try:
-                        # Determina se é exercício
-                        is_exercicio = '_ex' in dir_name.lower()
-
-                        # Extrai o número do capítulo (cap01 -> 1, cap02_ex -> 2)
-                        cap_num = ''.join(filter(str.isdigit, dir_name.split('_')[0][3:]))
-                        if not cap_num:
-                            continue
-
-                        ordem = float(cap_num)
-                        if is_exercicio:
-                            ordem += 0.5  # Exercícios ficam com ordem X.5
-
-                        # Monta a URL correta
-                        url = f"cursos/captivate_packages/{curso_path}/{dir_name}/index.html"
-
-                        # Título amigável
-                        tipo = 'exercicio' if is_exercicio else 'aula'
-                        titulo = f"Capítulo {int(ordem) if not is_exercicio else int(ordem)} ({'Exercício' if is_exercicio else 'Aula'})"
-
-                        # Cria/atualiza o capítulo
-                        capitulo, created = Capitulo.objects.update_or_create(
-                            curso=curso,
-                            ordem=ordem,
-                            tipo=tipo,
-                            defaults={
-                                'titulo': titulo,
-                                'url': url,
-                                'codigo': dir_name
-                            }
-                        )
-
-                        if created:
-                            created_count += 1
-                        else:
-                            updated_count += 1
-
-                    except Exception as e:
-                        self.message_user(request, f"Erro ao processar {dir_name}: {str(e)}", level=messages.WARNING)
-                        continue
-
+        # Mesma rotina do comando import_packages: lê as pastas em paralelo e grava em lote.
+        # Nunca remove capítulos (apagaria o progresso dos alunos): isso só com import_packages --remover
+        for diff in importar_pacotes(queryset):
+            for erro in diff.erros:
+                self.message_user(request, f"{diff.curso.nome}: {erro}", level=messages.WARNING)
+            if diff.remover:
                 self.message_user(request,
-                                  f"Curso {curso.nome}: {created_count} capítulos criados, {updated_count} atualizados",
-                                  level=messages.SUCCESS)
-
-            except Exception as e:
-                self.message_user(request, f"Erro ao processar curso {curso.nome}: {str(e)}", level=messages.ERROR)
+                                  f"{diff.curso.nome}: {len(diff.remover)} capítulo(s) sem pasta mantido(s); "
+                                  f"para removê-los use o comando import_packages --remover",
+                                  level=messages.WARNING)
+            self.message_user(request,
+                              f"Curso {diff.curso.nome}: {len(diff.criar)} capítulos criados, "
+                              f"{len(diff.atualizar)} atualizados",
+                              level=messages.SUCCESS)
+
+    @admin.action(description="Emitir certificados de quem concluiu")
+    def emitir_certificados_concluintes(self, request, queryset):
+        # Mesma rotina do comando emitir_certificados: uma consulta de elegíveis e bulk_create
+        resultado = emitir_certificados(cursos_ids=queryset.values_list('id', flat=True))
+        self.message_user(request,
+                          f"{len(resultado.emitidos)} certificado(s) emitido(s), "
+                          f"{resultado.renderizados} PDF(s) gerado(s)",
+                          level=messages.SUCCESS)
 
     @admin.action(description="▶ Disponibilizar curso para TODAS as escolas")
     def disponibilizar_para_todas_escolas(self, request, queryset):
@@ -269,6 +234,8 @@ class CapituloAdmin(admin.ModelAdmin):
 
         # Salva todos de uma vez
         Capitulo.objects.bulk_update(nova_lista, ['ordem'])
+        # bulk_update não dispara sinais
+        invalidar_estrutura(obj.curso_id)
 
     @admin.action(description="Reordenar capítulos automaticamente")
     def reordenar_capitulos(self, request, queryset):
@@ -301,10 +268,11 @@ class CapituloAdmin(admin.ModelAdmin):
 @admin.register(Progresso)
 class ProgressoAdmin(admin.ModelAdmin):
     list_display = ('aluno', 'get_curso', 'capitulo', 'nota', 'concluido', 'atualizado_em')
+    # Pelo capítulo: registros gravados pela versão anterior podem estar com o curso desnormalizado nulo
     list_filter = ('capitulo__curso', 'aluno', 'concluido')
     search_fields = ('aluno__username', 'capitulo__titulo')
     readonly_fields = ('atualizado_em',)
-    list_select_related = ('aluno', 'capitulo', 'capitulo__curso')
+    list_select_related = ('aluno', 'capitulo__curso')
 
     def get_curso(self, obj):
         return obj.capitulo.curso.nome
@@ -313,4 +281,34 @@ class ProgressoAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related(
             'capitulo__curso', 'aluno'
-        )
\ No newline at end of file
+        )
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            atualizar_resumo(obj.aluno_id, obj.capitulo.curso_id)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            super().delete_model(request, obj)
+            atualizar_resumo(obj.aluno_id, obj.capitulo.curso_id)
+
+
+@admin.register(ResumoProgresso)
+class ResumoProgressoAdmin(admin.ModelAdmin):
+    list_display = ('aluno', 'curso', 'percentual', 'aulas_concluidas', 'exercicios_aprovados',
+                    'melhor_nota', 'media_notas', 'ultima_atividade')
+    list_filter = ('curso',)
+    search_fields = ('aluno__username', 'curso__nome')
+    list_select_related = ('aluno', 'curso')
+    readonly_fields = ('aluno', 'curso', 'aulas_concluidas', 'exercicios_aprovados', 'percentual',
+                       'melhor_nota', 'media_notas', 'ultima_atividade')
+
+
+@admin.register(NotaPendente)
+class NotaPendenteAdmin(admin.ModelAdmin):
+    list_display = ('aluno', 'capitulo', 'nota', 'recebida_em', 'processada_em', 'erro')
+    list_filter = ('processada_em',)
+    search_fields = ('aluno__username',)
+    list_select_related = ('aluno', 'capitulo')
+    readonly_fields = ('aluno', 'capitulo', 'nota', 'recebida_em', 'processada_em', 'erro')
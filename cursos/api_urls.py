@@ -1,9 +1,16 @@
 from django.urls import path
 from . import api_views
-from cursos.views import boletim_notas_api
+from cursos.views import boletim_notas_api, boletim_notas_api_v2
 
 urlpatterns = [
     path('nota/', api_views.registrar_nota, name='registrar_nota'),
+    path('notas/lote/', api_views.registrar_notas_lote, name='registrar_notas_lote'),
+    path('notas/fila/', api_views.situacao_fila_notas, name='situacao_fila_notas'),
+    path('matriculas/lote/', api_views.matricular_alunos_lote, name='matricular_alunos_lote'),
+    path('professor/cursos/<int:curso_id>/mapa-calor/', api_views.mapa_calor_curso, name='mapa_calor_curso'),
+    path('escola/estatisticas/', api_views.estatisticas_da_escola, name='estatisticas_da_escola'),
+    path('fragmentos/estatisticas/', api_views.estatisticas_cache_fragmentos, name='estatisticas_cache_fragmentos'),
     path('concluir_capitulo/', api_views.concluir_capitulo, name='api_concluir_capitulo'),
     path('boletim/', boletim_notas_api, name='boletim_notas_api'),
+    path('v2/boletim/', boletim_notas_api_v2, name='boletim_notas_api_v2'),
 ]
@@ -1,7 +1,16 @@
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.db import transaction
 import json
-from .models import Progresso, Capitulo
+from decimal import Decimal, InvalidOperation
+from .models import Progresso, Capitulo, Curso
+from .estatisticas import estatisticas_escola
+from .fila import enfileirar_notas, modo_assincrono, situacao_fila
+from .fragmentos import estatisticas_fragmentos
+from .mapa_calor import obter_mapa, professor_do_curso
+from .matriculas import MAX_MATRICULAS_POR_LOTE, esta_matriculado, matricular_em_lote
+from .progresso import aplicar_notas, atualizar_resumo
 from usuarios.models import Usuario
 from django.core.exceptions import PermissionDenied
 from django.urls import reverse
@@ -10,6 +19,7 @@ from django.urls import reverse
 NOTA_MINIMA = 0
 NOTA_MAXIMA = 10
 NOTA_APROVACAO = 8
+MAX_NOTAS_POR_LOTE = 1000
 
 
 @csrf_exempt
@@ -34,24 +44,45 @@ def registrar_nota(request):
                     'message': f'Nota deve estar entre {NOTA_MINIMA} e {NOTA_MAXIMA}'
                 }, status=400)
 
-            aluno = Usuario.objects.get(id=user_id)
             capitulo = Capitulo.objects.select_related('curso').get(id=capitulo_id)
+            is_exercicio = capitulo.tipo == 'exercicio'
+            aprovado = is_exercicio and nota >= NOTA_APROVACAO
+            estrutura = capitulo.curso.get_estrutura()
 
-            # Verifica matrícula
-            if aluno not in capitulo.curso.alunos.all():
-                raise PermissionDenied("Aluno não matriculado neste curso")
+            if modo_assincrono():
+                # Aceita a nota e deixa a gravação para o worker (processar_notas);
+                # a matrícula é verificada quando a nota for aplicada
+                if not Usuario.objects.filter(id=user_id).exists():
+                    raise Usuario.DoesNotExist
+                enfileirar_notas([(int(user_id), capitulo.id, Decimal(str(nota)))])
+            else:
+                aluno = Usuario.objects.get(id=user_id)
 
-            is_exercicio = capitulo.tipo == 'exercicio'
+                # Verifica matrícula
+                if not esta_matriculado(aluno.id, capitulo.curso_id):
+                    raise PermissionDenied("Aluno não matriculado neste curso")
 
-            # Atualiza progresso
-            progresso, created = Progresso.objects.update_or_create(
-                aluno=aluno,
-                capitulo=capitulo,
-                defaults={
-                    'nota': nota,
-                    'concluido': is_exercicio and nota >= NOTA_APROVACAO
-                }
-            )
+                with transaction.atomic():
+                    # Atualiza progresso
+                    progresso, created = Progresso.objects.update_or_create(
+                        aluno=aluno,
+                        capitulo=capitulo,
+                        defaults={
+                            'nota': nota,
+                            'concluido': aprovado
+                        }
+                    )
+
+                    # Exercício aprovado conclui a aula relacionada
+                    aula_relacionada = estrutura.aula_do_exercicio(capitulo.id) if aprovado else None
+                    if aula_relacionada:
+                        Progresso.objects.update_or_create(
+                            aluno=aluno,
+                            capitulo_id=aula_relacionada.id,
+                            defaults={'concluido': True}
+                        )
+
+                    atualizar_resumo(aluno.id, capitulo.curso_id)
 
             response_data = {
                 'status': 'success',
@@ -64,22 +95,11 @@ def registrar_nota(request):
             }
 
             # Lógica de redirecionamento aprimorada
-            if is_exercicio and nota >= NOTA_APROVACAO:
-                aula_relacionada = capitulo.get_aula_relacionada()
-
-                if aula_relacionada:
-                    Progresso.objects.update_or_create(
-                        aluno=aluno,
-                        capitulo=aula_relacionada,
-                        defaults={'concluido': True}
-                    )
-
+            if aprovado:
                 # Encontra próxima aula liberada
-                proxima_aula = Capitulo.objects.filter(
-                    curso=capitulo.curso,
-                    ordem__gt=capitulo.ordem,
-                    tipo='aula'
-                ).order_by('ordem').first()
+                item = estrutura.item(capitulo.id)
+                proxima = estrutura.proxima(item.aula.id) if item else None
+                proxima_aula = proxima.aula if proxima else None
 
                 response_data = {
                     'status': 'success',
@@ -102,7 +122,10 @@ def registrar_nota(request):
                         args=[capitulo.curso.id]
                     )
 
-                return JsonResponse(response_data)
+            if modo_assincrono():
+                response_data['data']['enfileirada'] = True
+
+            return JsonResponse(response_data)
 
         except Usuario.DoesNotExist:
             return JsonResponse({
@@ -130,6 +153,248 @@ def registrar_nota(request):
         'message': 'Método não permitido'
     }, status=405)
 
+def _validar_item_lote(item, usuario):
+    """Retorna (aluno_id, capitulo_id, nota) ou levanta ValueError/PermissionDenied"""
+    if not isinstance(item, dict):
+        raise ValueError('Item inválido')
+    try:
+        aluno_id = int(item['user_id'])
+        capitulo_id = int(item['capitulo_id'])
+        nota = Decimal(str(item['nota'])).quantize(Decimal('0.01'))
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        raise ValueError('Dados incompletos')
+
+    if not NOTA_MINIMA <= nota <= NOTA_MAXIMA:
+        raise ValueError(f'Nota deve estar entre {NOTA_MINIMA} e {NOTA_MAXIMA}')
+
+    # Alunos só podem reenviar as próprias notas; integrações usam usuários da equipe
+    if not usuario.is_staff and aluno_id != usuario.id:
+        raise PermissionDenied('Sem permissão para registrar notas de outro aluno')
+
+    return aluno_id, capitulo_id, nota
+
+
+def _enfileirar_lote(itens):
+    """Põe na fila os itens cujos aluno e capítulo existem (duas consultas e um INSERT)"""
+    capitulos = set(Capitulo.objects.filter(
+        id__in={capitulo_id for _, capitulo_id, _ in itens}
+    ).values_list('id', flat=True))
+    alunos = set(Usuario.objects.filter(
+        id__in={aluno_id for aluno_id, _, _ in itens}
+    ).values_list('id', flat=True))
+
+    aceitos = []
+    resultados = []
+    for aluno_id, capitulo_id, nota in itens:
+        if capitulo_id not in capitulos:
+            resultados.append({'status': 'error', 'message': 'Capítulo não encontrado'})
+        elif aluno_id not in alunos:
+            resultados.append({'status': 'error', 'message': 'Usuário não encontrado'})
+        else:
+            aceitos.append((aluno_id, capitulo_id, nota))
+            resultados.append({'status': 'success', 'enfileirada': True})
+    enfileirar_notas(aceitos)
+    return resultados
+
+
+def registrar_notas_lote(request):
+    """
+    Recebe {"notas": [{"user_id", "capitulo_id", "nota"}, ...]} e grava todas
+    de uma vez, devolvendo um resultado por item na mesma ordem. A
+    autenticação é a da sessão, então o POST precisa do cabeçalho
+    X-CSRFToken, como em matricular_alunos_lote.
+    """
+    if request.method != 'POST':
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Método não permitido'
+        }, status=405)
+
+    if not request.user.is_authenticated:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Autenticação necessária'
+        }, status=401)
+
+    try:
+        notas = json.loads(request.body).get('notas')
+    except (ValueError, AttributeError):
+        notas = None
+
+    if not isinstance(notas, list) or not notas:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Envie uma lista "notas" não vazia'
+        }, status=400)
+
+    if len(notas) > MAX_NOTAS_POR_LOTE:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Máximo de {MAX_NOTAS_POR_LOTE} notas por lote'
+        }, status=400)
+
+    resultados = [None] * len(notas)
+    validos = []
+    posicoes = []
+    for indice, item in enumerate(notas):
+        try:
+            validos.append(_validar_item_lote(item, request.user))
+            posicoes.append(indice)
+        except (ValueError, PermissionDenied) as e:
+            resultados[indice] = {'status': 'error', 'message': str(e)}
+
+    try:
+        if modo_assincrono():
+            aplicados = _enfileirar_lote(validos)
+        else:
+            aplicados = aplicar_notas(validos) if validos else []
+    except Exception as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Erro interno: {str(e)}'
+        }, status=500)
+
+    for indice, resultado in zip(posicoes, aplicados):
+        resultados[indice] = resultado
+    for indice, resultado in enumerate(resultados):
+        resultado['indice'] = indice
+
+    gravados = sum(1 for resultado in resultados if resultado['status'] == 'success')
+    return JsonResponse({
+        'status': 'success',
+        'total': len(resultados),
+        'gravados': gravados,
+        'erros': len(resultados) - gravados,
+        'resultados': resultados,
+    })
+
+
+def matricular_alunos_lote(request):
+    """
+    Recebe {"curso_id": ..., "alunos": [username, e-mail ou CPF, ...]} e
+    matricula todos de uma vez. Escolas só matriculam os próprios alunos em
+    cursos oferecidos a elas; a equipe pode matricular qualquer aluno. A
+    autenticação é a da sessão, então o POST precisa do cabeçalho
+    X-CSRFToken, como as chamadas de assistir_aula.html.
+    """
+    if request.method != 'POST':
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Método não permitido'
+        }, status=405)
+
+    usuario = request.user
+    if not usuario.is_authenticated or not (usuario.is_staff or usuario.tipo == 'escola'):
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Acesso restrito a escolas'
+        }, status=403)
+
+    try:
+        dados = json.loads(request.body)
+        curso_id = int(dados['curso_id'])
+        alunos = dados['alunos']
+    except (ValueError, TypeError, KeyError):
+        alunos = None
+    if not isinstance(alunos, list) or not alunos or not all(isinstance(aluno, str) for aluno in alunos):
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Envie "curso_id" e uma lista "alunos" não vazia de identificadores'
+        }, status=400)
+
+    if len(alunos) > MAX_MATRICULAS_POR_LOTE:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Máximo de {MAX_MATRICULAS_POR_LOTE} alunos por lote'
+        }, status=400)
+
+    cursos = Curso.objects.all() if usuario.is_staff else Curso.objects.filter(escolas=usuario)
+    curso = cursos.filter(id=curso_id).first()
+    if curso is None:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Curso não encontrado'
+        }, status=404)
+
+    resultado = matricular_em_lote(curso, alunos, escola=None if usuario.is_staff else usuario)
+    return JsonResponse({
+        'status': 'success',
+        'adicionados': resultado.adicionados,
+        'ja_matriculados': resultado.ja_matriculados,
+        'desconhecidos': resultado.desconhecidos,
+    })
+
+
+def situacao_fila_notas(request):
+    """Profundidade da fila de notas pendentes (apenas equipe)"""
+    if not request.user.is_authenticated or not request.user.is_staff:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Acesso restrito à equipe'
+        }, status=403)
+
+    situacao = situacao_fila()
+    return JsonResponse({
+        'status': 'success',
+        'modo_assincrono': modo_assincrono(),
+        'pendentes': situacao['pendentes'],
+        'com_erro': situacao['com_erro'],
+        'mais_antiga': situacao['mais_antiga'],
+    })
+
+
+def estatisticas_cache_fragmentos(request):
+    """Acertos e faltas do cache de fragmentos no processo que atendeu (apenas equipe)"""
+    if not request.user.is_authenticated or not request.user.is_staff:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Acesso restrito à equipe'
+        }, status=403)
+
+    return JsonResponse({'status': 'success', **estatisticas_fragmentos()})
+
+
+def estatisticas_da_escola(request):
+    """Estatísticas por curso da escola logada, as mesmas do dashboard (em cache)"""
+    if not request.user.is_authenticated or request.user.tipo != 'escola':
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Acesso restrito a escolas'
+        }, status=403)
+
+    return JsonResponse({'status': 'success', **estatisticas_escola(request.user)})
+
+
+def mapa_calor_curso(request, curso_id):
+    """
+    Mapa de calor aluno × capítulo do curso (professores do curso e equipe),
+    em JSON comprimido com gzip. O ETag muda a cada gravação de Progresso,
+    então a página pode consultar de novo e receber 304 se nada mudou.
+    """
+    if not request.user.is_authenticated or not professor_do_curso(request.user, curso_id):
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Acesso restrito aos professores do curso'
+        }, status=403)
+    try:
+        mapa = obter_mapa(curso_id)
+    except Curso.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Curso não encontrado'}, status=404)
+
+    etag = f'"mapa-{curso_id}-{mapa.versao}-{mapa.versao_estrutura}"'
+    resposta = get_conditional_response(request, etag=etag)
+    if resposta is None:
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            resposta = HttpResponse(mapa.json_comprimido(), content_type='application/json')
+            resposta['Content-Encoding'] = 'gzip'
+        else:
+            resposta = JsonResponse(mapa.como_dict())
+    resposta['ETag'] = etag
+    patch_cache_control(resposta, private=True, no_cache=True)
+    patch_vary_headers(resposta, ['Accept-Encoding'])
+    return resposta
+
+
 @csrf_exempt
 def concluir_capitulo(request):
     if request.method == "POST":
@@ -148,7 +413,7 @@ def concluir_capitulo(request):
             capitulo = Capitulo.objects.select_related('curso').get(id=capitulo_id)
 
             # Verifica se o usuário está matriculado
-            if usuario not in capitulo.curso.alunos.all():
+            if not esta_matriculado(usuario.id, capitulo.curso_id):
                 raise PermissionDenied("Usuário não matriculado neste curso")
 
             # Não permite marcar exercícios como concluídos diretamente
@@ -158,11 +423,13 @@ def concluir_capitulo(request):
                     'message': 'Exercícios devem ser aprovados via registro de nota'
                 }, status=400)
 
-            progresso, created = Progresso.objects.update_or_create(
-                aluno=usuario,
-                capitulo=capitulo,
-                defaults={'concluido': True}
-            )
+            with transaction.atomic():
+                progresso, created = Progresso.objects.update_or_create(
+                    aluno=usuario,
+                    capitulo=capitulo,
+                    defaults={'concluido': True}
+                )
+                atualizar_resumo(usuario.id, capitulo.curso_id)
 
             return JsonResponse({
                 'status': 'success',
@@ -0,0 +1,300 @@
+import contextlib
+import io
+import json
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from usuarios.models import Usuario
+
+from .consultas import MonitorConsultas
+from .models import Capitulo, Curso, Progresso
+from .progresso import reconstruir_resumos
+
+# Dados usados pelos cenários: o aluno medido está matriculado em todos os cursos
+DadosBenchmark = namedtuple('DadosBenchmark', ['escola', 'aluno', 'cursos', 'aula', 'exercicio'])
+
+# Uma requisição a medir: usuário logado, método, URL e argumentos extras do Client
+Requisicao = namedtuple('Requisicao', ['usuario', 'metodo', 'url', 'kwargs'])
+
+# Tolerância padrão antes de apontar regressão de latência ou memória (20%)
+TOLERANCIA = 0.2
+# Diferenças de latência menores que isso são ruído, não regressão
+DIFERENCA_MINIMA_MS = 1.0
+
+
+@contextlib.contextmanager
+def banco_de_teste(keepdb=False):
+    """
+    Ambiente e banco de teste para os comandos de benchmark, que nunca medem
+    no banco configurado: cria o banco (ou reaproveita, com keepdb) e o
+    remove na saída, mesmo se a medição falhar
+    """
+    setup_test_environment(debug=False)
+    nome_original = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(nome_original, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+def popular_banco(alunos=200, cursos=5, aulas=10, prefixo='bench'):
+    """
+    Cria uma escola com `alunos` alunos matriculados em `cursos` cursos de
+    `aulas` aulas (cada uma com exercício), com progresso em metade do curso.
+    Tudo em bulk_create; os usuários ficam sem senha (o benchmark usa force_login).
+    """
+    escola = Usuario.objects.create(username=f'{prefixo}_escola', tipo='escola', password='!')
+    Usuario.objects.bulk_create(
+        Usuario(username=f'{prefixo}_aluno_{i}', tipo='aluno', escola=escola, password='!')
+        for i in range(alunos)
+    )
+    # bulk_create só devolve os ids no PostgreSQL; relê para funcionar também no SQLite
+    alunos_ids = list(
+        Usuario.objects.filter(username__startswith=f'{prefixo}_aluno_').order_by('id').values_list('id', flat=True)
+    )
+
+    Curso.objects.bulk_create(Curso(nome=f'{prefixo} {i + 1}', descricao='Benchmark') for i in range(cursos))
+    lista_cursos = list(Curso.objects.filter(nome__startswith=f'{prefixo} ').order_by('id'))
+    Curso.escolas.through.objects.bulk_create(
+        Curso.escolas.through(curso_id=curso.id, usuario_id=escola.id) for curso in lista_cursos
+    )
+    Curso.alunos.through.objects.bulk_create(
+        Curso.alunos.through(curso_id=curso.id, usuario_id=aluno_id)
+        for curso in lista_cursos
+        for aluno_id in alunos_ids
+    )
+
+    Capitulo.objects.bulk_create(
+        Capitulo(curso=curso, ordem=Decimal(ordem) + extra, tipo=tipo, titulo=f'Capítulo {ordem}', url='a')
+        for curso in lista_cursos
+        for ordem in range(1, aulas + 1)
+        for tipo, extra in ((Capitulo.TIPO_AULA, 0), (Capitulo.TIPO_EXERCICIO, Decimal('0.5')))
+    )
+    feitos = Capitulo.objects.filter(curso__in=lista_cursos, ordem__lt=aulas // 2 + 1)
+    Progresso.objects.bulk_create(
+        (
+            Progresso(aluno_id=aluno_id, capitulo=capitulo, curso_id=capitulo.curso_id, concluido=True,
+                      nota=Decimal('9') if capitulo.tipo == Capitulo.TIPO_EXERCICIO else None)
+            for capitulo in feitos
+            for aluno_id in alunos_ids
+        ),
+        batch_size=2000
+    )
+    reconstruir_resumos([curso.id for curso in lista_cursos])
+
+    primeiro = lista_cursos[0]
+    return DadosBenchmark(
+        escola=escola,
+        aluno=Usuario.objects.get(id=alunos_ids[0]),
+        cursos=lista_cursos,
+        aula=Capitulo.objects.get(curso=primeiro, ordem=1, tipo=Capitulo.TIPO_AULA),
+        exercicio=Capitulo.objects.get(curso=primeiro, ordem=Decimal('1.5'), tipo=Capitulo.TIPO_EXERCICIO),
+    )
+
+
+CENARIOS = {
+    'meus_cursos': lambda d: Requisicao(d.aluno, 'get', reverse('cursos:meus_cursos'), {}),
+    'detalhes_curso': lambda d: Requisicao(
+        d.aluno, 'get', reverse('cursos:detalhes_curso', args=[d.cursos[0].id]), {}
+    ),
+    'assistir_aula': lambda d: Requisicao(d.aluno, 'get', reverse('cursos:assistir_aula', args=[d.aula.id]), {}),
+    'registrar_nota': lambda d: Requisicao(d.aluno, 'post', reverse('registrar_nota'), {
+        'data': json.dumps({'user_id': d.aluno.id, 'capitulo_id': d.exercicio.id, 'nota': 9}),
+        'content_type': 'application/json',
+    }),
+    'boletim_notas': lambda d: Requisicao(d.aluno, 'get', reverse('cursos:boletim_notas'), {}),
+    'dashboard_escola': lambda d: Requisicao(d.escola, 'get', reverse('usuarios:dashboard_escola'), {}),
+}
+
+
+def percentil(ordenados, p):
+    """Percentil p (0-100) por interpolação linear de uma lista já ordenada"""
+    if len(ordenados) == 1:
+        return ordenados[0]
+    posicao = (len(ordenados) - 1) * p / 100
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicao - inferior)
+
+
+def medir_cenario(requisicao, iteracoes=50, aquecimento=5, iteracoes_memoria=5):
+    """
+    Mede uma view: latência (p50/p95/p99) em `iteracoes` requisições depois
+    do aquecimento, consultas por requisição e pico de memória alocada
+    (tracemalloc, numa passada separada para não distorcer a latência).
+    """
+    client = Client()
+    client.force_login(requisicao.usuario)
+    enviar = getattr(client, requisicao.metodo)
+
+    def executar():
+        response = enviar(requisicao.url, **requisicao.kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{requisicao.url} respondeu {response.status_code}')
+        return response
+
+    for _ in range(aquecimento):
+        executar()
+
+    tempos = []
+    consultas = []
+    for _ in range(iteracoes):
+        with MonitorConsultas() as monitor:
+            inicio = time.perf_counter()
+            executar()
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        consultas.append(monitor.total)
+
+    picos = []
+    tracemalloc.start()
+    try:
+        for _ in range(iteracoes_memoria):
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            executar()
+            picos.append(tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+
+    tempos.sort()
+    return {
+        'p50_ms': round(percentil(tempos, 50), 3),
+        'p95_ms': round(percentil(tempos, 95), 3),
+        'p99_ms': round(percentil(tempos, 99), 3),
+        'consultas': max(consultas),
+        'memoria_kb': round(statistics.median(picos) / 1024, 1) if picos else None,
+    }
+
+
+def executar_benchmark(dados, cenarios=None, iteracoes=50, aquecimento=5):
+    """Mede os cenários pedidos (padrão: todos) e retorna {'meta': ..., 'views': {nome: métricas}}"""
+    resultados = {}
+    # O log amostrado de consultas e os prints de debug das views não entram na medição
+    with override_settings(CONSULTAS_AMOSTRAGEM=0), contextlib.redirect_stdout(io.StringIO()):
+        for nome in cenarios or CENARIOS:
+            resultados[nome] = medir_cenario(CENARIOS[nome](dados), iteracoes, aquecimento)
+    return {
+        'meta': {
+            'banco': connection.vendor,
+            'iteracoes': iteracoes,
+            'alunos': Usuario.objects.filter(escola=dados.escola, tipo='aluno').count(),
+            'cursos': len(dados.cursos),
+        },
+        'views': resultados,
+    }
+
+
+def comparar(resultado, baseline, tolerancia=TOLERANCIA):
+    """
+    Compara com um resultado anterior e retorna as regressões como
+    [(view, métrica, antes, agora)]: mais consultas, ou p95/p99/memória
+    acima da tolerância.
+    """
+    regressoes = []
+    for nome, atual in resultado['views'].items():
+        anterior = baseline.get('views', {}).get(nome)
+        if not anterior:
+            continue
+        if atual['consultas'] > anterior['consultas']:
+            regressoes.append((nome, 'consultas', anterior['consultas'], atual['consultas']))
+        for metrica in ('p95_ms', 'p99_ms'):
+            if (atual[metrica] > anterior[metrica] * (1 + tolerancia)
+                    and atual[metrica] - anterior[metrica] > DIFERENCA_MINIMA_MS):
+                regressoes.append((nome, metrica, anterior[metrica], atual[metrica]))
+        if anterior.get('memoria_kb') and atual['memoria_kb'] > anterior['memoria_kb'] * (1 + tolerancia):
+            regressoes.append((nome, 'memoria_kb', anterior['memoria_kb'], atual['memoria_kb']))
+    return regressoes
+
+
+# Modos de sessão comparados na tempestade de logins: engine e se o usuário logado vem do cache
+MODOS_SESSAO = {
+    'db': ('django.contrib.sessions.backends.db', False),
+    'cached_db': ('django.contrib.sessions.backends.cached_db', True),
+    'cookies': ('django.contrib.sessions.backends.signed_cookies', True),
+}
+
+MIDDLEWARE_AUTENTICACAO = 'django.contrib.auth.middleware.AuthenticationMiddleware'
+MIDDLEWARE_USUARIO_EM_CACHE = 'usuarios.middleware.UsuarioEmCacheMiddleware'
+
+
+def _middleware(usuario_em_cache):
+    trocas = (
+        {MIDDLEWARE_AUTENTICACAO: MIDDLEWARE_USUARIO_EM_CACHE} if usuario_em_cache
+        else {MIDDLEWARE_USUARIO_EM_CACHE: MIDDLEWARE_AUTENTICACAO}
+    )
+    return [trocas.get(middleware, middleware) for middleware in settings.MIDDLEWARE]
+
+
+def tempestade_login(dados, modo, alunos=100, requisicoes=5, senha='senha-benchmark'):
+    """
+    Simula a turma chegando de manhã: `alunos` alunos fazem login, um após o
+    outro, e cada um navega `requisicoes` vezes por Meus Cursos. Retorna a
+    latência do login e das navegações e as consultas por navegação.
+
+    O hash de senha usa MD5 para a medida refletir o custo da sessão (o
+    PBKDF2 pesa igual em todos os modos) e o cache de sessões começa vazio,
+    num diretório temporário como o cache em arquivos padrão (usuarios.cache).
+    """
+    engine, usuario_em_cache = MODOS_SESSAO[modo]
+    diretorio = tempfile.mkdtemp(prefix='benchmark-sessoes-')
+    caches = {
+        **settings.CACHES,
+        'sessoes': {
+            'BACKEND': 'usuarios.cache.CacheArquivos',
+            'LOCATION': diretorio,
+            'OPTIONS': {'MAX_ENTRIES': getattr(settings, 'SESSOES_MAX_ENTRADAS', 50000)},
+        },
+    }
+    try:
+        with override_settings(
+            SESSION_ENGINE=engine, MIDDLEWARE=_middleware(usuario_em_cache), CACHES=caches,
+            PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], CONSULTAS_AMOSTRAGEM=0,
+        ), contextlib.redirect_stdout(io.StringIO()):
+            turma = list(
+                Usuario.objects.filter(escola=dados.escola, tipo='aluno').order_by('id')[:alunos]
+            )
+            Usuario.objects.filter(id__in=[aluno.id for aluno in turma]).update(password=make_password(senha))
+
+            logins, navegacoes, consultas = [], [], []
+            inicio_total = time.perf_counter()
+            for aluno in turma:
+                client = Client()
+                inicio = time.perf_counter()
+                resposta = client.post(reverse('usuarios:login'), {'username': aluno.username, 'password': senha})
+                logins.append((time.perf_counter() - inicio) * 1000)
+                if resposta.status_code != 302:
+                    raise RuntimeError(f'Login de {aluno.username} falhou ({resposta.status_code})')
+                for _ in range(requisicoes):
+                    with MonitorConsultas() as monitor:
+                        inicio = time.perf_counter()
+                        client.get(reverse('cursos:meus_cursos'))
+                        navegacoes.append((time.perf_counter() - inicio) * 1000)
+                    consultas.append(monitor.total)
+            total = time.perf_counter() - inicio_total
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    logins.sort()
+    navegacoes.sort()
+    return {
+        'login_p50_ms': round(percentil(logins, 50), 3),
+        'login_p95_ms': round(percentil(logins, 95), 3),
+        'requisicao_p50_ms': round(percentil(navegacoes, 50), 3),
+        'requisicao_p95_ms': round(percentil(navegacoes, 95), 3),
+        'consultas_por_requisicao': round(statistics.mean(consultas), 2),
+        'total_s': round(total, 3),
+    }
@@ -0,0 +1,271 @@
+import csv
+import io
+import random
+import time
+import zlib
+from collections import namedtuple
+from decimal import Decimal
+from functools import partial
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+
+from certificados.models import Certificado
+from usuarios.models import Usuario
+
+from .models import Capitulo, Curso, Progresso
+from .pacotes import PREFIXO_PACOTES
+from .progresso import reconstruir_resumos
+
+NOMES = [
+    'Ana', 'Bruno', 'Carla', 'Daniel', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique', 'Isabela', 'João',
+    'Larissa', 'Lucas', 'Mariana', 'Mateus', 'Natália', 'Pedro', 'Rafaela', 'Rodrigo', 'Sofia', 'Thiago',
+]
+SOBRENOMES = [
+    'Almeida', 'Barbosa', 'Carvalho', 'Costa', 'Ferreira', 'Gomes', 'Lima', 'Martins', 'Oliveira', 'Pereira',
+    'Ribeiro', 'Rodrigues', 'Santos', 'Silva', 'Souza',
+]
+ASSUNTOS = [
+    'Excel', 'Power BI', 'Python', 'Word', 'Lógica de Programação', 'Redes', 'Photoshop', 'SQL',
+    'Marketing Digital', 'Informática Básica',
+]
+
+# Quantidades geradas por gerar_carga
+ResumoCarga = namedtuple('ResumoCarga', [
+    'escolas', 'professores', 'alunos', 'cursos', 'capitulos', 'matriculas', 'progressos', 'certificados',
+    'segundos'
+])
+
+
+def _lotes(iteravel, tamanho):
+    iterador = iter(iteravel)
+    while lote := list(islice(iterador, tamanho)):
+        yield lote
+
+
+# Marcador de NULL no COPY: no formato csv o padrão é o campo vazio sem aspas, que é justamente como o
+# csv.writer grava '' (e quebraria as colunas NOT NULL com string vazia, como telefone e endereco)
+NULO_COPY = '\\N'
+
+
+def _serializar_copy(campos, lote):
+    """CSV das instâncias para o COPY, com os mesmos valores que o bulk_create gravaria"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for objeto in lote:
+        valores = (campo.get_db_prep_save(campo.pre_save(objeto, True), connection) for campo in campos)
+        escritor.writerow([NULO_COPY if valor is None else valor for valor in valores])
+    return buffer.getvalue()
+
+
+def _copiar(modelo, lote):
+    """Insere as instâncias com COPY ... FROM STDIN (PostgreSQL)"""
+    campos = [campo for campo in modelo._meta.concrete_fields if not campo.primary_key]
+    dados = _serializar_copy(campos, lote)
+
+    colunas = ', '.join(connection.ops.quote_name(campo.column) for campo in campos)
+    sql = (
+        f'COPY {connection.ops.quote_name(modelo._meta.db_table)} ({colunas}) '
+        f"FROM STDIN WITH (FORMAT csv, NULL '{NULO_COPY}')"
+    )
+    with connection.cursor() as cursor:
+        bruto = cursor.cursor
+        if hasattr(bruto, 'copy_expert'):  # psycopg2
+            bruto.copy_expert(sql, io.StringIO(dados))
+        else:  # psycopg 3
+            with bruto.copy(sql) as copia:
+                copia.write(dados)
+
+
+def inserir(modelo, objetos, batch_size=5000, usar_copy=False):
+    """Grava as instâncias (pode ser um gerador) em lotes, por COPY ou bulk_create; retorna o total"""
+    total = 0
+    for lote in _lotes(objetos, batch_size):
+        if usar_copy:
+            _copiar(modelo, lote)
+        else:
+            modelo.objects.bulk_create(lote, batch_size=batch_size)
+        total += len(lote)
+    return total
+
+
+def _cpf(numero):
+    digitos = f'{numero:011d}'
+    return f'{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}'
+
+
+def _profundidade(rng, aulas):
+    """Quantas aulas o aluno já concluiu: alguns não começaram, alguns terminaram, o resto no meio"""
+    sorteio = rng.random()
+    if sorteio < 0.1:
+        return 0
+    if sorteio < 0.25:
+        return aulas
+    return int(aulas * rng.betavariate(1.3, 1.7))
+
+
+def gerar_carga(escolas=10, professores=5, alunos=1000, cursos=20, aulas=12, cursos_por_aluno=3,
+                seed=42, prefixo='carga', senha='senha123', batch_size=5000, usar_copy=None):
+    """
+    Gera uma base sintética grande e determinística para a semente: escolas,
+    professores e alunos por escola, cursos com pares aula/exercício, matrículas,
+    progresso com distribuição realista e certificados de quem concluiu.
+
+    Tudo é gravado em lotes (COPY no PostgreSQL, bulk_create nos demais), sem
+    signals. A senha é hasheada uma única vez e compartilhada por todos os
+    usuários, então todos conseguem fazer login com ela.
+    """
+    inicio = time.perf_counter()
+    rng = random.Random(seed)
+    if usar_copy is None:
+        usar_copy = connection.vendor == 'postgresql'
+    gravar = partial(inserir, batch_size=batch_size, usar_copy=usar_copy)
+    senha_hash = make_password(senha)
+    # Faixa de CPFs da geração (cpf é único; evita colidir com outra carga no mesmo banco)
+    faixa_cpf = zlib.crc32(f'{prefixo}:{seed}'.encode()) % 100 * 10 ** 9
+
+    with transaction.atomic():
+        gravar(Usuario, (
+            Usuario(username=f'{prefixo}_escola_{e:03d}', first_name=f'Escola {e + 1}', tipo='escola',
+                    password=senha_hash)
+            for e in range(escolas)
+        ))
+        ids_escolas = list(
+            Usuario.objects.filter(username__startswith=f'{prefixo}_escola_').order_by('username')
+            .values_list('id', flat=True)
+        )
+
+        def pessoas(tipo, quantidade):
+            for e, escola_id in enumerate(ids_escolas):
+                for i in range(quantidade):
+                    nome, sobrenome = rng.choice(NOMES), rng.choice(SOBRENOMES)
+                    username = f'{prefixo}_e{e:03d}_{tipo}_{i:06d}'
+                    yield Usuario(
+                        username=username, first_name=nome, last_name=sobrenome,
+                        email=f'{username}@example.com', tipo=tipo, escola_id=escola_id, password=senha_hash,
+                        cpf=_cpf(faixa_cpf + e * 10 ** 6 + i) if tipo == 'aluno' else None,
+                    )
+
+        total_professores = gravar(Usuario, pessoas('professor', professores))
+        total_alunos = gravar(Usuario, pessoas('aluno', alunos))
+
+        gravar(Curso, (
+            Curso(nome=f'{prefixo} {ASSUNTOS[c % len(ASSUNTOS)]} {c // len(ASSUNTOS) + 1}',
+                  descricao=f'Curso de {ASSUNTOS[c % len(ASSUNTOS)]}')
+            for c in range(cursos)
+        ))
+        lista_cursos = list(Curso.objects.filter(nome__startswith=f'{prefixo} ').order_by('id'))
+
+        capitulos = []
+        for curso in lista_cursos:
+            pasta = f"{PREFIXO_PACOTES}{curso.nome.replace(' ', '_')}"
+            for n in range(1, aulas + 1):
+                capitulos.append(Capitulo(
+                    curso=curso, ordem=Decimal(n), tipo=Capitulo.TIPO_AULA, titulo=f'Capítulo {n} (Aula)',
+                    codigo=f'cap{n:02d}', url=f'{pasta}/cap{n:02d}/index.html'
+                ))
+                capitulos.append(Capitulo(
+                    curso=curso, ordem=Decimal(n) + Decimal('0.5'), tipo=Capitulo.TIPO_EXERCICIO,
+                    titulo=f'Capítulo {n} (Exercício)', codigo=f'cap{n:02d}_ex', url=f'{pasta}/cap{n:02d}_ex/index.html'
+                ))
+        gravar(Capitulo, capitulos)
+        # [(aula_id, exercicio_id)] em ordem, por curso
+        pares = {curso.id: [] for curso in lista_cursos}
+        ids_capitulos = {}
+        for capitulo_id, curso_id, ordem in Capitulo.objects.filter(curso__in=lista_cursos).values_list(
+                'id', 'curso_id', 'ordem'):
+            ids_capitulos[(curso_id, ordem)] = capitulo_id
+        for curso_id in pares:
+            pares[curso_id] = [
+                (ids_capitulos[(curso_id, Decimal(n))], ids_capitulos[(curso_id, Decimal(n) + Decimal('0.5'))])
+                for n in range(1, aulas + 1)
+            ]
+
+        # Cada escola oferece metade dos cursos (pelo menos um); professores e alunos só veem os da escola
+        ofertados = min(len(lista_cursos), max(1, len(lista_cursos) // 2))
+        cursos_da_escola = {
+            escola_id: sorted(rng.sample([curso.id for curso in lista_cursos], ofertados))
+            for escola_id in ids_escolas
+        }
+        gravar(Curso.escolas.through, (
+            Curso.escolas.through(curso_id=curso_id, usuario_id=escola_id)
+            for escola_id, ids in cursos_da_escola.items()
+            for curso_id in ids
+        ))
+
+        membros = Usuario.objects.filter(username__startswith=f'{prefixo}_e').order_by('username')
+        professores_por_escola = {}
+        for professor_id, escola_id in membros.filter(tipo='professor').values_list('id', 'escola_id'):
+            professores_por_escola.setdefault(escola_id, []).append(professor_id)
+        gravar(Curso.professores.through, (
+            Curso.professores.through(curso_id=curso_id, usuario_id=professor_id)
+            for escola_id, ids in cursos_da_escola.items()
+            for curso_id in ids
+            for professor_id in rng.sample(
+                professores_por_escola.get(escola_id, []), min(2, len(professores_por_escola.get(escola_id, [])))
+            )
+        ))
+
+        matriculas = [
+            (aluno_id, curso_id)
+            for aluno_id, escola_id in membros.filter(tipo='aluno').values_list('id', 'escola_id').iterator()
+            for curso_id in sorted(rng.sample(
+                cursos_da_escola[escola_id], min(cursos_por_aluno, len(cursos_da_escola[escola_id]))
+            ))
+        ]
+        total_matriculas = gravar(Curso.alunos.through, (
+            Curso.alunos.through(curso_id=curso_id, usuario_id=aluno_id) for aluno_id, curso_id in matriculas
+        ))
+
+        concluintes = []
+
+        def progressos():
+            for aluno_id, curso_id in matriculas:
+                feitas = _profundidade(rng, aulas)
+                for aula_id, exercicio_id in pares[curso_id][:feitas]:
+                    yield Progresso(aluno_id=aluno_id, capitulo_id=aula_id, curso_id=curso_id, concluido=True)
+                    nota = Decimal(rng.randint(80, 100)) / 10
+                    yield Progresso(aluno_id=aluno_id, capitulo_id=exercicio_id, curso_id=curso_id, concluido=True,
+                                    nota=nota)
+                if feitas == aulas:
+                    concluintes.append((aluno_id, curso_id))
+                elif feitas and rng.random() < 0.5:
+                    # Parou no meio: assistiu a aula e ainda não passou no exercício
+                    aula_id, exercicio_id = pares[curso_id][feitas]
+                    yield Progresso(aluno_id=aluno_id, capitulo_id=aula_id, curso_id=curso_id, concluido=True)
+                    if rng.random() < 0.6:
+                        nota = Decimal(rng.randint(20, 79)) / 10
+                        yield Progresso(aluno_id=aluno_id, capitulo_id=exercicio_id, curso_id=curso_id, nota=nota)
+
+        total_progressos = gravar(Progresso, progressos())
+
+        # Códigos de certificado são únicos no banco: dependem também do prefixo
+        rng_codigos = random.Random(f'{prefixo}:{seed}')
+        codigos = set()
+
+        def certificados():
+            for aluno_id, curso_id in concluintes:
+                # Nem todo concluinte já emitiu o certificado
+                if rng.random() < 0.2:
+                    continue
+                codigo = f'{rng_codigos.getrandbits(40):010X}'
+                while codigo in codigos:
+                    codigo = f'{rng_codigos.getrandbits(40):010X}'
+                codigos.add(codigo)
+                yield Certificado(aluno_id=aluno_id, curso_id=curso_id, codigo=codigo)
+
+        total_certificados = gravar(Certificado, certificados())
+        reconstruir_resumos([curso.id for curso in lista_cursos], batch_size=batch_size)
+
+    return ResumoCarga(
+        escolas=len(ids_escolas),
+        professores=total_professores,
+        alunos=total_alunos,
+        cursos=len(lista_cursos),
+        capitulos=len(capitulos),
+        matriculas=total_matriculas,
+        progressos=total_progressos,
+        certificados=total_certificados,
+        segundos=time.perf_counter() - inicio,
+    )
@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger('cursos.consultas')
+
+# Quantas vezes o mesmo formato de consulta pode se repetir numa requisição antes de ser tratado como N+1
+LIMITE_REPETICOES = 3
+
+_LISTA_IN = re.compile(r'\bIN \((?:%s, )*%s\)', re.IGNORECASE)
+_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_NUMERO = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+_ESTE_ARQUIVO = os.path.abspath(__file__)
+
+
+def formato_consulta(sql):
+    """Normaliza o SQL para agrupar consultas iguais a menos dos parâmetros"""
+    sql = _LISTA_IN.sub('IN (...)', sql)
+    sql = _TEXTO.sub('?', sql)
+    return _NUMERO.sub('?', sql)
+
+
+def origem_consulta():
+    """Primeiro frame do código do projeto (fora do Django e de bibliotecas) que disparou a consulta"""
+    raiz = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame is not None:
+        arquivo = frame.f_code.co_filename
+        if arquivo.startswith(raiz) and 'site-packages' not in arquivo and arquivo != _ESTE_ARQUIVO:
+            return f"{os.path.relpath(arquivo, raiz)}:{frame.f_lineno} em {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+class MonitorConsultas:
+    """
+    Registra as consultas executadas enquanto ativo (quantidade, tempo total e
+    formatos repetidos, com o frame de origem da primeira ocorrência).
+    """
+
+    def __init__(self, limite_repeticoes=None, using=DEFAULT_DB_ALIAS):
+        self.limite_repeticoes = limite_repeticoes or getattr(
+            settings, 'CONSULTAS_LIMITE_REPETICOES', LIMITE_REPETICOES
+        )
+        self.conexao = connections[using]
+        self.total = 0
+        self.segundos = 0.0
+        self.formatos = {}
+
+    def __enter__(self):
+        self._wrapper = self.conexao.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *excecao):
+        self._wrapper.__exit__(*excecao)
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = time.perf_counter() - inicio
+            self.total += 1
+            self.segundos += duracao
+            formato = formato_consulta(sql)
+            if formato in self.formatos:
+                self.formatos[formato][0] += 1
+            else:
+                self.formatos[formato] = [1, origem_consulta()]
+
+    @property
+    def repetidas(self):
+        """[(formato, vezes, origem)] das consultas que se repetiram a partir do limite (N+1)"""
+        return [
+            (formato, vezes, origem)
+            for formato, (vezes, origem) in self.formatos.items()
+            if vezes >= self.limite_repeticoes
+        ]
+
+    def relatorio(self):
+        return {
+            'consultas': self.total,
+            'tempo_ms': round(self.segundos * 1000, 2),
+            'n_mais_1': [
+                {'sql': formato, 'vezes': vezes, 'origem': origem}
+                for formato, vezes, origem in self.repetidas
+            ],
+        }
+
+
+def orcamento_consultas(maximo):
+    """Declara o máximo de consultas de uma view (verificado pelo middleware e pelos testes)"""
+    def decorator(view_func):
+        view_func.orcamento_consultas = maximo
+        return view_func
+    return decorator
+
+
+def orcamento_da_view(resolver_match):
+    """Orçamento declarado da view resolvida; settings.ORCAMENTO_CONSULTAS[url_name] tem prioridade"""
+    if resolver_match is None:
+        return None
+    configurados = getattr(settings, 'ORCAMENTO_CONSULTAS', {})
+    if resolver_match.view_name in configurados:
+        return configurados[resolver_match.view_name]
+    view = resolver_match.func
+    orcamento = getattr(view, 'orcamento_consultas', None)
+    if orcamento is None:
+        orcamento = getattr(getattr(view, 'view_class', None), 'orcamento_consultas', None)
+    return orcamento
+
+
+def registrar_requisicao(request, response, monitor):
+    """Grava no log 'cursos.consultas' uma linha JSON por requisição amostrada"""
+    resolver_match = getattr(request, 'resolver_match', None)
+    orcamento = orcamento_da_view(resolver_match)
+    dados = {
+        'url_name': resolver_match.view_name if resolver_match else None,
+        'metodo': request.method,
+        'caminho': request.path,
+        'status': response.status_code,
+        'orcamento': orcamento,
+        **monitor.relatorio(),
+    }
+    estourou = orcamento is not None and monitor.total > orcamento
+    nivel = logging.WARNING if estourou or dados['n_mais_1'] else logging.INFO
+    logger.log(nivel, json.dumps(dados, ensure_ascii=False))
+    return dados
+
+
+class ConsultasTestMixin:
+    """Asserções de consultas para TestCase: orçamento por view e detecção de N+1"""
+
+    @contextmanager
+    def assertMaximoConsultas(self, maximo, using=DEFAULT_DB_ALIAS):
+        with MonitorConsultas(using=using) as monitor:
+            yield monitor
+        self.assertLessEqual(
+            monitor.total, maximo,
+            f"{monitor.total} consultas executadas, máximo {maximo}: {json.dumps(monitor.relatorio(), ensure_ascii=False)}"
+        )
+
+    @contextmanager
+    def assertSemNMais1(self, limite_repeticoes=None, using=DEFAULT_DB_ALIAS):
+        with MonitorConsultas(limite_repeticoes, using=using) as monitor:
+            yield monitor
+        self.assertEqual(
+            monitor.repetidas, [],
+            f"Consultas repetidas (N+1): {json.dumps(monitor.relatorio()['n_mais_1'], ensure_ascii=False)}"
+        )
+
+    def assertDentroDoOrcamento(self, url, metodo='get', **kwargs):
+        """Faz a requisição e falha se a view passar do orçamento declarado ou tiver N+1"""
+        with MonitorConsultas() as monitor:
+            response = getattr(self.client, metodo)(url, **kwargs)
+        orcamento = orcamento_da_view(response.resolver_match)
+        self.assertIsNotNone(orcamento, f"A view de {url} não declara orçamento de consultas")
+        relatorio = json.dumps(monitor.relatorio(), ensure_ascii=False)
+        self.assertLessEqual(monitor.total, orcamento, f"{url} passou do orçamento de {orcamento} consultas: {relatorio}")
+        self.assertEqual(monitor.repetidas, [], f"{url} tem consultas repetidas (N+1): {relatorio}")
+        return response
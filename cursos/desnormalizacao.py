@@ -0,0 +1,56 @@
+import time
+
+from django.db import transaction
+from django.db.models import Max, Min, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+TAMANHO_LOTE = 10000
+
+
+# Registros gravados pela versão anterior à coluna (entre a migração e o fim do deploy) ficam com o
+# curso nulo até o preencher_curso_progresso passar, o que o build e o início do web fazem. Até a
+# coluna virar NOT NULL, as consultas por curso usam os dois filtros abaixo, que nesses registros
+# caem no curso do capítulo; nos demais o índice (curso, capitulo) continua sendo usado.
+
+def progresso_dos_cursos(cursos_ids):
+    """Q dos registros de Progresso dos cursos, inclusive os ainda sem o curso desnormalizado"""
+    cursos_ids = list(cursos_ids)
+    return Q(curso_id__in=cursos_ids) | Q(curso__isnull=True, capitulo__curso_id__in=cursos_ids)
+
+
+def curso_do_progresso():
+    """Expressão do curso de um Progresso para agrupar, com o mesmo fallback de progresso_dos_cursos"""
+    return Coalesce('curso_id', 'capitulo__curso_id')
+
+
+def preencher_curso_progresso(progresso_model, capitulo_model, batch_size=TAMANHO_LOTE, pausa=0, progresso=None):
+    """
+    Preenche Progresso.curso a partir do capítulo, em faixas de id de
+    `batch_size`, cada uma num UPDATE na sua própria transação curta: os
+    locks duram só a faixa, sem travar a tabela. Só toca nas linhas ainda
+    nulas, então pode ser interrompido e rodado de novo de onde parou.
+
+    Recebe os modelos para servir tanto à migração (modelos históricos)
+    quanto ao comando preencher_curso_progresso. `pausa` (segundos) entre as
+    faixas alivia o banco e a replicação; `progresso(preenchidos, ultimo_id)`
+    é chamado após cada faixa. Retorna quantas linhas foram preenchidas.
+    """
+    pendentes = progresso_model.objects.filter(curso__isnull=True)
+    limites = pendentes.aggregate(inicio=Min('id'), fim=Max('id'))
+    if limites['inicio'] is None:
+        return 0
+
+    curso_do_capitulo = Subquery(
+        capitulo_model.objects.filter(id=OuterRef('capitulo_id')).values('curso_id')[:1]
+    )
+    preenchidos = 0
+    for inicio in range(limites['inicio'], limites['fim'] + 1, batch_size):
+        with transaction.atomic():
+            preenchidos += pendentes.filter(id__gte=inicio, id__lt=inicio + batch_size).update(
+                curso_id=curso_do_capitulo
+            )
+        if progresso:
+            progresso(preenchidos, min(inicio + batch_size - 1, limites['fim']))
+        if pausa:
+            time.sleep(pausa)
+    return preenchidos
@@ -0,0 +1,160 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Avg, Count, Q
+from django.utils import timezone
+
+from certificados.models import Certificado
+from usuarios.models import Usuario
+
+from .desnormalizacao import curso_do_progresso, progresso_dos_cursos
+from .models import Capitulo, Curso, Progresso, ResumoProgresso
+
+TIMEOUT_ESTATISTICAS = 60 * 5
+DIAS_ATIVOS = 7
+# Tempo máximo de um recálculo: a trava expira sozinha se o processo morrer no meio
+TEMPO_TRAVA = 30
+# Quanto quem chega sem valor espera o recálculo de outro processo antes de calcular
+# por conta própria: prende o worker por no máximo isso, em vez de até TEMPO_TRAVA
+ESPERA_MAXIMA = 1.5
+# Intervalo entre as leituras de quem espera: começa curto e dobra até o teto
+ESPERA_TRAVA = 0.02
+ESPERA_TRAVA_MAXIMA = 0.25
+
+
+def _cache():
+    return caches[getattr(settings, 'ESTATISTICAS_CACHE', 'default')]
+
+
+def calcular_uma_vez(chave, calcular, timeout):
+    """
+    Valor em cache de `calcular()`, recalculado por um único processo por
+    vez (single-flight). O valor vale por `timeout` segundos e fica guardado
+    pelo dobro: depois de vencido, quem pega a trava recalcula e os demais
+    continuam recebendo o valor anterior, sem recálculos em paralelo.
+
+    Só quem chega sem valor nenhum (cache frio) espera o recálculo em
+    andamento, lendo o cache em intervalos crescentes por até ESPERA_MAXIMA
+    segundos; se ele não terminar a tempo, calcula por conta própria. É uma
+    troca: num recálculo lento com o cache frio alguns pedidos calculam em
+    paralelo, mas nenhum worker fica preso até TEMPO_TRAVA esperando.
+    """
+    cache = _cache()
+    guardado = cache.get(chave)
+    agora = time.time()
+    if guardado is not None and guardado[0] > agora:
+        return guardado[1]
+
+    trava = f'{chave}:trava'
+    dono = uuid.uuid4().hex
+    if cache.add(trava, dono, TEMPO_TRAVA):
+        try:
+            valor = calcular()
+            cache.set(chave, (time.time() + timeout, valor), timeout * 2)
+            return valor
+        finally:
+            if cache.get(trava) == dono:
+                cache.delete(trava)
+    if guardado is not None:
+        return guardado[1]
+
+    limite = agora + ESPERA_MAXIMA
+    intervalo = ESPERA_TRAVA
+    while (restante := limite - time.time()) > 0:
+        time.sleep(min(intervalo, restante))
+        intervalo = min(intervalo * 2, ESPERA_TRAVA_MAXIMA)
+        guardado = cache.get(chave)
+        if guardado is not None:
+            return guardado[1]
+        if cache.get(trava) is None:
+            # Quem recalculava desistiu (erro): tenta de novo, disputando a trava
+            return calcular_uma_vez(chave, calcular, timeout)
+    return calcular()
+
+
+def _percentual(parte, total):
+    return round(parte * 100 / total) if total else 0
+
+
+def calcular_estatisticas_escola(escola):
+    """
+    Estatísticas por curso da escola (matriculados, concluintes, taxa de
+    conclusão, média dos exercícios, certificados e alunos ativos nos últimos
+    DIAS_ATIVOS dias), contando só os alunos dela. Uma consulta com GROUP BY
+    por fonte (matrículas, progresso, resumos e certificados), mais a lista
+    de cursos e os totais de usuários.
+    """
+    cursos = list(Curso.objects.filter(escolas=escola).order_by('nome').values('id', 'nome'))
+    cursos_ids = [curso['id'] for curso in cursos]
+    limite_ativos = timezone.now() - timedelta(days=DIAS_ATIVOS)
+
+    totais = Usuario.objects.filter(escola=escola).aggregate(
+        alunos=Count('id', filter=Q(tipo='aluno')),
+        professores=Count('id', filter=Q(tipo='professor')),
+    )
+
+    matriculados = dict(
+        Curso.alunos.through.objects.filter(
+            curso_id__in=cursos_ids, usuario__escola=escola, usuario__tipo='aluno'
+        ).values('curso_id').annotate(total=Count('id')).values_list('curso_id', 'total')
+    )
+    progresso = {
+        linha['curso_efetivo']: linha
+        for linha in Progresso.objects.filter(
+            progresso_dos_cursos(cursos_ids), aluno__escola=escola, aluno__tipo='aluno'
+        ).annotate(curso_efetivo=curso_do_progresso()).values('curso_efetivo').annotate(
+            media_notas=Avg('nota', filter=Q(capitulo__tipo=Capitulo.TIPO_EXERCICIO)),
+            ativos=Count('aluno_id', distinct=True, filter=Q(atualizado_em__gte=limite_ativos)),
+        )
+    }
+    # A conclusão vem dos resumos materializados (percentual 100), a mesma regra da emissão de certificados
+    concluintes = dict(
+        ResumoProgresso.objects.filter(
+            curso_id__in=cursos_ids, aluno__escola=escola, aluno__tipo='aluno', percentual=100
+        ).values('curso_id').annotate(total=Count('id')).values_list('curso_id', 'total')
+    )
+    certificados = dict(
+        Certificado.objects.filter(
+            curso_id__in=cursos_ids, aluno__escola=escola
+        ).values('curso_id').annotate(total=Count('id')).values_list('curso_id', 'total')
+    )
+    ativos_na_escola = Progresso.objects.filter(
+        aluno__escola=escola, aluno__tipo='aluno', atualizado_em__gte=limite_ativos
+    ).values('aluno_id').distinct().count()
+
+    por_curso = []
+    for curso in cursos:
+        linha = progresso.get(curso['id'], {})
+        media = linha.get('media_notas')
+        total = matriculados.get(curso['id'], 0)
+        por_curso.append({
+            'id': curso['id'],
+            'nome': curso['nome'],
+            'matriculados': total,
+            'concluintes': concluintes.get(curso['id'], 0),
+            'taxa_conclusao': _percentual(concluintes.get(curso['id'], 0), total),
+            'media_notas': round(float(media), 2) if media is not None else None,
+            'certificados': certificados.get(curso['id'], 0),
+            'ativos': linha.get('ativos', 0),
+        })
+
+    return {
+        'total_alunos': totais['alunos'],
+        'total_professores': totais['professores'],
+        'ativos': ativos_na_escola,
+        'dias_ativos': DIAS_ATIVOS,
+        'cursos': por_curso,
+        'calculado_em': timezone.now().isoformat(),
+    }
+
+
+def estatisticas_escola(escola):
+    """Estatísticas da escola (ver calcular_estatisticas_escola) em cache por ESTATISTICAS_TIMEOUT segundos"""
+    return calcular_uma_vez(
+        f'cursos:estatisticas:escola:{escola.id}',
+        lambda: calcular_estatisticas_escola(escola),
+        getattr(settings, 'ESTATISTICAS_TIMEOUT', TIMEOUT_ESTATISTICAS),
+    )
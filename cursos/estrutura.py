@@ -0,0 +1,195 @@
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+from django.core.cache import cache
+
+from .models import Capitulo
+from .pacotes import PREFIXO_PACOTES
+
+# Itens imutáveis (e serializáveis) que compõem a estrutura de um curso
+CapituloEstrutura = namedtuple('CapituloEstrutura', ['id', 'titulo', 'ordem', 'codigo', 'url', 'caminho'])
+AulaEstrutura = namedtuple('AulaEstrutura', ['indice', 'aula', 'exercicio', 'anterior_id', 'proxima_id'])
+
+TIMEOUT_ESTRUTURA = 60 * 60 * 24
+
+# Muda quando o formato da EstruturaCurso muda, para não ler cópias antigas do cache
+FORMATO_ESTRUTURA = 2
+
+# Cache por processo: {curso_id: EstruturaCurso}
+_estruturas_locais = {}
+
+
+def _chave_versao(curso_id):
+    return f'cursos:estrutura:{curso_id}:versao'
+
+
+def _chave_estrutura(curso_id, versao):
+    return f'cursos:estrutura:{curso_id}:v{versao}:f{FORMATO_ESTRUTURA}'
+
+
+def caminho_pacote(nome_curso):
+    """Pasta dos pacotes Captivate de um curso dentro de static/"""
+    return f"{PREFIXO_PACOTES}{nome_curso.replace(' ', '_')}"
+
+
+class EstruturaCurso:
+    """
+    Estrutura imutável de um curso: aulas em ordem, o exercício de cada aula,
+    ponteiros de aula anterior/próxima e o caminho dos pacotes.
+    """
+    __slots__ = ('curso_id', 'versao', 'aulas', '_itens')
+
+    def __init__(self, curso_id, versao, aulas):
+        self.curso_id = curso_id
+        self.versao = versao
+        self.aulas = tuple(aulas)
+        self._itens = {}
+        for item in self.aulas:
+            self._itens[item.aula.id] = item
+            if item.exercicio:
+                self._itens[item.exercicio.id] = item
+
+    def __reduce__(self):
+        return (EstruturaCurso, (self.curso_id, self.versao, self.aulas))
+
+    def __iter__(self):
+        return iter(self.aulas)
+
+    def __len__(self):
+        return len(self.aulas)
+
+    def item(self, capitulo_id):
+        """Retorna o item da aula (ou do exercício) informado, ou None"""
+        return self._itens.get(capitulo_id)
+
+    def exercicio_da_aula(self, aula_id):
+        item = self._itens.get(aula_id)
+        if item and item.aula.id == aula_id:
+            return item.exercicio
+        return None
+
+    def aula_do_exercicio(self, exercicio_id):
+        item = self._itens.get(exercicio_id)
+        if item and item.exercicio and item.exercicio.id == exercicio_id:
+            return item.aula
+        return None
+
+    def anterior(self, aula_id):
+        item = self._itens.get(aula_id)
+        if item and item.anterior_id:
+            return self._itens[item.anterior_id]
+        return None
+
+    def proxima(self, aula_id):
+        item = self._itens.get(aula_id)
+        if item and item.proxima_id:
+            return self._itens[item.proxima_id]
+        return None
+
+    def pares(self):
+        """Lista [(aula_id, exercicio_id)] em ordem, com None para aulas sem exercício"""
+        return [(item.aula.id, item.exercicio.id if item.exercicio else None) for item in self.aulas]
+
+
+def _construir_estruturas(versoes):
+    """Monta as estruturas dos cursos {curso_id: versao} com uma única consulta"""
+    capitulos = Capitulo.objects.filter(
+        curso_id__in=list(versoes)
+    ).order_by('curso_id', 'ordem', 'tipo').values_list(
+        'curso_id', 'curso__nome', 'id', 'tipo', 'titulo', 'ordem', 'codigo', 'url'
+    )
+
+    aulas = {curso_id: [] for curso_id in versoes}
+    exercicios = {}
+    for curso_id, nome_curso, capitulo_id, tipo, titulo, ordem, codigo, url in capitulos:
+        base = caminho_pacote(nome_curso)
+        if url.startswith(PREFIXO_PACOTES):
+            # Caminho real do pacote cadastrado no capítulo
+            caminho = url
+        elif tipo == Capitulo.TIPO_EXERCICIO:
+            caminho = f"{base}/cap{ordem}_ex/index.html"
+        else:
+            caminho = f"{base}/cap{int(ordem)}/index.html"
+
+        if tipo == Capitulo.TIPO_EXERCICIO:
+            exercicios[(curso_id, ordem)] = CapituloEstrutura(capitulo_id, titulo, ordem, codigo, url, caminho)
+        else:
+            aulas[curso_id].append(CapituloEstrutura(capitulo_id, titulo, ordem, codigo, url, caminho))
+
+    estruturas = {}
+    for curso_id, lista in aulas.items():
+        itens = []
+        for indice, aula in enumerate(lista):
+            itens.append(AulaEstrutura(
+                indice=indice,
+                aula=aula,
+                exercicio=exercicios.get((curso_id, aula.ordem + Decimal('0.5'))),
+                anterior_id=lista[indice - 1].id if indice > 0 else None,
+                proxima_id=lista[indice + 1].id if indice + 1 < len(lista) else None,
+            ))
+        estruturas[curso_id] = EstruturaCurso(curso_id, versoes[curso_id], itens)
+    return estruturas
+
+
+def versoes_estrutura(cursos_ids):
+    """Retorna {curso_id: versão atual da estrutura} com uma leitura do cache"""
+    cursos_ids = list(dict.fromkeys(cursos_ids))
+    versoes_cache = cache.get_many([_chave_versao(curso_id) for curso_id in cursos_ids])
+
+    versoes = {}
+    for curso_id in cursos_ids:
+        versao = versoes_cache.get(_chave_versao(curso_id))
+        if versao is None:
+            # Versão inicial única, para não reaproveitar estruturas antigas se a chave expirar
+            cache.add(_chave_versao(curso_id), time.time_ns(), None)
+            versao = cache.get(_chave_versao(curso_id))
+        versoes[curso_id] = versao
+    return versoes
+
+
+def obter_estruturas(cursos_ids):
+    """
+    Retorna {curso_id: EstruturaCurso}. Usa o cache do processo quando a versão
+    ainda é a atual, depois o cache compartilhado e, por fim, monta as que
+    faltam com uma única consulta. As versões vêm sempre do cache
+    compartilhado (uma leitura por chamada): o cache do processo só poupa
+    buscar e desserializar a estrutura.
+    """
+    resultado = {}
+    pendentes = {}
+    for curso_id, versao in versoes_estrutura(cursos_ids).items():
+        local = _estruturas_locais.get(curso_id)
+        if local is not None and local.versao == versao:
+            resultado[curso_id] = local
+        else:
+            pendentes[curso_id] = versao
+
+    if pendentes:
+        chaves = {_chave_estrutura(curso_id, versao): curso_id for curso_id, versao in pendentes.items()}
+        for chave, estrutura in cache.get_many(list(chaves)).items():
+            resultado[chaves[chave]] = _estruturas_locais[chaves[chave]] = estrutura
+            del pendentes[chaves[chave]]
+
+    if pendentes:
+        novas = _construir_estruturas(pendentes)
+        cache.set_many(
+            {_chave_estrutura(curso_id, estrutura.versao): estrutura for curso_id, estrutura in novas.items()},
+            TIMEOUT_ESTRUTURA
+        )
+        for curso_id, estrutura in novas.items():
+            resultado[curso_id] = _estruturas_locais[curso_id] = estrutura
+
+    return resultado
+
+
+def obter_estrutura(curso_id):
+    return obter_estruturas([curso_id])[curso_id]
+
+
+def invalidar_estrutura(curso_id):
+    """Troca a versão da estrutura, descartando as cópias em cache de todos os processos"""
+    # Uma versão nova e única, e não um incr: no DatabaseCache o incr é leitura seguida
+    # de gravação, e duas invalidações simultâneas podiam chegar ao mesmo número
+    cache.set(_chave_versao(curso_id), time.time_ns(), None)
+    _estruturas_locais.pop(curso_id, None)
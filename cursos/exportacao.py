@@ -0,0 +1,186 @@
+import csv
+import zipfile
+from itertools import groupby
+from xml.sax.saxutils import escape
+
+from usuarios.models import Usuario
+
+from .estrutura import obter_estruturas
+from .models import Curso, Progresso
+
+TAMANHO_LOTE = 2000
+
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+
+def linhas_boletim(escola, cursos_ids=None, chunk_size=TAMANHO_LOTE):
+    """
+    Gera o boletim da escola linha a linha: cabeçalho (a partir da estrutura
+    em cache dos cursos) e uma linha por aluno com uma coluna por exercício.
+    Alunos e notas são lidos com dois cursores em ordem de aluno e
+    combinados à medida que chegam, então a memória não cresce com o total.
+    """
+    cursos = Curso.objects.filter(escolas=escola).order_by('nome', 'id')
+    if cursos_ids is not None:
+        cursos = cursos.filter(id__in=cursos_ids)
+    cursos = list(cursos)
+    estruturas = obter_estruturas([curso.id for curso in cursos])
+
+    colunas = [
+        (curso, item.exercicio)
+        for curso in cursos
+        for item in estruturas[curso.id]
+        if item.exercicio
+    ]
+    posicoes = {exercicio.id: indice for indice, (_, exercicio) in enumerate(colunas)}
+    yield ['Aluno', 'Nome'] + [f"{curso.nome} - {exercicio.titulo}" for curso, exercicio in colunas]
+
+    alunos = Usuario.objects.filter(
+        tipo='aluno',
+        escola=escola
+    ).order_by('id').values_list('id', 'username', 'first_name', 'last_name').iterator(chunk_size=chunk_size)
+
+    notas = Progresso.objects.filter(
+        aluno__tipo='aluno',
+        aluno__escola=escola,
+        capitulo_id__in=list(posicoes),
+        nota__isnull=False
+    ).order_by('aluno_id').values_list('aluno_id', 'capitulo_id', 'nota').iterator(chunk_size=chunk_size)
+    notas_por_aluno = groupby(notas, key=lambda nota: nota[0])
+
+    atual = next(notas_por_aluno, None)
+    for aluno_id, username, first_name, last_name in alunos:
+        linha = [None] * len(colunas)
+        while atual is not None and atual[0] < aluno_id:
+            atual = next(notas_por_aluno, None)
+        if atual is not None and atual[0] == aluno_id:
+            for _, capitulo_id, nota in atual[1]:
+                linha[posicoes[capitulo_id]] = nota
+            atual = next(notas_por_aluno, None)
+        yield [username, f"{first_name} {last_name}".strip()] + linha
+
+
+class _Buffer:
+    """Pseudo-arquivo que só acumula o que foi escrito, para ser repassado em partes"""
+
+    def __init__(self, vazio):
+        self.vazio = vazio
+        self.partes = []
+
+    def write(self, dados):
+        self.partes.append(dados)
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = self.vazio.join(self.partes)
+        self.partes = []
+        return dados
+
+
+# Início de célula que o Excel/LibreOffice interpretam como fórmula
+_INICIO_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _celula_csv(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, str) and valor.startswith(_INICIO_FORMULA):
+        # Nomes e títulos vêm de usuários: o apóstrofo faz a planilha tratar como texto
+        return "'" + valor
+    return valor
+
+
+def gerar_csv(linhas):
+    """Gera o CSV em partes de texto, sem montar o arquivo inteiro"""
+    buffer = _Buffer('')
+    escritor = csv.writer(buffer)
+    # BOM para o Excel reconhecer UTF-8
+    yield '\ufeff'
+    for linha in linhas:
+        escritor.writerow([_celula_csv(valor) for valor in linha])
+        yield buffer.esvaziar()
+
+
+def _celula_xlsx(valor):
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, str):
+        return f'<c t="inlineStr"><is><t>{escape(valor)}</t></is></c>'
+    return f'<c><v>{valor}</v></c>'
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Boletim" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+def gerar_xlsx(linhas, linhas_por_parte=500):
+    """
+    Gera um XLSX (uma planilha, strings inline) em partes de bytes. O zip é
+    escrito num destino sem seek, então cada parte pode ser enviada assim
+    que fica pronta.
+    """
+    buffer = _Buffer(b'')
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as arquivo:
+        arquivo.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        arquivo.writestr('_rels/.rels', _RELS)
+        arquivo.writestr('xl/workbook.xml', _WORKBOOK)
+        arquivo.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        yield buffer.esvaziar()
+
+        with arquivo.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as planilha:
+            planilha.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            for numero, linha in enumerate(linhas, start=1):
+                planilha.write(f'<row>{"".join(_celula_xlsx(valor) for valor in linha)}</row>'.encode())
+                if numero % linhas_por_parte == 0:
+                    yield buffer.esvaziar()
+            planilha.write(b'</sheetData></worksheet>')
+    yield buffer.esvaziar()
+
+
+def exportar_boletim(escola, formato='csv', cursos_ids=None):
+    """Partes do boletim da escola no formato pedido ('csv' ou 'xlsx')"""
+    linhas = linhas_boletim(escola, cursos_ids)
+    if formato == 'xlsx':
+        return gerar_xlsx(linhas)
+    return gerar_csv(linhas)
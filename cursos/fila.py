@@ -0,0 +1,111 @@
+import logging
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models import NotaPendente
+from .progresso import aplicar_notas
+
+logger = logging.getLogger(__name__)
+
+def modo_assincrono():
+    """Indica se as notas devem ir para a fila em vez de serem gravadas na hora"""
+    return getattr(settings, 'NOTAS_ASSINCRONAS', False)
+
+
+def enfileirar_notas(itens):
+    """Grava as notas [(aluno_id, capitulo_id, nota)] na fila com um único INSERT"""
+    return NotaPendente.objects.bulk_create([
+        NotaPendente(aluno_id=aluno_id, capitulo_id=capitulo_id, nota=nota)
+        for aluno_id, capitulo_id, nota in itens
+    ])
+
+
+def processar_lote(limite=500, aluno_id=None):
+    """
+    Aplica até `limite` notas pendentes (na ordem em que chegaram) e retorna
+    quantas foram processadas. As linhas ficam bloqueadas até o commit, e o
+    bloqueio sem skip_locked garante que worker e leitura nunca apliquem notas
+    do mesmo aluno fora de ordem.
+    """
+    with transaction.atomic():
+        pendentes = NotaPendente.objects.select_for_update().filter(
+            processada_em__isnull=True
+        ).order_by('id')
+        if aluno_id is not None:
+            pendentes = pendentes.filter(aluno_id=aluno_id)
+        if limite:
+            pendentes = pendentes[:limite]
+        pendentes = list(pendentes.values_list('id', 'aluno_id', 'capitulo_id', 'nota'))
+        if not pendentes:
+            return 0
+
+        resultados = _aplicar_isolando([(aluno, capitulo, nota) for _, aluno, capitulo, nota in pendentes])
+
+        aplicadas = []
+        falhas = []
+        agora = timezone.now()
+        for (pendente_id, _, _, _), resultado in zip(pendentes, resultados):
+            if resultado['status'] == 'success':
+                aplicadas.append(pendente_id)
+            else:
+                falhas.append(NotaPendente(id=pendente_id, processada_em=agora, erro=resultado['message'][:200]))
+
+        NotaPendente.objects.filter(id__in=aplicadas).delete()
+        NotaPendente.objects.bulk_update(falhas, ['processada_em', 'erro'])
+    return len(pendentes)
+
+
+def _aplicar_isolando(itens):
+    """
+    aplicar_notas num savepoint; se o lote inteiro falhar, aplica as notas uma
+    a uma, na mesma ordem, para que só as que falharem fiquem com erro na fila
+    em vez de travarem todas as outras a cada nova tentativa do worker
+    """
+    try:
+        with transaction.atomic():
+            return aplicar_notas(itens)
+    except Exception:
+        logger.warning('Lote de %s notas falhou; aplicando uma a uma', len(itens), exc_info=True)
+
+    resultados = []
+    for item in itens:
+        try:
+            with transaction.atomic():
+                resultados.extend(aplicar_notas([item]))
+        except Exception as e:
+            resultados.append({'status': 'error', 'message': f'Erro interno: {e}'})
+    return resultados
+
+
+def situacao_fila():
+    """Profundidade da fila: pendentes, com erro e recebimento mais antigo pendente"""
+    return NotaPendente.objects.aggregate(
+        pendentes=Count('id', filter=Q(processada_em__isnull=True)),
+        com_erro=Count('id', filter=Q(processada_em__isnull=False)),
+        mais_antiga=Min('recebida_em', filter=Q(processada_em__isnull=True)),
+    )
+
+
+def aplicar_pendentes_do_aluno(aluno):
+    """Aplica na hora as notas do aluno ainda na fila (uma consulta quando não há nenhuma)"""
+    if not modo_assincrono() or not aluno.is_authenticated:
+        return
+    if NotaPendente.objects.filter(aluno=aluno, processada_em__isnull=True).exists():
+        processar_lote(limite=None, aluno_id=aluno.id)
+
+
+def notas_aplicadas(view_func):
+    """
+    Garante que as notas já confirmadas ao aluno estejam aplicadas antes de a
+    view calcular liberação ou progresso, para que ele nunca veja o próximo
+    capítulo bloqueado depois de a nota ter sido aceita.
+    """
+    @wraps(view_func)
+    def _view(request, *args, **kwargs):
+        aplicar_pendentes_do_aluno(request.user)
+        return view_func(request, *args, **kwargs)
+    return _view
@@ -0,0 +1,102 @@
+import hashlib
+import logging
+import os
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .estrutura import versoes_estrutura
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_FRAGMENTOS = 60 * 60 * 24
+
+# Muda quando os templates dos fragmentos mudam, para não servir HTML antigo após o deploy
+FORMATO_FRAGMENTOS = 1
+
+# Contadores deste processo: acertos, faltas e erros (cache indisponível)
+_estatisticas = Counter()
+
+
+def _cache():
+    return caches[getattr(settings, 'FRAGMENTOS_CACHE', 'default')]
+
+
+def _chave_progresso(aluno_id):
+    return f'cursos:progresso:{aluno_id}:versao'
+
+
+def versao_progresso(aluno_id):
+    """Versão atual do progresso do aluno (muda a cada gravação de Progresso)"""
+    cache = _cache()
+    versao = cache.get(_chave_progresso(aluno_id))
+    if versao is None:
+        # Versão inicial única, para não reaproveitar fragmentos antigos se a chave expirar
+        cache.add(_chave_progresso(aluno_id), time.time_ns(), None)
+        versao = cache.get(_chave_progresso(aluno_id))
+    return versao
+
+
+def invalidar_progresso(alunos_ids):
+    """Troca a versão do progresso dos alunos, descartando os fragmentos deles"""
+    for aluno_id in set(alunos_ids):
+        try:
+            # Versão nova e única, como em invalidar_estrutura: o incr do DatabaseCache não é atômico
+            _cache().set(_chave_progresso(aluno_id), time.time_ns(), None)
+        except Exception:
+            logger.warning('Não foi possível invalidar os fragmentos do aluno %s', aluno_id, exc_info=True)
+            _estatisticas['erros'] += 1
+
+
+def chave_fragmento(nome, usuario_id, cursos_ids):
+    """Chave do fragmento: usuário, versão do progresso e versão da estrutura de cada curso"""
+    versoes = versoes_estrutura(cursos_ids)
+    cursos = hashlib.md5(
+        ','.join(f'{curso_id}.{versao}' for curso_id, versao in versoes.items()).encode()
+    ).hexdigest()
+    return (
+        f'cursos:fragmento:{nome}:f{FORMATO_FRAGMENTOS}:u{usuario_id}:'
+        f'p{versao_progresso(usuario_id)}:c{cursos}'
+    )
+
+
+def obter_fragmento(nome, usuario_id, cursos_ids, gerar):
+    """
+    Retorna o fragmento em cache para o usuário e os cursos, ou chama gerar()
+    (que deve devolver um valor serializável, ex.: um dict com o HTML) e
+    guarda o resultado. Se o cache estiver fora do ar, apenas chama gerar().
+    """
+    try:
+        chave = chave_fragmento(nome, usuario_id, cursos_ids)
+        valor = _cache().get(chave)
+    except Exception:
+        logger.warning('Cache de fragmentos indisponível', exc_info=True)
+        _estatisticas['erros'] += 1
+        return gerar()
+
+    if valor is not None:
+        _estatisticas['acertos'] += 1
+        return valor
+
+    _estatisticas['faltas'] += 1
+    valor = gerar()
+    try:
+        _cache().set(chave, valor, getattr(settings, 'FRAGMENTOS_TIMEOUT', TIMEOUT_FRAGMENTOS))
+    except Exception:
+        logger.warning('Cache de fragmentos indisponível', exc_info=True)
+        _estatisticas['erros'] += 1
+    return valor
+
+
+def estatisticas_fragmentos():
+    """Acertos, faltas e erros do cache de fragmentos neste processo"""
+    consultas = _estatisticas['acertos'] + _estatisticas['faltas']
+    return {
+        'pid': os.getpid(),
+        'acertos': _estatisticas['acertos'],
+        'faltas': _estatisticas['faltas'],
+        'erros': _estatisticas['erros'],
+        'taxa_acerto': round(_estatisticas['acertos'] / consultas, 3) if consultas else None,
+    }
@@ -0,0 +1,153 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from functools import partial
+
+from django.db import transaction
+
+from .estrutura import caminho_pacote, invalidar_estrutura
+from .models import Capitulo, Curso
+from .pacotes import PREFIXO_PACOTES, origem_pacotes
+from .progresso import reconstruir_resumos
+
+# O título só é gerado na criação; depois pode ser editado no admin
+CAMPOS_ATUALIZAVEIS = ['url', 'codigo']
+
+# Capítulo encontrado na pasta de pacotes
+CapituloPacote = namedtuple('CapituloPacote', ['ordem', 'tipo', 'titulo', 'url', 'codigo'])
+
+# Diferença entre as pastas e os capítulos cadastrados de um curso
+DiffCurso = namedtuple('DiffCurso', ['curso', 'criar', 'atualizar', 'remover', 'erros'])
+
+
+def escanear_curso(curso, origem=None):
+    """
+    Lê a pasta de pacotes do curso e retorna ({(ordem, tipo): CapituloPacote},
+    incompletos, erros). Pastas capNN viram aulas (ordem N) e capNN_ex
+    exercícios (ordem N.5); pastas sem index.html (ex.: pacote ainda sendo
+    enviado) são recusadas e suas chaves vão para `incompletos`, para que o
+    capítulo já cadastrado não seja tratado como removido. Sem a pasta do
+    curso, retorna (None, set(), erros).
+    """
+    origem = origem or origem_pacotes()
+    nome_pasta = caminho_pacote(curso.nome)[len(PREFIXO_PACOTES):]
+    if not os.path.isdir(os.path.join(origem, nome_pasta)):
+        # Aceita diferença de maiúsculas (ex.: curso "Power BI", pasta Power_bi)
+        semelhantes = [nome for nome in os.listdir(origem) if nome.lower() == nome_pasta.lower()]
+        if not semelhantes:
+            return None, set(), [f"Pasta não encontrada para o curso {curso.nome} em {os.path.join(origem, nome_pasta)}"]
+        nome_pasta = semelhantes[0]
+    pasta_curso = os.path.join(origem, nome_pasta)
+    base = f'{PREFIXO_PACOTES}{nome_pasta}'
+
+    capitulos = {}
+    incompletos = set()
+    erros = []
+    with os.scandir(pasta_curso) as entradas:
+        pastas = sorted(entrada.name for entrada in entradas if entrada.is_dir() and entrada.name.startswith('cap'))
+
+    for nome in pastas:
+        # Extrai o número do capítulo (cap01 -> 1, cap02_ex -> 2)
+        numero = ''.join(filter(str.isdigit, nome.split('_')[0][3:]))
+        if not numero:
+            continue
+        is_exercicio = '_ex' in nome.lower()
+        ordem = Decimal(numero) + (Decimal('0.5') if is_exercicio else 0)
+        tipo = Capitulo.TIPO_EXERCICIO if is_exercicio else Capitulo.TIPO_AULA
+        if not os.path.isfile(os.path.join(pasta_curso, nome, 'index.html')):
+            erros.append(f"{nome}: pasta sem index.html")
+            incompletos.add((ordem, tipo))
+            continue
+
+        if (ordem, tipo) in capitulos:
+            erros.append(f"{nome}: mesma ordem de {capitulos[(ordem, tipo)].codigo}")
+            continue
+
+        capitulos[(ordem, tipo)] = CapituloPacote(
+            ordem=ordem,
+            tipo=tipo,
+            titulo=f"Capítulo {int(ordem)} ({'Exercício' if is_exercicio else 'Aula'})",
+            url=f"{base}/{nome}/index.html",
+            codigo=nome,
+        )
+    return capitulos, incompletos, erros
+
+
+def planejar_importacao(cursos, origem=None, paralelas=8):
+    """
+    Lê as pastas de todos os cursos em paralelo e compara com os capítulos
+    cadastrados (uma consulta). Retorna um DiffCurso por curso; nada é gravado.
+    Só entram em `remover` os capítulos cuja pasta não existe mais.
+    """
+    cursos = list(cursos)
+    with ThreadPoolExecutor(max_workers=paralelas) as pool:
+        escaneados = list(pool.map(lambda curso: escanear_curso(curso, origem), cursos))
+
+    existentes = {}
+    for capitulo in Capitulo.objects.filter(curso__in=cursos):
+        existentes.setdefault(capitulo.curso_id, {})[(capitulo.ordem, capitulo.tipo)] = capitulo
+
+    diffs = []
+    for curso, (pacotes, incompletos, erros) in zip(cursos, escaneados):
+        if pacotes is None:
+            # Sem pasta não há o que comparar; nunca remove os capítulos do curso
+            diffs.append(DiffCurso(curso, [], [], [], erros))
+            continue
+
+        atuais = existentes.get(curso.id, {})
+        criar = []
+        atualizar = []
+        for chave, pacote in pacotes.items():
+            capitulo = atuais.get(chave)
+            if capitulo is None:
+                criar.append(Capitulo(curso=curso, **pacote._asdict()))
+            elif any(getattr(capitulo, campo) != getattr(pacote, campo) for campo in CAMPOS_ATUALIZAVEIS):
+                for campo in CAMPOS_ATUALIZAVEIS:
+                    setattr(capitulo, campo, getattr(pacote, campo))
+                atualizar.append(capitulo)
+        remover = [
+            capitulo for chave, capitulo in atuais.items() if chave not in pacotes and chave not in incompletos
+        ]
+        diffs.append(DiffCurso(curso, criar, atualizar, remover, erros))
+    return diffs
+
+
+def aplicar_importacao(diffs, remover=False):
+    """
+    Grava os diffs numa única transação (bulk_create, bulk_update e, só com
+    remover=True, um DELETE: apagar um capítulo apaga em cascata o progresso
+    dos alunos nele). As operações em lote não disparam os signals de save,
+    então a estrutura e os resumos dos cursos alterados são atualizados aqui.
+    """
+    alterados = [diff.curso.id for diff in diffs if diff.criar or diff.atualizar or (remover and diff.remover)]
+    if not alterados:
+        return []
+
+    with transaction.atomic():
+        Capitulo.objects.bulk_create([capitulo for diff in diffs for capitulo in diff.criar])
+        Capitulo.objects.bulk_update(
+            [capitulo for diff in diffs for capitulo in diff.atualizar], CAMPOS_ATUALIZAVEIS
+        )
+        if remover:
+            Capitulo.objects.filter(id__in=[capitulo.id for diff in diffs for capitulo in diff.remover]).delete()
+
+        # Mesmo esquema dos signals: invalida já e de novo após o commit
+        for curso_id in alterados:
+            invalidar_estrutura(curso_id)
+            transaction.on_commit(partial(invalidar_estrutura, curso_id))
+        reconstruir_resumos(alterados)
+    return alterados
+
+
+def importar_pacotes(cursos=None, origem=None, dry_run=False, remover=False):
+    """
+    Sincroniza os capítulos dos cursos (padrão: todos) com as pastas de pacotes
+    e retorna os diffs. Os capítulos sem pasta só são apagados com remover=True.
+    """
+    if cursos is None:
+        cursos = Curso.objects.all()
+    diffs = planejar_importacao(cursos, origem)
+    if not dry_run:
+        aplicar_importacao(diffs, remover=remover)
+    return diffs
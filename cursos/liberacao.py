@@ -0,0 +1,85 @@
+from collections import namedtuple
+
+from .desnormalizacao import progresso_dos_cursos
+from .estrutura import obter_estrutura
+from .models import Progresso
+from .progresso import aprovados_e_marcados, calcular_percentual, concluidas_por_pares
+
+# Situação de um capítulo (aula ou exercício) para um aluno
+SituacaoCapitulo = namedtuple('SituacaoCapitulo', ['liberado', 'concluido', 'motivo'])
+
+MOTIVO_EXERCICIO_ANTERIOR = "Complete o exercício anterior com nota ≥ 8"
+MOTIVO_CAPITULO_ANTERIOR = "Complete o capítulo anterior"
+MOTIVO_AULA_DO_EXERCICIO = "Complete a aula antes de fazer o exercício"
+
+
+class LiberacaoCurso:
+    """
+    Regras de liberação de um curso para um aluno, calculadas de uma vez:
+    uma aula é liberada quando a anterior foi concluída (exercício com
+    nota >= 8, ou a própria aula marcada quando não há exercício), e um
+    exercício é liberado quando a sua aula foi marcada como concluída.
+    """
+
+    def __init__(self, estrutura, aluno_id, aprovados, marcados):
+        self.estrutura = estrutura
+        self.concluidas = concluidas_por_pares(estrutura.pares(), aluno_id, aprovados, marcados)
+        self.percentual = calcular_percentual(len(self.concluidas), len(estrutura))
+        self.situacoes = {}
+
+        for item in estrutura:
+            if item.anterior_id is None or item.anterior_id in self.concluidas:
+                motivo = None
+            elif estrutura.exercicio_da_aula(item.anterior_id):
+                motivo = MOTIVO_EXERCICIO_ANTERIOR
+            else:
+                motivo = MOTIVO_CAPITULO_ANTERIOR
+            self.situacoes[item.aula.id] = SituacaoCapitulo(
+                motivo is None, item.aula.id in self.concluidas, motivo
+            )
+
+            if item.exercicio:
+                aula_marcada = (aluno_id, item.aula.id) in marcados
+                self.situacoes[item.exercicio.id] = SituacaoCapitulo(
+                    aula_marcada,
+                    (aluno_id, item.exercicio.id) in aprovados,
+                    None if aula_marcada else MOTIVO_AULA_DO_EXERCICIO
+                )
+
+    def situacao(self, capitulo_id):
+        """SituacaoCapitulo da aula ou exercício, ou None se não fizer parte do curso"""
+        return self.situacoes.get(capitulo_id)
+
+    @property
+    def capitulos(self):
+        return [item.aula for item in self.estrutura]
+
+    @property
+    def capitulos_liberados(self):
+        return [item.aula.id for item in self.estrutura if self.situacoes[item.aula.id].liberado]
+
+    @property
+    def mensagens_bloqueio(self):
+        return {
+            item.aula.id: self.situacoes[item.aula.id].motivo
+            for item in self.estrutura
+            if not self.situacoes[item.aula.id].liberado
+        }
+
+
+def calcular_liberacao(aluno, curso_id):
+    """Monta a LiberacaoCurso com a estrutura em cache e uma consulta de Progresso"""
+    estrutura = obter_estrutura(curso_id)
+    aprovados, marcados = aprovados_e_marcados(
+        Progresso.objects.filter(progresso_dos_cursos([curso_id]), aluno_id=aluno.id)
+    )
+    return LiberacaoCurso(estrutura, aluno.id, aprovados, marcados)
+
+
+def liberacao_do_aluno(request, curso_id):
+    """LiberacaoCurso do usuário da requisição, calculada no máximo uma vez por requisição"""
+    if not hasattr(request, '_liberacoes'):
+        request._liberacoes = {}
+    if curso_id not in request._liberacoes:
+        request._liberacoes[curso_id] = calcular_liberacao(request.user, curso_id)
+    return request._liberacoes[curso_id]
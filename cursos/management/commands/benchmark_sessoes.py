@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cursos.benchmark import MODOS_SESSAO, banco_de_teste, popular_banco, tempestade_login
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara sessões no banco, cached_db e cookies assinados (com o usuário logado em cache) '
+        'numa tempestade de logins simulada, num banco de teste populado'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alunos', type=int, default=200, help='Alunos que fazem login')
+        parser.add_argument('--cursos', type=int, default=5)
+        parser.add_argument('--requisicoes', type=int, default=5, help='Navegações de cada aluno após o login')
+        parser.add_argument(
+            '--modo',
+            action='append',
+            dest='modos',
+            choices=sorted(MODOS_SESSAO),
+            help='Modo de sessão a medir (pode ser repetido). Padrão: todos'
+        )
+        parser.add_argument('--keepdb', action='store_true', help='Reaproveita o banco de teste existente')
+
+    def handle(self, *args, **options):
+        if options['alunos'] < 2 or options['requisicoes'] < 1:
+            raise CommandError('Use pelo menos 2 alunos e 1 requisição')
+
+        with banco_de_teste(options['keepdb']) as conexao:
+            self.stdout.write(f"Populando {conexao.vendor}: {options['alunos']} alunos, {options['cursos']} cursos...")
+            dados = popular_banco(options['alunos'], options['cursos'], aulas=4)
+            resultados = {
+                modo: tempestade_login(dados, modo, options['alunos'], options['requisicoes'])
+                for modo in options['modos'] or MODOS_SESSAO
+            }
+
+        self.stdout.write(
+            f"{'modo':<10} {'login p50':>10} {'login p95':>10} {'req p50':>9} {'req p95':>9} "
+            f"{'consultas':>10} {'total s':>8}"
+        )
+        for modo, metricas in resultados.items():
+            self.stdout.write(
+                f"{modo:<10} {metricas['login_p50_ms']:>10.2f} {metricas['login_p95_ms']:>10.2f} "
+                f"{metricas['requisicao_p50_ms']:>9.2f} {metricas['requisicao_p95_ms']:>9.2f} "
+                f"{metricas['consultas_por_requisicao']:>10.2f} {metricas['total_s']:>8.2f}"
+            )
@@ -0,0 +1,72 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cursos.benchmark import CENARIOS, TOLERANCIA, banco_de_teste, comparar, executar_benchmark, popular_banco
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede latência (p50/p95/p99), consultas e memória das views mais usadas num banco '
+        'de teste populado (SQLite ou PostgreSQL, conforme DATABASES) e compara com um baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alunos', type=int, default=200)
+        parser.add_argument('--cursos', type=int, default=5)
+        parser.add_argument('--aulas', type=int, default=10, help='Aulas por curso (cada uma com exercício)')
+        parser.add_argument('--iteracoes', type=int, default=50)
+        parser.add_argument('--aquecimento', type=int, default=5)
+        parser.add_argument(
+            '--view',
+            action='append',
+            dest='views',
+            choices=sorted(CENARIOS),
+            help='View a medir (pode ser repetido). Padrão: todas'
+        )
+        parser.add_argument('--baseline', help='JSON de uma execução anterior para comparar')
+        parser.add_argument('--tolerancia', type=float, default=TOLERANCIA)
+        parser.add_argument('--saida', help='Grava o resultado em JSON (para usar como baseline)')
+        parser.add_argument('--keepdb', action='store_true', help='Reaproveita o banco de teste existente')
+
+    def handle(self, *args, **options):
+        if options['iteracoes'] < 2:
+            raise CommandError('Use pelo menos 2 iterações')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as arquivo:
+                baseline = json.load(arquivo)
+
+        with banco_de_teste(options['keepdb']) as conexao:
+            self.stdout.write(
+                f"Populando {conexao.vendor}: {options['alunos']} alunos, "
+                f"{options['cursos']} cursos, {options['aulas']} aulas por curso..."
+            )
+            dados = popular_banco(options['alunos'], options['cursos'], options['aulas'])
+            resultado = executar_benchmark(dados, options['views'], options['iteracoes'], options['aquecimento'])
+
+        self.stdout.write(f"{'view':<18} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'consultas':>10} {'memória KB':>11}")
+        for nome, metricas in resultado['views'].items():
+            self.stdout.write(
+                f"{nome:<18} {metricas['p50_ms']:>9.2f} {metricas['p95_ms']:>9.2f} {metricas['p99_ms']:>9.2f} "
+                f"{metricas['consultas']:>10} {metricas['memoria_kb']:>11.1f}"
+            )
+
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                json.dump(resultado, arquivo, indent=2, sort_keys=True)
+            self.stdout.write(f"Resultado gravado em {options['saida']}")
+
+        if baseline is None:
+            return
+        if baseline.get('meta', {}).get('banco') not in (None, resultado['meta']['banco']):
+            self.stdout.write(self.style.WARNING(
+                f"Baseline medido em {baseline['meta']['banco']}, execução atual em {resultado['meta']['banco']}"
+            ))
+        regressoes = comparar(resultado, baseline, options['tolerancia'])
+        if not regressoes:
+            self.stdout.write(self.style.SUCCESS('Nenhuma regressão em relação ao baseline'))
+            return
+        for nome, metrica, antes, agora in regressoes:
+            self.stdout.write(self.style.ERROR(f"{nome}: {metrica} {antes} -> {agora}"))
+        raise CommandError(f'{len(regressoes)} regressões em relação ao baseline')
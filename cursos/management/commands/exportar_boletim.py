@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cursos.exportacao import FORMATOS, exportar_boletim
+from usuarios.models import Usuario
+
+
+class Command(BaseCommand):
+    help = 'Exporta o boletim de todos os alunos de uma escola (uma coluna por exercício) em CSV ou XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('escola', help='Username ou ID da escola')
+        parser.add_argument('--formato', choices=sorted(FORMATOS), default='csv')
+        parser.add_argument(
+            '--curso',
+            type=int,
+            action='append',
+            dest='cursos',
+            help='ID do curso a exportar (pode ser repetido). Padrão: todos os cursos da escola'
+        )
+        parser.add_argument('--saida', help='Arquivo de saída. Padrão: saída padrão')
+
+    def handle(self, *args, **options):
+        escolas = Usuario.objects.filter(tipo='escola')
+        escola = escolas.filter(username=options['escola']).first()
+        if escola is None and options['escola'].isdigit():
+            escola = escolas.filter(id=options['escola']).first()
+        if escola is None:
+            raise CommandError(f"Escola não encontrada: {options['escola']}")
+
+        partes = exportar_boletim(escola, options['formato'], options['cursos'])
+        if options['formato'] == 'xlsx':
+            if not options['saida']:
+                raise CommandError('Informe --saida para exportar em XLSX')
+            with open(options['saida'], 'wb') as arquivo:
+                arquivo.writelines(partes)
+        elif options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8', newline='') as arquivo:
+                arquivo.writelines(partes)
+        else:
+            for parte in partes:
+                self.stdout.write(parte, ending='')
+
+        if options['saida']:
+            self.stdout.write(self.style.SUCCESS(f"Boletim de {escola.username} exportado para {options['saida']}"))
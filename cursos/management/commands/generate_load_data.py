@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cursos.carga import gerar_carga
+from usuarios.models import Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera uma base sintética grande e determinística (escolas, professores, alunos, cursos, '
+        'matrículas, progresso e certificados) para reproduzir a carga de produção'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escolas', type=int, default=10)
+        parser.add_argument('--professores', type=int, default=5, help='Professores por escola')
+        parser.add_argument('--alunos', type=int, default=1000, help='Alunos por escola')
+        parser.add_argument('--cursos', type=int, default=20)
+        parser.add_argument('--aulas', type=int, default=12, help='Aulas por curso (cada uma com exercício)')
+        parser.add_argument('--cursos-por-aluno', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefixo', default='carga', help='Prefixo dos usernames e nomes de curso gerados')
+        parser.add_argument('--senha', default='senha123', help='Senha de todos os usuários gerados')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--sem-copy', action='store_true', help='Usa bulk_create mesmo no PostgreSQL')
+
+    def handle(self, *args, **options):
+        if Usuario.objects.filter(username__startswith=f"{options['prefixo']}_").exists():
+            raise CommandError(f"Já existem dados com o prefixo '{options['prefixo']}'; use outro --prefixo")
+
+        resumo = gerar_carga(
+            escolas=options['escolas'],
+            professores=options['professores'],
+            alunos=options['alunos'],
+            cursos=options['cursos'],
+            aulas=options['aulas'],
+            cursos_por_aluno=options['cursos_por_aluno'],
+            seed=options['seed'],
+            prefixo=options['prefixo'],
+            senha=options['senha'],
+            batch_size=options['batch_size'],
+            usar_copy=False if options['sem_copy'] else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumo.escolas} escolas, {resumo.professores} professores, {resumo.alunos} alunos, "
+            f"{resumo.cursos} cursos ({resumo.capitulos} capítulos), {resumo.matriculas} matrículas, "
+            f"{resumo.progressos} progressos e {resumo.certificados} certificados gerados "
+            f"em {resumo.segundos:.1f}s"
+        ))
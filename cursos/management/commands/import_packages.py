@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+
+from cursos.importacao import importar_pacotes
+from cursos.models import Curso
+
+
+class Command(BaseCommand):
+    help = (
+        'Sincroniza os capítulos com as pastas de pacotes Captivate '
+        '(static/cursos/captivate_packages/<curso>/capNN[_ex]) em uma única transação'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--curso',
+            type=int,
+            action='append',
+            dest='cursos',
+            help='ID do curso a importar (pode ser repetido). Padrão: todos os cursos'
+        )
+        parser.add_argument('--origem', help='Pasta dos pacotes. Padrão: static/cursos/captivate_packages')
+        parser.add_argument('--dry-run', action='store_true', help='Mostra o que mudaria sem gravar nada')
+        parser.add_argument(
+            '--remover',
+            action='store_true',
+            help='Apaga os capítulos cuja pasta não existe mais (e o progresso dos alunos neles). '
+                 'Sem esta opção eles são só listados'
+        )
+
+    def handle(self, *args, **options):
+        cursos = Curso.objects.all()
+        if options['cursos']:
+            cursos = cursos.filter(id__in=options['cursos'])
+
+        remover = options['remover']
+        diffs = importar_pacotes(cursos, origem=options['origem'], dry_run=options['dry_run'], remover=remover)
+
+        for diff in diffs:
+            self.stdout.write(
+                f'{diff.curso.nome}: {len(diff.criar)} a criar, {len(diff.atualizar)} a atualizar, '
+                + (f'{len(diff.remover)} a remover' if remover else f'{len(diff.remover)} sem pasta (mantidos)')
+            )
+            if options['verbosity'] > 1 or options['dry_run']:
+                for capitulo in diff.criar:
+                    self.stdout.write(f'  + {capitulo.codigo}')
+                for capitulo in diff.atualizar:
+                    self.stdout.write(f'  ~ {capitulo.codigo}')
+                for capitulo in diff.remover:
+                    self.stdout.write(f'  - {capitulo.codigo or capitulo.ordem} (remove também o progresso dos alunos)')
+            for erro in diff.erros:
+                self.stdout.write(self.style.WARNING(f'  {erro}'))
+
+        if not remover and any(diff.remover for diff in diffs):
+            self.stdout.write(self.style.WARNING(
+                'Capítulos sem pasta foram mantidos; rode com --remover para apagá-los junto com o progresso dos alunos'
+            ))
+        total = sum(len(diff.criar) + len(diff.atualizar) + (len(diff.remover) if remover else 0) for diff in diffs)
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{total} alterações encontradas (nada foi gravado)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{total} alterações gravadas em {len(diffs)} cursos'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from cursos.desnormalizacao import TAMANHO_LOTE, preencher_curso_progresso
+from cursos.models import Capitulo, Progresso
+
+
+class Command(BaseCommand):
+    help = (
+        'Preenche o curso desnormalizado dos registros de Progresso que ainda não o têm, em lotes '
+        'curtos e retomáveis. A migração 0013 já faz isso; o build e o início do web rodam de novo para '
+        'pegar registros gravados pela versão anterior durante o deploy'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=TAMANHO_LOTE, help='Faixa de ids por transação')
+        parser.add_argument('--pausa', type=float, default=0, help='Segundos de espera entre as faixas')
+
+    def handle(self, *args, **options):
+        def mostrar(preenchidos, ultimo_id):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{preenchidos} preenchidos (até o id {ultimo_id})')
+
+        total = preencher_curso_progresso(
+            Progresso, Capitulo, batch_size=options['batch_size'], pausa=options['pausa'], progresso=mostrar
+        )
+        self.stdout.write(self.style.SUCCESS(f'{total} registros de progresso preenchidos'))
@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cursos.fila import modo_assincrono, processar_lote, situacao_fila
+
+# Espera entre as voltas do worker ocioso: sem NOTAS_ASSINCRONAS nada entra na fila
+INTERVALO_OCIOSO = 60 * 60
+
+
+class Command(BaseCommand):
+    help = (
+        'Aplica em lotes as notas recebidas no modo assíncrono (fila NotaPendente). Com '
+        'NOTAS_ASSINCRONAS desligado, aplica o que restou na fila e fica ocioso, sem consultar o banco'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=1.0,
+            help='Segundos de espera quando a fila está vazia'
+        )
+        parser.add_argument('--uma-vez', action='store_true', help='Esvazia a fila e termina')
+        parser.add_argument('--status', action='store_true', help='Mostra a profundidade da fila e termina')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            situacao = situacao_fila()
+            self.stdout.write(
+                f"Pendentes: {situacao['pendentes']} | Com erro: {situacao['com_erro']} | "
+                f"Mais antiga: {situacao['mais_antiga'] or '-'}"
+            )
+            return
+
+        if options['uma_vez']:
+            total = self.esvaziar(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'{total} notas processadas'))
+            return
+
+        if not modo_assincrono():
+            # Notas enfileiradas antes de o modo ser desligado ainda são aplicadas; depois
+            # o processo só dorme (se terminasse, a plataforma o reiniciaria em seguida)
+            total = self.esvaziar(options['batch_size'])
+            self.stdout.write(f'{total} notas processadas; NOTAS_ASSINCRONAS desligado, worker ocioso')
+            self.stdout.flush()
+            while True:
+                time.sleep(INTERVALO_OCIOSO)
+
+        while True:
+            if not self.esvaziar(options['batch_size']):
+                time.sleep(options['intervalo'])
+
+    def esvaziar(self, batch_size):
+        """Processa lotes até a fila ficar vazia e retorna quantas notas foram processadas"""
+        total = 0
+        while processadas := processar_lote(limite=batch_size):
+            total += processadas
+        return total
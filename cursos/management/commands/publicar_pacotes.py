@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from cursos.pacotes import brotli, destino_pacotes, publicar_pacotes
+
+
+class Command(BaseCommand):
+    help = (
+        'Publica os pacotes Captivate em URLs versionadas por hash, com arquivos de texto '
+        'pré-comprimidos, copiando e comprimindo apenas os arquivos cujo conteúdo mudou'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--origem', help='Pasta dos pacotes. Padrão: static/cursos/captivate_packages')
+        parser.add_argument('--destino', help='Pasta de publicação. Padrão: settings.PACOTES_ROOT')
+        parser.add_argument(
+            '--manter',
+            type=int,
+            default=2,
+            help='Versões mantidas por pacote (as anteriores ainda servem páginas já abertas)'
+        )
+        parser.add_argument('--processos', type=int, help='Processos para hash e compressão. Padrão: núcleos da CPU')
+
+    def handle(self, *args, **options):
+        if brotli is None:
+            self.stdout.write(self.style.WARNING('Brotli não instalado: gerando apenas .gz'))
+
+        relatorio = publicar_pacotes(
+            options['origem'], options['destino'], options['manter'], options['processos']
+        )
+        publicados = [nome for nome, (_, publicado) in relatorio.pacotes.items() if publicado]
+        for nome in publicados:
+            self.stdout.write(f'  {nome} -> {relatorio.pacotes[nome][0]}')
+
+        self.stdout.write(
+            f'{relatorio.arquivos} arquivos: {relatorio.alterados} alterados desde a última publicação, '
+            f'{relatorio.comprimidos} comprimidos'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(publicados)} pacotes publicados, {len(relatorio.pacotes) - len(publicados)} sem alteração '
+            f'em {options["destino"] or destino_pacotes()} ({relatorio.segundos:.1f}s, '
+            f'~{relatorio.segundos_economizados:.1f}s economizados)'
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from cursos.progresso import reconstruir_resumos
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói do zero a tabela de resumos de progresso (ResumoProgresso)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--curso',
+            type=int,
+            action='append',
+            dest='cursos',
+            help='ID do curso a reconstruir (pode ser repetido). Padrão: todos os cursos'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = reconstruir_resumos(options['cursos'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{total} resumos de progresso reconstruídos'))
@@ -0,0 +1,277 @@
+import gzip
+import json
+import logging
+import time
+import uuid
+import zlib
+from array import array
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .desnormalizacao import progresso_dos_cursos
+from .estrutura import obter_estrutura
+from .models import Curso, Progresso
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_MAPA_CALOR = 60 * 60 * 24
+# Trava curta da atualização no lugar; quem não a consegue descarta o mapa
+TEMPO_TRAVA = 5
+# Validade da marca de mapa em montagem (deve passar do tempo de montar o mapa de um curso)
+TEMPO_MONTAGEM = 60
+
+# Célula sem registro de Progresso (em `concluido`) ou sem nota (em `notas`)
+VAZIO = -1
+# Nos registros de atualização: mantém a nota que já está na célula
+MANTER = object()
+
+
+def _cache():
+    return caches[getattr(settings, 'MAPA_CALOR_CACHE', 'default')]
+
+
+def _chave_mapa(curso_id):
+    return f'cursos:mapa_calor:{curso_id}'
+
+
+def _chave_versao(curso_id):
+    return f'cursos:mapa_calor:{curso_id}:versao'
+
+
+def _chave_obsoleto(curso_id):
+    return f'cursos:mapa_calor:{curso_id}:obsoleto'
+
+
+def _chave_montando(curso_id):
+    return f'cursos:mapa_calor:{curso_id}:montando'
+
+
+def _nota_em_centesimos(nota):
+    return VAZIO if nota is None else int(round(nota * 100))
+
+
+class MapaCalor:
+    """
+    Matriz aluno × capítulo de um curso, linha a linha em dois arrays
+    compactos: `concluido` (array 'b': -1 sem registro, 0 ou 1) e `notas`
+    (array 'h', em centésimos, -1 sem nota). Guarda as versões da estrutura
+    e do mapa com que foi montada, para o cache saber se ainda vale.
+    """
+    __slots__ = ('curso_id', 'nome', 'versao', 'versao_estrutura', 'alunos', 'capitulos',
+                 'concluido', 'notas', '_linhas', '_colunas')
+
+    def __init__(self, curso_id, nome, versao, versao_estrutura, alunos, capitulos, concluido=None, notas=None):
+        self.curso_id = curso_id
+        self.nome = nome
+        self.versao = versao
+        self.versao_estrutura = versao_estrutura
+        # [(aluno_id, nome)] e [(capitulo_id, titulo, tipo, ordem)] na ordem das linhas e colunas
+        self.alunos = list(alunos)
+        self.capitulos = list(capitulos)
+        celulas = len(self.alunos) * len(self.capitulos)
+        self.concluido = concluido if concluido is not None else array('b', [VAZIO]) * celulas
+        self.notas = notas if notas is not None else array('h', [VAZIO]) * celulas
+        self._linhas = {aluno_id: indice for indice, (aluno_id, _) in enumerate(self.alunos)}
+        self._colunas = {capitulo[0]: indice for indice, capitulo in enumerate(self.capitulos)}
+
+    def __reduce__(self):
+        # Os arrays vão comprimidos para o cache: a maior parte das células é igual
+        return (_restaurar_mapa, (
+            self.curso_id, self.nome, self.versao, self.versao_estrutura, self.alunos, self.capitulos,
+            zlib.compress(self.concluido.tobytes(), 1), zlib.compress(self.notas.tobytes(), 1),
+        ))
+
+    def celula(self, aluno_id, capitulo_id):
+        """Posição da célula nos arrays, ou None se o aluno ou o capítulo não estiverem no mapa"""
+        linha = self._linhas.get(aluno_id)
+        coluna = self._colunas.get(capitulo_id)
+        if linha is None or coluna is None:
+            return None
+        return linha * len(self.capitulos) + coluna
+
+    def atualizar(self, aluno_id, capitulo_id, concluido, nota=MANTER):
+        """Grava uma célula (concluido=None apaga o registro); retorna False se ela não estiver no mapa"""
+        posicao = self.celula(aluno_id, capitulo_id)
+        if posicao is None:
+            return False
+        if concluido is None:
+            self.concluido[posicao] = VAZIO
+            self.notas[posicao] = VAZIO
+            return True
+        self.concluido[posicao] = int(concluido)
+        if nota is not MANTER:
+            self.notas[posicao] = _nota_em_centesimos(nota)
+        return True
+
+    def como_dict(self):
+        return {
+            'curso': {'id': self.curso_id, 'nome': self.nome},
+            'versao': self.versao,
+            'alunos': [{'id': aluno_id, 'nome': nome} for aluno_id, nome in self.alunos],
+            'capitulos': [
+                {'id': capitulo_id, 'titulo': titulo, 'tipo': tipo, 'ordem': ordem}
+                for capitulo_id, titulo, tipo, ordem in self.capitulos
+            ],
+            # Linha a linha (aluno × capítulo); notas em centésimos
+            'concluido': self.concluido.tolist(),
+            'notas': self.notas.tolist(),
+        }
+
+    def json_comprimido(self):
+        """Payload JSON compacto do mapa, comprimido com gzip"""
+        conteudo = json.dumps(self.como_dict(), separators=(',', ':'), ensure_ascii=False).encode()
+        return gzip.compress(conteudo, compresslevel=5, mtime=0)
+
+
+def _restaurar_mapa(curso_id, nome, versao, versao_estrutura, alunos, capitulos, concluido, notas):
+    return MapaCalor(
+        curso_id, nome, versao, versao_estrutura, alunos, capitulos,
+        array('b', zlib.decompress(concluido)), array('h', zlib.decompress(notas)),
+    )
+
+
+def versao_mapa(curso_id):
+    """Versão atual do mapa do curso (muda a cada gravação de Progresso ou matrícula)"""
+    cache = _cache()
+    versao = cache.get(_chave_versao(curso_id))
+    if versao is None:
+        # Versão inicial única, para não reaproveitar um mapa antigo se a chave expirar
+        cache.add(_chave_versao(curso_id), time.time_ns(), None)
+        versao = cache.get(_chave_versao(curso_id))
+    return versao
+
+
+def _nova_versao(curso_id):
+    # Uma versão nova e única, e não um incr: no DatabaseCache o incr é leitura
+    # seguida de gravação, e duas gravações simultâneas podiam chegar ao mesmo número
+    versao = time.time_ns()
+    _cache().set(_chave_versao(curso_id), versao, None)
+    return versao
+
+
+def invalidar_mapas(cursos_ids):
+    """Descarta os mapas dos cursos (ex.: matrículas mudaram): são remontados na próxima leitura"""
+    cache = _cache()
+    for curso_id in set(cursos_ids):
+        try:
+            # A marca vem antes da versão: quem estiver atualizando o mapa agora
+            # pode sobrescrever a versão, mas vê a marca e descarta o que gravou
+            cache.set(_chave_obsoleto(curso_id), True, TEMPO_TRAVA)
+            _nova_versao(curso_id)
+        except Exception:
+            logger.warning('Não foi possível invalidar o mapa de calor do curso %s', curso_id, exc_info=True)
+
+
+def montar_mapa(curso_id, versao, versao_estrutura=None):
+    """
+    Monta o mapa do curso: alunos matriculados em ordem de nome, capítulos na
+    ordem da estrutura (cada aula seguida do seu exercício) e as células com
+    uma única consulta de Progresso (índice curso, capitulo).
+    """
+    nome_curso = Curso.objects.values_list('nome', flat=True).get(id=curso_id)
+    estrutura = obter_estrutura(curso_id)
+    capitulos = []
+    for item in estrutura:
+        capitulos.append((item.aula.id, item.aula.titulo, 'aula', str(item.aula.ordem)))
+        if item.exercicio:
+            capitulos.append((item.exercicio.id, item.exercicio.titulo, 'exercicio', str(item.exercicio.ordem)))
+    alunos = [
+        (aluno_id, f'{nome} {sobrenome}'.strip() or username)
+        for aluno_id, nome, sobrenome, username in Curso.alunos.through.objects.filter(curso_id=curso_id).order_by(
+            'usuario__first_name', 'usuario__last_name', 'usuario__username'
+        ).values_list('usuario_id', 'usuario__first_name', 'usuario__last_name', 'usuario__username')
+    ]
+    mapa = MapaCalor(curso_id, nome_curso, versao, versao_estrutura or estrutura.versao, alunos, capitulos)
+
+    progressos = Progresso.objects.filter(progresso_dos_cursos([curso_id])).values_list(
+        'aluno_id', 'capitulo_id', 'concluido', 'nota'
+    )
+    for aluno_id, capitulo_id, concluido, nota in progressos.iterator(chunk_size=5000):
+        mapa.atualizar(aluno_id, capitulo_id, concluido, nota)
+    return mapa
+
+
+def obter_mapa(curso_id):
+    """
+    Mapa do curso do cache, se tiver sido montado (ou atualizado no lugar)
+    na versão atual do mapa e da estrutura; senão monta e guarda de novo.
+    Levanta Curso.DoesNotExist se o curso não existir.
+    """
+    cache = _cache()
+    versao = versao_mapa(curso_id)
+    versao_estrutura = obter_estrutura(curso_id).versao
+    mapa = cache.get(_chave_mapa(curso_id))
+    if mapa is not None and mapa.versao == versao and mapa.versao_estrutura == versao_estrutura:
+        return mapa
+
+    # A marca de montagem vem antes da versão, que vem antes da consulta: uma
+    # gravação durante a montagem vê a marca e muda a versão (ver
+    # atualizar_mapas), e o mapa guardado com a versão antiga é descartado na
+    # leitura seguinte
+    cache.set(_chave_montando(curso_id), True, TEMPO_MONTAGEM)
+    mapa = montar_mapa(curso_id, versao_mapa(curso_id), versao_estrutura)
+    cache.set(_chave_mapa(curso_id), mapa, getattr(settings, 'MAPA_CALOR_TIMEOUT', TIMEOUT_MAPA_CALOR))
+    cache.delete(_chave_montando(curso_id))
+    return mapa
+
+
+def atualizar_mapas(registros):
+    """
+    Aplica nos mapas em cache as gravações de Progresso já confirmadas,
+    [(curso_id, aluno_id, capitulo_id, concluido, nota)], sem remontá-los
+    (concluido=None para registro apagado; nota=MANTER para não mexer na
+    nota). Cursos sem mapa em cache nem em montagem (nenhum professor o
+    abriu) custam uma leitura e mais nada. Os demais são alterados sob uma
+    trava curta; se ela estiver ocupada, ou se a célula não existir no mapa
+    (aluno ou capítulo novo), o mapa é só invalidado. Quem tem a trava
+    confere, depois de gravar, se outra gravação invalidou o mapa nesse meio
+    tempo; se sim, descarta o mapa.
+    """
+    por_curso = defaultdict(list)
+    for curso_id, *registro in registros:
+        if curso_id is not None:
+            por_curso[curso_id].append(registro)
+
+    cache = _cache()
+    for curso_id, registros_do_curso in por_curso.items():
+        try:
+            # A gravação já foi confirmada: uma montagem que comece depois desta leitura já a enxerga
+            if not cache.get_many([_chave_mapa(curso_id), _chave_montando(curso_id)]):
+                continue
+            trava = f'{_chave_mapa(curso_id)}:trava'
+            dono = uuid.uuid4().hex
+            if not cache.add(trava, dono, TEMPO_TRAVA):
+                invalidar_mapas([curso_id])
+                continue
+            try:
+                atual = cache.get_many([_chave_versao(curso_id), _chave_mapa(curso_id)])
+                versao = atual.get(_chave_versao(curso_id))
+                mapa = atual.get(_chave_mapa(curso_id))
+                nova_versao = _nova_versao(curso_id)
+                # Sem mapa, ou um mapa de antes de outra gravação: a nova versão basta para descartá-lo
+                if mapa is None or mapa.versao != versao:
+                    continue
+                if all([mapa.atualizar(*registro) for registro in registros_do_curso]):
+                    mapa.versao = nova_versao
+                    cache.set(_chave_mapa(curso_id), mapa, getattr(settings, 'MAPA_CALOR_TIMEOUT', TIMEOUT_MAPA_CALOR))
+                    # Uma gravação sem a trava pode ter trocado a versão antes da nossa
+                    # sobrescrevê-la: o mapa gravado não tem a célula dela
+                    if cache.get(_chave_obsoleto(curso_id)) is not None:
+                        cache.delete_many([_chave_mapa(curso_id), _chave_obsoleto(curso_id)])
+            finally:
+                # A trava pode ter expirado e sido pega por outro: só apaga a nossa
+                if cache.get(trava) == dono:
+                    cache.delete(trava)
+        except Exception:
+            logger.warning('Não foi possível atualizar o mapa de calor do curso %s', curso_id, exc_info=True)
+
+
+def professor_do_curso(usuario, curso_id):
+    """Se o usuário pode ver o mapa do curso: professor dele ou equipe"""
+    if usuario.is_staff:
+        return True
+    return usuario.tipo == 'professor' and Curso.professores.through.objects.filter(
+        curso_id=curso_id, usuario_id=usuario.id
+    ).exists()
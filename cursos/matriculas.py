@@ -0,0 +1,193 @@
+import csv
+import io
+import re
+from collections import namedtuple
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from usuarios.models import Usuario
+
+from .mapa_calor import invalidar_mapas
+from .models import Curso
+
+TIMEOUT_MATRICULAS = 60 * 60
+MAX_MATRICULAS_POR_LOTE = 5000
+
+# Resultado de uma matrícula em lote: identificadores (como enviados) em cada situação
+ResultadoMatricula = namedtuple('ResultadoMatricula', ['adicionados', 'ja_matriculados', 'desconhecidos'])
+
+# Nomes de coluna aceitos como cabeçalho no CSV de matrícula
+CABECALHOS_CSV = {'username', 'usuario', 'usuário', 'email', 'e-mail', 'cpf', 'aluno', 'identificador'}
+
+Matricula = Curso.alunos.through
+OfertaEscola = Curso.escolas.through
+
+
+def _chave(usuario_id):
+    return f'cursos:matriculas:{usuario_id}'
+
+
+def esta_matriculado(usuario_id, curso_id):
+    """Consulta direta (EXISTS) ao banco, sem cache: use onde a resposta precisa ser exata, como ao gravar notas"""
+    return Matricula.objects.filter(usuario_id=usuario_id, curso_id=curso_id).exists()
+
+
+def cursos_matriculados(usuario_id):
+    """frozenset com os ids dos cursos em que o usuário está matriculado, em cache (ver invalidar_matriculas)"""
+    cursos_ids = cache.get(_chave(usuario_id))
+    if cursos_ids is None:
+        cursos_ids = frozenset(
+            Matricula.objects.filter(usuario_id=usuario_id).values_list('curso_id', flat=True)
+        )
+        cache.set(_chave(usuario_id), cursos_ids, TIMEOUT_MATRICULAS)
+    return cursos_ids
+
+
+def invalidar_matriculas(usuarios_ids):
+    cache.delete_many([_chave(usuario_id) for usuario_id in set(usuarios_ids)])
+
+
+def aluno_matriculado(request, curso_id):
+    """Se o usuário da requisição está matriculado no curso (conjunto em cache, lido uma vez por requisição)"""
+    if not hasattr(request, '_cursos_matriculados'):
+        request._cursos_matriculados = cursos_matriculados(request.user.id)
+    return curso_id in request._cursos_matriculados
+
+
+def escola_tem_acesso(request, curso_id):
+    """Se o curso é oferecido à escola da requisição (Curso.escolas), com um EXISTS por curso e requisição"""
+    if not hasattr(request, '_acesso_escola'):
+        request._acesso_escola = {}
+    if curso_id not in request._acesso_escola:
+        request._acesso_escola[curso_id] = OfertaEscola.objects.filter(
+            usuario_id=request.user.id, curso_id=curso_id
+        ).exists()
+    return request._acesso_escola[curso_id]
+
+
+def _digitos_cpf(valor):
+    digitos = re.sub(r'\D', '', valor or '')
+    return digitos if len(digitos) == 11 else None
+
+
+def resolver_alunos(identificadores, escola=None):
+    """
+    Encontra os alunos por username, e-mail (sem diferenciar maiúsculas) ou
+    CPF (com ou sem pontuação) com uma única consulta. Retorna
+    {identificador: aluno_id} só com os encontrados; com `escola`, só
+    alunos dela.
+    """
+    usernames = set(identificadores)
+    emails = {identificador.lower() for identificador in identificadores if '@' in identificador}
+    cpfs = set()
+    for identificador in identificadores:
+        digitos = _digitos_cpf(identificador)
+        if digitos:
+            cpfs.update({digitos, f'{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}'})
+
+    alunos = Usuario.objects.filter(tipo='aluno').annotate(email_normalizado=Lower('email')).filter(
+        Q(username__in=usernames) | Q(email_normalizado__in=emails) | Q(cpf__in=cpfs)
+    )
+    if escola is not None:
+        alunos = alunos.filter(escola=escola)
+
+    por_username, por_email, por_cpf = {}, {}, {}
+    for aluno_id, username, email, cpf in alunos.values_list('id', 'username', 'email_normalizado', 'cpf'):
+        por_username[username] = aluno_id
+        if email:
+            por_email[email] = aluno_id
+        if _digitos_cpf(cpf):
+            por_cpf[_digitos_cpf(cpf)] = aluno_id
+
+    encontrados = {}
+    for identificador in identificadores:
+        aluno_id = (
+            por_username.get(identificador)
+            or por_email.get(identificador.lower())
+            or por_cpf.get(_digitos_cpf(identificador))
+        )
+        if aluno_id:
+            encontrados[identificador] = aluno_id
+    return encontrados
+
+
+def matricular(curso, alunos_ids):
+    """
+    Matricula os alunos no curso numa transação: uma consulta para os já
+    matriculados e um INSERT em lote na tabela de matrículas. Retorna
+    (ids adicionados, ids que já estavam matriculados).
+    """
+    alunos_ids = set(alunos_ids)
+    with transaction.atomic():
+        ja_matriculados = set(
+            Matricula.objects.filter(curso_id=curso.id, usuario_id__in=alunos_ids).values_list('usuario_id', flat=True)
+        )
+        novos = alunos_ids - ja_matriculados
+        # ignore_conflicts cobre matrículas feitas em paralelo entre a consulta e o INSERT
+        Matricula.objects.bulk_create(
+            [Matricula(curso_id=curso.id, usuario_id=aluno_id) for aluno_id in novos],
+            ignore_conflicts=True,
+            batch_size=1000
+        )
+        # bulk_create não dispara m2m_changed
+        invalidar_matriculas(novos)
+        transaction.on_commit(partial(invalidar_matriculas, novos))
+        if novos:
+            invalidar_mapas([curso.id])
+            transaction.on_commit(partial(invalidar_mapas, [curso.id]))
+    return novos, ja_matriculados
+
+
+def matricular_em_lote(curso, identificadores, escola=None):
+    """Resolve os identificadores (ver resolver_alunos) e matricula os encontrados; retorna um ResultadoMatricula"""
+    identificadores = list(dict.fromkeys(
+        identificador.strip() for identificador in identificadores if identificador and identificador.strip()
+    ))
+    encontrados = resolver_alunos(identificadores, escola)
+    novos, _ = matricular(curso, encontrados.values())
+
+    resultado = ResultadoMatricula([], [], [])
+    informados = set()
+    for identificador in identificadores:
+        aluno_id = encontrados.get(identificador)
+        if aluno_id is None:
+            resultado.desconhecidos.append(identificador)
+        elif aluno_id in novos and aluno_id not in informados:
+            resultado.adicionados.append(identificador)
+        else:
+            # Inclui o mesmo aluno informado duas vezes (ex.: username e CPF)
+            resultado.ja_matriculados.append(identificador)
+        informados.add(aluno_id)
+    return resultado
+
+
+def ler_identificadores_csv(arquivo):
+    """
+    Lê os identificadores de um CSV enviado (UTF-8 ou Latin-1, separado por
+    vírgula, ponto e vírgula ou tab). Com cabeçalho, usa a primeira coluna
+    reconhecida (username, email, cpf...); sem cabeçalho, a primeira coluna.
+    """
+    conteudo = arquivo.read()
+    try:
+        texto = conteudo.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        texto = conteudo.decode('latin-1')
+    try:
+        dialeto = csv.Sniffer().sniff(texto[:2048], delimiters=',;\t')
+    except csv.Error:
+        dialeto = csv.excel
+
+    linhas = csv.reader(io.StringIO(texto), dialeto)
+    primeira = next(linhas, None)
+    if primeira is None:
+        return []
+    cabecalho = [celula.strip().lower() for celula in primeira]
+    colunas = [indice for indice, nome in enumerate(cabecalho) if nome in CABECALHOS_CSV]
+    coluna = colunas[0] if colunas else 0
+    identificadores = [] if colunas else primeira[:1]
+    identificadores.extend(linha[coluna] for linha in linhas if len(linha) > coluna)
+    return identificadores
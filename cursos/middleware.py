@@ -0,0 +1,64 @@
+import random
+
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .consultas import MonitorConsultas, registrar_requisicao
+
+
+class PacotesWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise servindo também os pacotes Captivate publicados (publicar_pacotes).
+    Cada versão fica numa URL com o hash do conteúdo, então os arquivos são
+    imutáveis: Cache-Control de longa duração, .br/.gz pré-comprimidos
+    conforme o Accept-Encoding e suporte a Range (áudio e vídeo). Só são
+    servidos os arquivos das versões (<curso>/<capítulo>/<hash>/...): o
+    manifesto e o índice na raiz mudam a cada publicação e as pastas
+    temporárias (.<hash>.tmp) ainda estão sendo montadas.
+    """
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        self.pacotes_prefix = settings.PACOTES_URL
+        if settings.PACOTES_ROOT.is_dir():
+            self.add_files(settings.PACOTES_ROOT, prefix=self.pacotes_prefix)
+
+    def arquivo_publicado(self, url):
+        if not url.startswith(self.pacotes_prefix):
+            return True
+        partes = url[len(self.pacotes_prefix):].split('/')
+        return len(partes) > 3 and not any(parte.startswith('.') for parte in partes)
+
+    def add_file_to_dictionary(self, url, path, stat_cache=None):
+        if self.arquivo_publicado(url):
+            super().add_file_to_dictionary(url, path, stat_cache=stat_cache)
+
+    def find_file(self, url):
+        # Com autorefresh (DEBUG) os arquivos são procurados a cada requisição
+        if self.arquivo_publicado(url):
+            return super().find_file(url)
+
+    def immutable_file_test(self, path, url):
+        if url.startswith(self.pacotes_prefix):
+            return True
+        return super().immutable_file_test(path, url)
+
+
+class OrcamentoConsultasMiddleware:
+    """
+    Mede as consultas de uma fração das requisições (settings.CONSULTAS_AMOSTRAGEM,
+    de 0 a 1) e registra no log quantidade, tempo, orçamento e suspeitas de N+1.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.amostragem = getattr(settings, 'CONSULTAS_AMOSTRAGEM', 0)
+
+    def __call__(self, request):
+        if not self.amostragem or random.random() >= self.amostragem:
+            return self.get_response(request)
+
+        with MonitorConsultas() as monitor:
+            response = self.get_response(request)
+        registrar_requisicao(request, response, monitor)
+        return response
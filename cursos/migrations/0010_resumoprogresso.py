@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-18 09:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cursos', '0009_remove_curso_escola_curso_escolas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoProgresso',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('aulas_concluidas', models.PositiveIntegerField(default=0)),
+                ('exercicios_aprovados', models.PositiveIntegerField(default=0)),
+                ('percentual', models.PositiveSmallIntegerField(default=0)),
+                ('melhor_nota', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('media_notas', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('ultima_atividade', models.DateTimeField(blank=True, null=True)),
+                ('aluno', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos_progresso', to=settings.AUTH_USER_MODEL)),
+                ('curso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos_progresso', to='cursos.curso')),
+            ],
+            options={
+                'verbose_name': 'Resumo de Progresso',
+                'verbose_name_plural': 'Resumos de Progresso',
+                'unique_together': {('aluno', 'curso')},
+            },
+        ),
+    ]
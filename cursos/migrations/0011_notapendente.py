@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 09:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cursos', '0010_resumoprogresso'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotaPendente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nota', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('recebida_em', models.DateTimeField(auto_now_add=True)),
+                ('processada_em', models.DateTimeField(blank=True, null=True)),
+                ('erro', models.CharField(blank=True, max_length=200)),
+                ('aluno', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notas_pendentes', to=settings.AUTH_USER_MODEL)),
+                ('capitulo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cursos.capitulo')),
+            ],
+            options={
+                'verbose_name': 'Nota Pendente',
+                'verbose_name_plural': 'Notas Pendentes',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('processada_em__isnull', True)), fields=['aluno'], name='nota_pendente_aluno_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Coluna nula e sem índice: no PostgreSQL o ADD COLUMN não reescreve a tabela"""
+
+    dependencies = [
+        ('cursos', '0011_notapendente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='progresso',
+            name='curso',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='cursos.curso'),
+        ),
+    ]
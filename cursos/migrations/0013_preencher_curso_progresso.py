@@ -0,0 +1,20 @@
+from django.db import migrations
+
+from cursos.desnormalizacao import preencher_curso_progresso
+
+
+def preencher(apps, schema_editor):
+    preencher_curso_progresso(apps.get_model('cursos', 'Progresso'), apps.get_model('cursos', 'Capitulo'))
+
+
+class Migration(migrations.Migration):
+    # Cada faixa de ids é uma transação própria: interrompida, a migração recomeça das linhas ainda nulas
+    atomic = False
+
+    dependencies = [
+        ('cursos', '0012_progresso_curso'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher, migrations.RunPython.noop, elidable=True),
+    ]
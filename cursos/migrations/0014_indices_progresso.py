@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+
+class AdicionarIndiceSemBloqueio(migrations.AddIndex):
+    """AddIndex com CREATE INDEX CONCURRENTLY no PostgreSQL, para não bloquear as gravações no Progresso"""
+
+    def _concorrente(self, schema_editor):
+        return {'concurrently': True} if schema_editor.connection.vendor == 'postgresql' else {}
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, **self._concorrente(schema_editor))
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, **self._concorrente(schema_editor))
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY não roda dentro de transação
+    atomic = False
+
+    dependencies = [
+        ('cursos', '0013_preencher_curso_progresso'),
+    ]
+
+    operations = [
+        AdicionarIndiceSemBloqueio(
+            model_name='progresso',
+            index=models.Index(fields=['aluno', 'curso'], name='progresso_aluno_curso_idx'),
+        ),
+        AdicionarIndiceSemBloqueio(
+            model_name='progresso',
+            index=models.Index(fields=['curso', 'capitulo'], name='progresso_curso_cap_idx'),
+        ),
+        AdicionarIndiceSemBloqueio(
+            model_name='progresso',
+            index=models.Index(fields=['aluno', 'concluido'], name='progresso_aluno_concl_idx'),
+        ),
+    ]
@@ -37,45 +37,23 @@ class Curso(models.Model):
         """Retorna apenas capítulos do tipo aula, ordenados"""
         return self.capitulo_set.filter(tipo='aula').order_by('ordem')
 
+    def get_estrutura(self):
+        """Retorna a estrutura (em cache) das aulas e exercícios do curso"""
+        from .estrutura import obter_estrutura
+        return obter_estrutura(self.id)
+
     def get_progresso_aluno(self, aluno):
         """Retorna o progresso de um aluno neste curso"""
+        from .desnormalizacao import progresso_dos_cursos
         return Progresso.objects.filter(
-            aluno=aluno,
-            capitulo__curso=self
+            progresso_dos_cursos([self.id]),
+            aluno=aluno
         ).select_related('capitulo')
 
     def progresso_percentual(self, aluno):
         """Calcula o progresso baseado apenas em aulas, considerando exercícios relacionados"""
-        capitulos_aula = self.get_capitulos_aula()
-        total = capitulos_aula.count()
-        if total == 0:
-            return 0
-
-        concluidos = 0
-
-        for aula in capitulos_aula:
-            exercicio = aula.get_exercicio_relacionado()
-
-            if exercicio:
-                # Para aulas com exercício: verifica se o exercício foi aprovado
-                progresso_ex = Progresso.objects.filter(
-                    aluno=aluno,
-                    capitulo=exercicio,
-                    nota__gte=8
-                ).first()
-                if progresso_ex:
-                    concluidos += 1
-            else:
-                # Para aulas sem exercício: verifica se a aula foi concluída
-                progresso_aula = Progresso.objects.filter(
-                    aluno=aluno,
-                    capitulo=aula,
-                    concluido=True
-                ).first()
-                if progresso_aula:
-                    concluidos += 1
-
-        return int((concluidos / total) * 100)
+        from .progresso import progresso_do_aluno
+        return progresso_do_aluno(aluno, [self])[self.id]
 
 
 class Capitulo(models.Model):
@@ -139,7 +117,11 @@ class Capitulo(models.Model):
 
     def save(self, *args, **kwargs):
         self.full_clean()
+        existia = not self._state.adding
         super().save(*args, **kwargs)
+        if existia:
+            # Mantém o curso desnormalizado no Progresso se o capítulo trocar de curso
+            Progresso.objects.filter(capitulo_id=self.pk).exclude(curso_id=self.curso_id).update(curso_id=self.curso_id)
 
 
 class Progresso(models.Model):
@@ -149,6 +131,11 @@ class Progresso(models.Model):
         limit_choices_to={'tipo': 'aluno'}
     )
     capitulo = models.ForeignKey(Capitulo, on_delete=models.CASCADE)
+    # Cópia de capitulo.curso, para filtrar por curso sem join com Capitulo. É
+    # preenchido no save() e explicitamente nas gravações em lote; nulo só em
+    # registros antigos ainda não preenchidos (ver preencher_curso_progresso).
+    # Sem índice próprio: o índice (curso, capitulo) já começa por ele
+    curso = models.ForeignKey(Curso, on_delete=models.CASCADE, null=True, editable=False, db_index=False)
     concluido = models.BooleanField(default=False)
     nota = models.DecimalField(
         max_digits=5,
@@ -161,6 +148,11 @@ class Progresso(models.Model):
 
     class Meta:
         unique_together = ('aluno', 'capitulo')
+        indexes = [
+            models.Index(fields=['aluno', 'curso'], name='progresso_aluno_curso_idx'),
+            models.Index(fields=['curso', 'capitulo'], name='progresso_curso_cap_idx'),
+            models.Index(fields=['aluno', 'concluido'], name='progresso_aluno_concl_idx'),
+        ]
         verbose_name = 'Progresso'
         verbose_name_plural = 'Progressos'
 
@@ -201,7 +193,61 @@ class Progresso(models.Model):
         return self.concluido
 
     def save(self, *args, **kwargs):
+        self.curso_id = self.capitulo.curso_id
         # Auto-marca como concluído se for exercício aprovado
         if self.capitulo.tipo == Capitulo.TIPO_EXERCICIO and self.aprovado:
             self.concluido = True
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+class ResumoProgresso(models.Model):
+    """Resumo materializado do progresso de um aluno em um curso"""
+    aluno = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='resumos_progresso'
+    )
+    curso = models.ForeignKey(Curso, on_delete=models.CASCADE, related_name='resumos_progresso')
+    aulas_concluidas = models.PositiveIntegerField(default=0)
+    exercicios_aprovados = models.PositiveIntegerField(default=0)
+    percentual = models.PositiveSmallIntegerField(default=0)
+    melhor_nota = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    media_notas = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    ultima_atividade = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('aluno', 'curso')
+        verbose_name = 'Resumo de Progresso'
+        verbose_name_plural = 'Resumos de Progresso'
+
+    def __str__(self):
+        return f"{self.aluno.username} - {self.curso.nome} ({self.percentual}%)"
+
+
+class NotaPendente(models.Model):
+    """Fila (outbox) de notas já aceitas e ainda não aplicadas ao Progresso"""
+    aluno = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='notas_pendentes'
+    )
+    capitulo = models.ForeignKey(Capitulo, on_delete=models.CASCADE)
+    nota = models.DecimalField(max_digits=5, decimal_places=2)
+    recebida_em = models.DateTimeField(auto_now_add=True)
+    processada_em = models.DateTimeField(null=True, blank=True)
+    erro = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['aluno'],
+                condition=models.Q(processada_em__isnull=True),
+                name='nota_pendente_aluno_idx'
+            ),
+        ]
+        verbose_name = 'Nota Pendente'
+        verbose_name_plural = 'Notas Pendentes'
+
+    def __str__(self):
+        return f"{self.aluno_id} - capítulo {self.capitulo_id}: {self.nota}"
@@ -0,0 +1,282 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.templatetags.static import static
+
+try:
+    import brotli
+except ImportError:  # Brotli é opcional; sem ele só geramos .gz
+    brotli = None
+
+# Prefixo (relativo a static/) dos pacotes Captivate, como gravado em Capitulo.url
+PREFIXO_PACOTES = 'cursos/captivate_packages/'
+
+# Extensões que vale a pena pré-comprimir (imagens e áudio já são comprimidos)
+EXTENSOES_TEXTO = {'.html', '.htm', '.js', '.css', '.json', '.svg', '.txt', '.xml'}
+
+NOME_MANIFESTO = 'manifest.json'
+NOME_INDICE = 'indice.json'
+TAMANHO_HASH = 12
+
+# Resultado de publicar_pacotes: pacotes = {pacote: (hash, publicado)}; alterados são os
+# arquivos cujo conteúdo mudou desde a última publicação; o tempo economizado é o custo de
+# compressão registrado no índice dos arquivos reaproveitados da versão anterior
+RelatorioPublicacao = namedtuple('RelatorioPublicacao', [
+    'pacotes', 'arquivos', 'alterados', 'comprimidos', 'segundos', 'segundos_economizados'
+])
+
+# Manifesto lido do disco: ((caminho, mtime), {pacote: hash})
+_manifesto = (None, {})
+
+
+def origem_pacotes():
+    return Path(getattr(settings, 'PACOTES_ORIGEM', settings.BASE_DIR / 'static' / PREFIXO_PACOTES))
+
+
+def destino_pacotes():
+    return Path(settings.PACOTES_ROOT)
+
+
+def listar_pacotes(origem=None):
+    """Retorna [(nome, pasta)] com um pacote por pasta <curso>/<capitulo>, ex.: 'Power_bi/cap01'"""
+    origem = Path(origem or origem_pacotes())
+    pacotes = []
+    for pasta_curso in sorted(p for p in origem.iterdir() if p.is_dir()):
+        for pasta in sorted(p for p in pasta_curso.iterdir() if p.is_dir()):
+            pacotes.append((f'{pasta_curso.name}/{pasta.name}', pasta))
+    return pacotes
+
+
+def _arquivos(pasta):
+    """Arquivos do pacote em ordem estável, como (caminho relativo, Path)"""
+    arquivos = []
+    for raiz, dirs, nomes in os.walk(pasta):
+        dirs.sort()
+        for nome in sorted(nomes):
+            caminho = Path(raiz) / nome
+            arquivos.append((caminho.relative_to(pasta).as_posix(), caminho))
+    return arquivos
+
+
+def hash_arquivo(caminho):
+    digest = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+            digest.update(bloco)
+    return digest.hexdigest()
+
+
+def hash_pacote(digests):
+    """Hash do pacote a partir de [(caminho relativo, digest)] na ordem de _arquivos"""
+    digest = hashlib.sha256()
+    for relativo, digest_arquivo in digests:
+        digest.update(relativo.encode())
+        digest.update(digest_arquivo.encode())
+    return digest.hexdigest()[:TAMANHO_HASH]
+
+
+def comprimir_arquivo(caminho):
+    """Grava as versões .gz (e .br, se o Brotli estiver instalado) de um arquivo de texto"""
+    conteudo = Path(caminho).read_bytes()
+    with open(f'{caminho}.gz', 'wb') as saida:
+        # mtime=0 deixa o .gz idêntico entre publicações do mesmo conteúdo
+        with gzip.GzipFile(filename='', mode='wb', fileobj=saida, compresslevel=9, mtime=0) as compactado:
+            compactado.write(conteudo)
+    if brotli is not None:
+        Path(f'{caminho}.br').write_bytes(brotli.compress(conteudo))
+
+
+def _comprimir_com_custo(caminho):
+    inicio = time.perf_counter()
+    comprimir_arquivo(caminho)
+    return time.perf_counter() - inicio
+
+
+def _executar(funcao, argumentos, processos=None):
+    """Aplica a função a cada argumento num pool de processos (ou no próprio processo, se processos=1)"""
+    processos = processos or os.cpu_count() or 1
+    if processos == 1 or len(argumentos) < 2:
+        return [funcao(argumento) for argumento in argumentos]
+    with ProcessPoolExecutor(max_workers=processos) as pool:
+        return list(pool.map(funcao, argumentos, chunksize=max(1, len(argumentos) // (processos * 4))))
+
+
+def _ligar_ou_copiar(origem, alvo):
+    """Hardlink de um arquivo já publicado (versões são imutáveis), ou cópia se não for possível"""
+    try:
+        os.link(origem, alvo)
+    except OSError:
+        shutil.copy2(origem, alvo)
+
+
+def _digest_e_custo(entrada):
+    """(digest, custo de compressão) de uma entrada do índice ([digest, custo]; índices antigos tinham tamanho e mtime antes)"""
+    return entrada[-2], entrada[-1]
+
+
+def _ler_json(caminho):
+    try:
+        return json.loads(Path(caminho).read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def _gravar_json(dados, caminho):
+    """Grava o JSON de forma atômica (os processos web leem o manifesto)"""
+    caminho = Path(caminho)
+    temporario = caminho.with_name(f'.{caminho.name}.tmp')
+    temporario.write_text(json.dumps(dados, indent=2, sort_keys=True))
+    os.replace(temporario, caminho)
+
+
+def gravar_manifesto(versoes, destino=None):
+    """Grava {pacote: hash} no manifesto lido por url_pacote"""
+    _gravar_json(versoes, Path(destino or destino_pacotes()) / NOME_MANIFESTO)
+
+
+def limpar_versoes(nome, manter, destino=None):
+    """Remove versões antigas do pacote, mantendo as `manter` mais recentes (páginas já abertas ainda as usam)"""
+    pasta = Path(destino or destino_pacotes()) / nome
+    versoes = sorted(
+        (p for p in pasta.iterdir() if p.is_dir() and not p.name.startswith('.')),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True
+    )
+    for antiga in versoes[manter:]:
+        shutil.rmtree(antiga)
+    return len(versoes[manter:])
+
+
+def publicar_pacotes(origem=None, destino=None, manter=2, processos=None):
+    """
+    Publica os pacotes Captivate em <destino>/<pacote>/<hash>/ e atualiza o
+    manifesto, de forma incremental:
+
+    - todo arquivo de origem tem o conteúdo lido e hasheado a cada execução:
+      num build a partir de um clone novo todos os mtimes mudam, então só o
+      digest diz o que mudou (e o hash é barato perto de copiar e comprimir);
+    - o índice (indice.json) guarda o digest e o custo de compressão de cada
+      arquivo;
+    - uma versão já publicada nunca é reescrita, só reaproveitada;
+    - numa versão nova, arquivos iguais aos da versão anterior viram hardlinks
+      (junto com os .gz/.br), e só os demais são copiados e comprimidos.
+
+    Só há ganho se o destino (com o índice e as versões) sobreviver entre as
+    execuções: ver PACOTES_ROOT em settings. Hash e compressão rodam num pool
+    de processos. A versão nova é montada numa pasta temporária e renomeada
+    no final.
+    """
+    inicio = time.perf_counter()
+    destino = Path(destino or destino_pacotes())
+    destino.mkdir(parents=True, exist_ok=True)
+    indice_anterior = _ler_json(destino / NOME_INDICE)
+    manifesto_anterior = _ler_json(destino / NOME_MANIFESTO)
+
+    pacotes = []
+    for nome, pasta in listar_pacotes(origem):
+        pacotes.append((nome, [(relativo, caminho, f'{nome}/{relativo}') for relativo, caminho in _arquivos(pasta)]))
+    arquivos_origem = [(chave, caminho) for _, arquivos in pacotes for _, caminho, chave in arquivos]
+    digests = _executar(hash_arquivo, [caminho for _, caminho in arquivos_origem], processos)
+
+    # Custo de compressão 0 para o que mudou; é preenchido quando o arquivo for comprimido
+    indice = {}
+    alterados = 0
+    for (chave, _), digest in zip(arquivos_origem, digests):
+        anterior = indice_anterior.get(chave)
+        if anterior and _digest_e_custo(anterior)[0] == digest:
+            indice[chave] = [digest, _digest_e_custo(anterior)[1]]
+        else:
+            indice[chave] = [digest, 0.0]
+            alterados += 1
+
+    # Monta as versões novas
+    versoes = {}
+    montadas = []
+    comprimir = []
+    economizado = 0.0
+    for nome, arquivos in pacotes:
+        versao = hash_pacote((relativo, indice[chave][0]) for relativo, _, chave in arquivos)
+        final = destino / nome / versao
+        if final.is_dir():
+            # Marca a versão como a mais recente, para limpar_versoes não removê-la
+            os.utime(final)
+            versoes[nome] = (versao, False)
+            economizado += sum(indice[chave][1] for _, _, chave in arquivos)
+            continue
+
+        anterior = destino / nome / manifesto_anterior[nome] if nome in manifesto_anterior else None
+        temporaria = destino / nome / f'.{versao}.tmp'
+        shutil.rmtree(temporaria, ignore_errors=True)
+        temporaria.mkdir(parents=True)
+        for relativo, caminho, chave in arquivos:
+            alvo = temporaria / relativo
+            alvo.parent.mkdir(parents=True, exist_ok=True)
+            antigo = indice_anterior.get(chave)
+            publicado = anterior / relativo if anterior else None
+            if publicado and antigo and _digest_e_custo(antigo)[0] == indice[chave][0] and publicado.is_file():
+                for sufixo in ('', '.gz', '.br'):
+                    if Path(f'{publicado}{sufixo}').is_file():
+                        _ligar_ou_copiar(f'{publicado}{sufixo}', f'{alvo}{sufixo}')
+                economizado += indice[chave][1]
+            else:
+                shutil.copy2(caminho, alvo)
+                if alvo.suffix.lower() in EXTENSOES_TEXTO:
+                    comprimir.append((chave, alvo))
+        montadas.append((temporaria, final))
+        versoes[nome] = (versao, True)
+
+    custos = _executar(_comprimir_com_custo, [alvo for _, alvo in comprimir], processos)
+    for (chave, _), custo in zip(comprimir, custos):
+        indice[chave][1] = custo
+    for temporaria, final in montadas:
+        os.replace(temporaria, final)
+
+    gravar_manifesto({nome: versao for nome, (versao, _) in versoes.items()}, destino)
+    _gravar_json(indice, destino / NOME_INDICE)
+    for nome in versoes:
+        limpar_versoes(nome, manter, destino)
+
+    return RelatorioPublicacao(
+        pacotes=versoes,
+        arquivos=len(indice),
+        alterados=alterados,
+        comprimidos=len(comprimir),
+        segundos=time.perf_counter() - inicio,
+        segundos_economizados=economizado,
+    )
+
+
+def carregar_manifesto():
+    """{pacote: hash} publicado, relido apenas quando o arquivo muda"""
+    global _manifesto
+    caminho = destino_pacotes() / NOME_MANIFESTO
+    try:
+        chave = (caminho, caminho.stat().st_mtime)
+    except FileNotFoundError:
+        return {}
+    if _manifesto[0] != chave:
+        _manifesto = (chave, json.loads(caminho.read_text()))
+    return _manifesto[1]
+
+
+def url_pacote(caminho):
+    """
+    URL de um arquivo de pacote (caminho relativo a static/, como em
+    Capitulo.url) na versão publicada atual, ou a URL estática comum quando o
+    pacote ainda não foi publicado.
+    """
+    partes = caminho[len(PREFIXO_PACOTES):].split('/', 2)
+    if caminho.startswith(PREFIXO_PACOTES) and len(partes) == 3:
+        curso, capitulo, arquivo = partes
+        versao = carregar_manifesto().get(f'{curso}/{capitulo}')
+        if versao:
+            return f"{settings.PACOTES_URL}{curso}/{capitulo}/{versao}/{arquivo}"
+    return static(caminho)
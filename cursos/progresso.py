@@ -0,0 +1,343 @@
+from collections import defaultdict
+from decimal import Decimal
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Q
+
+from .desnormalizacao import curso_do_progresso, progresso_dos_cursos
+from .estrutura import obter_estruturas
+from .fragmentos import invalidar_progresso
+from .mapa_calor import MANTER, atualizar_mapas
+from .models import Capitulo, Curso, Progresso, ResumoProgresso
+
+NOTA_APROVACAO = 8
+
+
+def mapear_aulas(cursos_ids):
+    """
+    Retorna {curso_id: [(aula_id, exercicio_id), ...]} com as aulas em ordem.
+    O exercício de uma aula é o capítulo do tipo exercício com ordem + 0.5
+    (None quando a aula não tem exercício). Lê da estrutura em cache dos cursos.
+    """
+    estruturas = obter_estruturas(cursos_ids)
+    return {curso_id: estrutura.pares() for curso_id, estrutura in estruturas.items()}
+
+
+def aulas_concluidas(alunos_ids, mapa_aulas):
+    """
+    Retorna {(aluno_id, curso_id): set(aula_ids)} com as aulas concluídas.
+
+    Uma aula com exercício conta como concluída quando o exercício tem
+    nota >= 8; uma aula sem exercício, quando está marcada como concluída.
+    Executa uma única consulta para todos os alunos e cursos informados
+    (alunos_ids=None considera todos os alunos com progresso nos cursos).
+    """
+    progressos = Progresso.objects.filter(progresso_dos_cursos(mapa_aulas))
+    if alunos_ids is not None:
+        progressos = progressos.filter(aluno_id__in=list(alunos_ids))
+    aprovados, marcados = aprovados_e_marcados(progressos)
+
+    alunos = {aluno_id for aluno_id, _ in aprovados | marcados}
+    resultado = defaultdict(set)
+    for curso_id, pares in mapa_aulas.items():
+        for aluno_id in alunos:
+            concluidas = concluidas_por_pares(pares, aluno_id, aprovados, marcados)
+            if concluidas:
+                resultado[(aluno_id, curso_id)] = concluidas
+    return resultado
+
+
+def aprovados_e_marcados(progressos):
+    """
+    Lê os registros de Progresso relevantes para a conclusão (uma consulta) e
+    retorna dois sets de (aluno_id, capitulo_id): com nota >= 8 e marcados
+    como concluídos.
+    """
+    progressos = progressos.filter(
+        Q(nota__gte=NOTA_APROVACAO) | Q(concluido=True)
+    ).values_list('aluno_id', 'capitulo_id', 'concluido', 'nota')
+
+    aprovados = set()
+    marcados = set()
+    for aluno_id, capitulo_id, concluido, nota in progressos:
+        if nota is not None and nota >= NOTA_APROVACAO:
+            aprovados.add((aluno_id, capitulo_id))
+        if concluido:
+            marcados.add((aluno_id, capitulo_id))
+    return aprovados, marcados
+
+
+def concluidas_por_pares(pares, aluno_id, aprovados, marcados):
+    """Set das aulas concluídas pelo aluno, dados os pares (aula_id, exercicio_id) do curso"""
+    concluidas = set()
+    for aula_id, exercicio_id in pares:
+        if exercicio_id:
+            concluida = (aluno_id, exercicio_id) in aprovados
+        else:
+            concluida = (aluno_id, aula_id) in marcados
+        if concluida:
+            concluidas.add(aula_id)
+    return concluidas
+
+
+def calcular_percentual(concluidas, total):
+    if total == 0:
+        return 0
+    return int((concluidas / total) * 100)
+
+
+def progresso_do_aluno(aluno, cursos):
+    """Retorna {curso_id: percentual} de um aluno em vários cursos (1 consulta além da estrutura em cache)"""
+    mapa = mapear_aulas(curso.id for curso in cursos)
+    concluidas = aulas_concluidas([aluno.id], mapa)
+    return {
+        curso_id: calcular_percentual(len(concluidas.get((aluno.id, curso_id), ())), len(pares))
+        for curso_id, pares in mapa.items()
+    }
+
+
+def progresso_da_turma(curso, alunos_ids=None):
+    """Retorna {aluno_id: percentual} dos alunos de um curso (até 2 consultas além da estrutura em cache)"""
+    if alunos_ids is None:
+        alunos_ids = curso.alunos.values_list('id', flat=True)
+    alunos_ids = list(alunos_ids)
+    mapa = mapear_aulas([curso.id])
+    concluidas = aulas_concluidas(alunos_ids, mapa)
+    total = len(mapa[curso.id])
+    return {
+        aluno_id: calcular_percentual(len(concluidas.get((aluno_id, curso.id), ())), total)
+        for aluno_id in alunos_ids
+    }
+
+
+def situacao_do_aluno(aluno, curso, mapa=None):
+    """Retorna (set de aulas concluídas, percentual) de um aluno em um curso"""
+    if mapa is None:
+        mapa = mapear_aulas([curso.id])
+    concluidas = aulas_concluidas([aluno.id], mapa).get((aluno.id, curso.id), set())
+    return concluidas, calcular_percentual(len(concluidas), len(mapa[curso.id]))
+
+
+CAMPOS_RESUMO = [
+    'aulas_concluidas', 'exercicios_aprovados', 'percentual',
+    'melhor_nota', 'media_notas', 'ultima_atividade',
+]
+
+
+def _calcular_resumos(mapa, pares, alunos_ids=None, incluir_com_progresso=False):
+    """
+    Monta instâncias (não salvas) de ResumoProgresso para os pares
+    (aluno_id, curso_id) informados, com uma consulta agregada por GROUP BY
+    e outra para as aulas concluídas. Com incluir_com_progresso, também
+    inclui qualquer par que tenha registros de Progresso.
+    """
+    estatisticas = Progresso.objects.filter(progresso_dos_cursos(mapa))
+    if alunos_ids is not None:
+        estatisticas = estatisticas.filter(aluno_id__in=list(alunos_ids))
+    estatisticas = estatisticas.annotate(curso_efetivo=curso_do_progresso()).values(
+        'aluno_id', 'curso_efetivo'
+    ).annotate(
+        exercicios_aprovados=Count('id', filter=Q(
+            capitulo__tipo=Capitulo.TIPO_EXERCICIO, nota__gte=NOTA_APROVACAO
+        )),
+        melhor_nota=Max('nota', filter=Q(capitulo__tipo=Capitulo.TIPO_EXERCICIO)),
+        media_notas=Avg('nota', filter=Q(capitulo__tipo=Capitulo.TIPO_EXERCICIO)),
+        ultima_atividade=Max('atualizado_em'),
+    )
+    por_par = {(linha['aluno_id'], linha['curso_efetivo']): linha for linha in estatisticas}
+    if incluir_com_progresso:
+        pares = set(pares) | set(por_par)
+
+    concluidas = aulas_concluidas(alunos_ids, mapa)
+
+    resumos = []
+    for aluno_id, curso_id in pares:
+        linha = por_par.get((aluno_id, curso_id), {})
+        aulas = len(concluidas.get((aluno_id, curso_id), ()))
+        media = linha.get('media_notas')
+        resumos.append(ResumoProgresso(
+            aluno_id=aluno_id,
+            curso_id=curso_id,
+            aulas_concluidas=aulas,
+            exercicios_aprovados=linha.get('exercicios_aprovados', 0),
+            percentual=calcular_percentual(aulas, len(mapa[curso_id])),
+            melhor_nota=linha.get('melhor_nota'),
+            media_notas=Decimal(str(media)).quantize(Decimal('0.01')) if media is not None else None,
+            ultima_atividade=linha.get('ultima_atividade'),
+        ))
+    return resumos
+
+
+def atualizar_resumos(pares):
+    """
+    Recalcula os ResumoProgresso dos pares (aluno_id, curso_id) a partir dos
+    registros de Progresso e grava todos com um único upsert. Deve ser chamado
+    na mesma transação que grava o Progresso, para que o resumo nunca fique
+    atrás do histórico.
+
+    O recálculo lê o Progresso visível à transação. Para que duas gravações
+    simultâneas do mesmo aluno não gravem cada uma um resumo sem a nota da
+    outra (READ COMMITTED), as linhas do resumo são criadas se preciso e
+    travadas antes da leitura: a segunda transação espera o commit da
+    primeira e então já enxerga as notas dela.
+    """
+    pares = set(pares)
+    if not pares:
+        return []
+    alunos_ids = {aluno_id for aluno_id, _ in pares}
+    cursos_ids = {curso_id for _, curso_id in pares}
+    with transaction.atomic():
+        # Sempre na mesma ordem, para que dois lotes não se travem mutuamente
+        ResumoProgresso.objects.bulk_create(
+            [ResumoProgresso(aluno_id=aluno_id, curso_id=curso_id) for aluno_id, curso_id in sorted(pares)],
+            ignore_conflicts=True,
+        )
+        list(ResumoProgresso.objects.select_for_update().filter(
+            aluno_id__in=alunos_ids, curso_id__in=cursos_ids
+        ).order_by('aluno_id', 'curso_id').values_list('id', flat=True))
+
+        mapa = mapear_aulas(cursos_ids)
+        resumos = _calcular_resumos(mapa, pares, alunos_ids=alunos_ids)
+        return ResumoProgresso.objects.bulk_create(
+            resumos,
+            update_conflicts=True,
+            unique_fields=['aluno', 'curso'],
+            update_fields=CAMPOS_RESUMO,
+        )
+
+
+def atualizar_resumo(aluno_id, curso_id):
+    """Recalcula o ResumoProgresso de um aluno em um curso (ver atualizar_resumos)"""
+    return atualizar_resumos([(aluno_id, curso_id)])[0]
+
+
+def reconstruir_resumos(cursos_ids=None, batch_size=1000):
+    """
+    Reconstrói do zero os resumos dos cursos informados (ou de todos) com
+    consultas agregadas, e retorna quantos resumos foram gravados.
+    """
+    if cursos_ids is None:
+        cursos_ids = Curso.objects.values_list('id', flat=True)
+    cursos_ids = list(cursos_ids)
+    mapa = mapear_aulas(cursos_ids)
+
+    # Uma linha por matrícula, mais quem tiver progresso sem matrícula
+    matriculas = Curso.alunos.through.objects.filter(
+        curso_id__in=cursos_ids
+    ).values_list('usuario_id', 'curso_id')
+    resumos = _calcular_resumos(mapa, matriculas, incluir_com_progresso=True)
+
+    with transaction.atomic():
+        ResumoProgresso.objects.filter(curso_id__in=cursos_ids).delete()
+        ResumoProgresso.objects.bulk_create(resumos, batch_size=batch_size)
+    return len(resumos)
+
+
+def resumos_do_aluno(aluno, cursos):
+    """
+    Retorna {curso_id: ResumoProgresso} lendo uma linha por curso. Cursos
+    ainda sem resumo (ex.: progresso anterior à tabela) são calculados na hora.
+    """
+    cursos_ids = [curso.id for curso in cursos]
+    resumos = {
+        resumo.curso_id: resumo
+        for resumo in ResumoProgresso.objects.filter(aluno=aluno, curso_id__in=cursos_ids)
+    }
+    faltando = [(aluno.id, curso_id) for curso_id in cursos_ids if curso_id not in resumos]
+    for resumo in atualizar_resumos(faltando):
+        resumos[resumo.curso_id] = resumo
+    return resumos
+
+
+def aplicar_notas(itens):
+    """
+    Grava em lote as notas [(aluno_id, capitulo_id, nota)], com o mesmo efeito
+    de registrá-las uma a uma: verifica as matrículas com uma consulta, faz
+    upsert de todos os Progresso, conclui as aulas dos exercícios aprovados e
+    atualiza os resumos. Retorna um resultado por item, na mesma ordem.
+    """
+    capitulos = {
+        capitulo['id']: capitulo
+        for capitulo in Capitulo.objects.filter(
+            id__in={capitulo_id for _, capitulo_id, _ in itens}
+        ).values('id', 'curso_id', 'tipo')
+    }
+    cursos_ids = {capitulo['curso_id'] for capitulo in capitulos.values()}
+    matriculas = set(Curso.alunos.through.objects.filter(
+        usuario_id__in={aluno_id for aluno_id, _, _ in itens},
+        curso_id__in=cursos_ids
+    ).values_list('usuario_id', 'curso_id'))
+    estruturas = obter_estruturas(cursos_ids)
+
+    # Estado final de cada (aluno, capítulo), aplicando os itens em ordem
+    notas = {}
+    # {(aluno_id, aula_id): curso_id} das aulas concluídas por exercícios aprovados
+    conclusoes = {}
+    pares = set()
+    resultados = []
+    for aluno_id, capitulo_id, nota in itens:
+        capitulo = capitulos.get(capitulo_id)
+        if capitulo is None:
+            resultados.append({'status': 'error', 'message': 'Capítulo não encontrado'})
+            continue
+        if (aluno_id, capitulo['curso_id']) not in matriculas:
+            resultados.append({'status': 'error', 'message': 'Aluno não matriculado neste curso'})
+            continue
+
+        is_exercicio = capitulo['tipo'] == Capitulo.TIPO_EXERCICIO
+        aprovado = is_exercicio and nota >= NOTA_APROVACAO
+        notas[(aluno_id, capitulo_id)] = (nota, aprovado)
+        conclusoes.pop((aluno_id, capitulo_id), None)
+
+        # Exercício aprovado conclui a aula relacionada
+        aula = estruturas[capitulo['curso_id']].aula_do_exercicio(capitulo_id) if aprovado else None
+        if aula:
+            if (aluno_id, aula.id) in notas:
+                notas[(aluno_id, aula.id)] = (notas[(aluno_id, aula.id)][0], True)
+            else:
+                conclusoes[(aluno_id, aula.id)] = capitulo['curso_id']
+
+        pares.add((aluno_id, capitulo['curso_id']))
+        resultados.append({
+            'status': 'success',
+            'aprovado': nota >= NOTA_APROVACAO,
+            'tipo_capitulo': capitulo['tipo'],
+        })
+
+    with transaction.atomic():
+        Progresso.objects.bulk_create(
+            [
+                Progresso(aluno_id=aluno_id, capitulo_id=capitulo_id, curso_id=capitulos[capitulo_id]['curso_id'],
+                          nota=nota, concluido=concluido)
+                for (aluno_id, capitulo_id), (nota, concluido) in notas.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['aluno', 'capitulo'],
+            update_fields=['nota', 'concluido', 'atualizado_em'],
+        )
+        Progresso.objects.bulk_create(
+            [
+                Progresso(aluno_id=aluno_id, capitulo_id=capitulo_id, curso_id=curso_id, concluido=True)
+                for (aluno_id, capitulo_id), curso_id in conclusoes.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['aluno', 'capitulo'],
+            update_fields=['concluido', 'atualizado_em'],
+        )
+        atualizar_resumos(pares)
+
+        # bulk_create não dispara post_save: invalida os fragmentos dos alunos aqui
+        alunos_ids = {aluno_id for aluno_id, _ in pares}
+        invalidar_progresso(alunos_ids)
+        transaction.on_commit(partial(invalidar_progresso, alunos_ids))
+        # Nem o mapa de calor: aplica as células gravadas depois do commit
+        transaction.on_commit(partial(atualizar_mapas, [
+            (capitulos[capitulo_id]['curso_id'], aluno_id, capitulo_id, concluido, nota)
+            for (aluno_id, capitulo_id), (nota, concluido) in notas.items()
+        ] + [
+            (curso_id, aluno_id, capitulo_id, True, MANTER)
+            for (aluno_id, capitulo_id), curso_id in conclusoes.items()
+        ]))
+
+    return resultados
@@ -4,4 +4,16 @@ from .models import Progresso
 class NotaSerializer(serializers.Serializer):
     user_id = serializers.IntegerField()
     capitulo_id = serializers.IntegerField()
-    nota = serializers.FloatField()
\ No newline at end of file
+    nota = serializers.FloatField()
+
+
+class BoletimItemSerializer(serializers.ModelSerializer):
+    curso_id = serializers.IntegerField(source='capitulo.curso_id')
+    curso_nome = serializers.CharField(source='capitulo.curso.nome')
+    capitulo_ordem = serializers.DecimalField(source='capitulo.ordem', max_digits=5, decimal_places=1)
+    capitulo_titulo = serializers.CharField(source='capitulo.titulo')
+
+    class Meta:
+        model = Progresso
+        fields = ['curso_id', 'curso_nome', 'capitulo_id', 'capitulo_ordem', 'capitulo_titulo',
+                  'nota', 'concluido', 'atualizado_em']
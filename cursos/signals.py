@@ -0,0 +1,103 @@
+from collections import defaultdict
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .estrutura import invalidar_estrutura
+from .fragmentos import invalidar_progresso
+from .mapa_calor import atualizar_mapas, invalidar_mapas
+from .matriculas import invalidar_matriculas
+from .models import Capitulo, Curso, Progresso
+from .progresso import reconstruir_resumos
+
+
+# {id(conexão): cursos com reconstrução dos resumos agendada para o próximo commit}
+_cursos_a_reconstruir = defaultdict(set)
+
+
+def _reconstruir_curso(chave, curso_id):
+    pendentes = _cursos_a_reconstruir[chave]
+    if curso_id in pendentes:
+        pendentes.discard(curso_id)
+        reconstruir_resumos([curso_id])
+
+
+def agendar_reconstrucao(curso_id):
+    """
+    Reconstrói os resumos do curso após o commit, uma vez por curso e
+    transação: cada chamada registra um callback para o curso, e só o
+    primeiro a rodar o encontra pendente. Salvar N capítulos de um curso no
+    admin (ou apagá-los em cascata com ele) faz uma reconstrução, não N.
+
+    Cada callback só reconstrói o próprio curso, então um rollback (inteiro
+    ou de um savepoint), que descarta callbacks mas não o conjunto, nunca
+    impede uma reconstrução: o curso desfeito fica pendente até a próxima
+    transação que o agendar, e então é reconstruído uma vez.
+    """
+    chave = id(transaction.get_connection())
+    _cursos_a_reconstruir[chave].add(curso_id)
+    transaction.on_commit(partial(_reconstruir_curso, chave, curso_id))
+
+
+@receiver(post_save, sender=Capitulo)
+@receiver(post_delete, sender=Capitulo)
+def invalidar_estrutura_capitulo(sender, instance, **kwargs):
+    # Invalida já (mesmo processo) e de novo após o commit, para que nenhum
+    # leitor guarde em cache a estrutura de antes da transação terminar
+    invalidar_estrutura(instance.curso_id)
+    transaction.on_commit(partial(invalidar_estrutura, instance.curso_id))
+    # Percentuais dependem de quais aulas e exercícios o curso tem
+    agendar_reconstrucao(instance.curso_id)
+
+
+@receiver(post_save, sender=Curso)
+def invalidar_estrutura_curso(sender, instance, **kwargs):
+    # O nome do curso define a pasta dos pacotes
+    invalidar_estrutura(instance.id)
+    transaction.on_commit(partial(invalidar_estrutura, instance.id))
+
+
+@receiver(post_save, sender=Progresso)
+@receiver(post_delete, sender=Progresso)
+def invalidar_fragmentos_progresso(sender, instance, **kwargs):
+    # Mesmo esquema da estrutura: agora e de novo após o commit
+    invalidar_progresso([instance.aluno_id])
+    transaction.on_commit(partial(invalidar_progresso, [instance.aluno_id]))
+
+
+@receiver(post_save, sender=Progresso)
+@receiver(post_delete, sender=Progresso)
+def atualizar_mapa_progresso(sender, instance, **kwargs):
+    # Só depois do commit: o mapa em cache recebe o valor final da célula (None = registro apagado)
+    concluido = None if kwargs['signal'] is post_delete else instance.concluido
+    transaction.on_commit(partial(
+        atualizar_mapas, [(instance.curso_id, instance.aluno_id, instance.capitulo_id, concluido, instance.nota)]
+    ))
+
+
+@receiver(m2m_changed, sender=Curso.alunos.through)
+def invalidar_cache_matriculas(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and not reverse:
+        # Depois do clear não dá mais para saber quem estava matriculado
+        instance._alunos_removidos = list(instance.alunos.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        # aluno.cursos_matriculados.add(...): instance é o aluno
+        usuarios_ids = [instance.pk]
+        cursos_ids = list(pk_set or ())
+    elif action == 'post_clear':
+        usuarios_ids = getattr(instance, '_alunos_removidos', [])
+        cursos_ids = [instance.pk]
+    else:
+        usuarios_ids = list(pk_set)
+        cursos_ids = [instance.pk]
+    invalidar_matriculas(usuarios_ids)
+    transaction.on_commit(partial(invalidar_matriculas, usuarios_ids))
+    # As linhas do mapa de calor são os alunos matriculados
+    invalidar_mapas(cursos_ids)
+    transaction.on_commit(partial(invalidar_mapas, cursos_ids))
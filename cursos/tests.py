@@ -1,5 +1,42 @@
-from django.test import TestCase
-from cursos.models import Curso, Capitulo
+import gzip
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+from datetime import timedelta
+import zipfile
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import F
+from django.test import Client, TestCase, override_settings
+from django.utils import timezone
+from cursos.models import Curso, Capitulo, Progresso, ResumoProgresso, NotaPendente
+from cursos.benchmark import comparar, executar_benchmark, percentil, popular_banco
+from cursos.carga import _serializar_copy, gerar_carga
+from cursos.desnormalizacao import preencher_curso_progresso
+from cursos.estatisticas import calcular_uma_vez, estatisticas_escola
+from cursos.consultas import ConsultasTestMixin, MonitorConsultas, formato_consulta
+from cursos.estrutura import obter_estrutura
+from cursos.fila import processar_lote
+from cursos.fragmentos import estatisticas_fragmentos
+from cursos.liberacao import calcular_liberacao
+from cursos.management.commands.processar_notas import INTERVALO_OCIOSO
+from cursos.middleware import PacotesWhiteNoiseMiddleware
+from cursos.mapa_calor import atualizar_mapas, montar_mapa, obter_mapa, versao_mapa
+from cursos.matriculas import cursos_matriculados, esta_matriculado, matricular
+from cursos.pacotes import publicar_pacotes, url_pacote
+from cursos.progresso import aplicar_notas, progresso_do_aluno, progresso_da_turma, reconstruir_resumos
+from certificados.models import Certificado
 from usuarios.models import Usuario  # Adicione esta importação
 
 
@@ -55,4 +92,1165 @@ class CapituloModelTests(TestCase):
                 titulo="Aula 1 Duplicada"
             )
             cap.full_clean()
-            cap.save()
\ No newline at end of file
+            cap.save()
+CACHE_LOCAL = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'sessoes': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sessoes'},
+    'verificacao': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'verificacao'},
+}
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ProgressoEngineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = Usuario.objects.create_user(username='aluno_teste', password='senha123', tipo='aluno')
+        cls.outro = Usuario.objects.create_user(username='outro_teste', password='senha123', tipo='aluno')
+        cls.curso = Curso.objects.create(nome="Power BI", descricao="Curso")
+        cls.curso.alunos.add(cls.aluno, cls.outro)
+
+        cls.aula1 = Capitulo.objects.create(curso=cls.curso, ordem=1, tipo='aula', titulo="Aula 1", url="cap01")
+        cls.ex1 = Capitulo.objects.create(curso=cls.curso, ordem=1.5, tipo='exercicio', titulo="Ex 1", url="cap01_ex")
+        cls.aula2 = Capitulo.objects.create(curso=cls.curso, ordem=2, tipo='aula', titulo="Aula 2", url="cap02")
+        cls.aula3 = Capitulo.objects.create(curso=cls.curso, ordem=3, tipo='aula', titulo="Aula 3", url="cap03")
+        cls.ex3 = Capitulo.objects.create(curso=cls.curso, ordem=3.5, tipo='exercicio', titulo="Ex 3", url="cap03_ex")
+
+    def test_aula_com_exercicio_exige_nota_minima(self):
+        Progresso.objects.create(aluno=self.aluno, capitulo=self.aula1, concluido=True)
+        Progresso.objects.create(aluno=self.aluno, capitulo=self.ex1, nota=7)
+        self.assertEqual(self.curso.progresso_percentual(self.aluno), 0)
+
+        Progresso.objects.filter(aluno=self.aluno, capitulo=self.ex1).update(nota=8)
+        self.assertEqual(self.curso.progresso_percentual(self.aluno), 33)
+
+    def test_aula_sem_exercicio_exige_conclusao(self):
+        Progresso.objects.create(aluno=self.aluno, capitulo=self.aula2, concluido=True)
+        self.assertEqual(progresso_do_aluno(self.aluno, [self.curso]), {self.curso.id: 33})
+
+    def test_turma_em_numero_constante_de_consultas(self):
+        Progresso.objects.create(aluno=self.aluno, capitulo=self.ex1, nota=9)
+        Progresso.objects.create(aluno=self.aluno, capitulo=self.aula2, concluido=True)
+        Progresso.objects.create(aluno=self.aluno, capitulo=self.ex3, nota=10)
+        Progresso.objects.create(aluno=self.outro, capitulo=self.aula2, concluido=True)
+
+        self.curso.get_estrutura()
+        with self.assertNumQueries(2):
+            resultado = progresso_da_turma(self.curso)
+
+        self.assertEqual(resultado, {self.aluno.id: 100, self.outro.id: 33})
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class EstruturaCursoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.curso = Curso.objects.create(nome="Power BI", descricao="Curso")
+        cls.aula1 = Capitulo.objects.create(curso=cls.curso, ordem=1, tipo='aula', titulo="Aula 1", url="cap01")
+        cls.ex1 = Capitulo.objects.create(curso=cls.curso, ordem=1.5, tipo='exercicio', titulo="Ex 1", url="cap01_ex")
+        cls.aula2 = Capitulo.objects.create(curso=cls.curso, ordem=2, tipo='aula', titulo="Aula 2", url="cap02")
+
+    def test_navegacao_entre_aulas_e_exercicios(self):
+        estrutura = obter_estrutura(self.curso.id)
+
+        self.assertEqual([item.aula.id for item in estrutura], [self.aula1.id, self.aula2.id])
+        self.assertEqual(estrutura.exercicio_da_aula(self.aula1.id).id, self.ex1.id)
+        self.assertIsNone(estrutura.exercicio_da_aula(self.aula2.id))
+        self.assertEqual(estrutura.aula_do_exercicio(self.ex1.id).id, self.aula1.id)
+        self.assertEqual(estrutura.anterior(self.aula2.id).aula.id, self.aula1.id)
+        self.assertIsNone(estrutura.proxima(self.aula2.id))
+        self.assertEqual(estrutura.item(self.aula1.id).aula.caminho, "cursos/captivate_packages/Power_BI/cap1/index.html")
+
+    def test_estrutura_em_cache_ate_alteracao_de_capitulo(self):
+        obter_estrutura(self.curso.id)
+        with self.assertNumQueries(0):
+            obter_estrutura(self.curso.id)
+
+        aula3 = Capitulo.objects.create(curso=self.curso, ordem=3, tipo='aula', titulo="Aula 3", url="cap03")
+        self.assertEqual(obter_estrutura(self.curso.id).proxima(self.aula2.id).aula.id, aula3.id)
+
+        aula3.delete()
+        self.assertEqual(len(obter_estrutura(self.curso.id)), 2)
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ResumoProgressoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = Usuario.objects.create_user(username='aluno_teste', password='senha123', tipo='aluno')
+        cls.curso = Curso.objects.create(nome="Power BI", descricao="Curso")
+        cls.curso.alunos.add(cls.aluno)
+        cls.aula1 = Capitulo.objects.create(curso=cls.curso, ordem=1, tipo='aula', titulo="Aula 1", url="cap01")
+        cls.ex1 = Capitulo.objects.create(curso=cls.curso, ordem=1.5, tipo='exercicio', titulo="Ex 1", url="cap01_ex")
+        cls.aula2 = Capitulo.objects.create(curso=cls.curso, ordem=2, tipo='aula', titulo="Aula 2", url="cap02")
+        cls.ex2 = Capitulo.objects.create(curso=cls.curso, ordem=2.5, tipo='exercicio', titulo="Ex 2", url="cap02_ex")
+
+    def registrar_nota(self, capitulo, nota):
+        return self.client.post('/api/nota/', json.dumps({
+            'user_id': self.aluno.id, 'capitulo_id': capitulo.id, 'nota': nota
+        }), content_type='application/json')
+
+    def test_resumo_atualizado_a_cada_nota(self):
+        self.registrar_nota(self.ex1, 9)
+        resposta = self.registrar_nota(self.ex2, 6)
+        self.assertEqual(resposta.status_code, 200)
+
+        resumo = ResumoProgresso.objects.get(aluno=self.aluno, curso=self.curso)
+        self.assertEqual(resumo.aulas_concluidas, 1)
+        self.assertEqual(resumo.exercicios_aprovados, 1)
+        self.assertEqual(resumo.percentual, 50)
+        self.assertEqual(resumo.melhor_nota, Decimal('9'))
+        self.assertEqual(resumo.media_notas, Decimal('7.5'))
+        self.assertIsNotNone(resumo.ultima_atividade)
+
+    def test_reconstrucao_igual_ao_incremental(self):
+        self.registrar_nota(self.ex1, 10)
+        self.registrar_nota(self.ex2, 7)
+        campos = ('aluno_id', 'curso_id', 'aulas_concluidas', 'exercicios_aprovados',
+                  'percentual', 'melhor_nota', 'media_notas', 'ultima_atividade')
+        incremental = list(ResumoProgresso.objects.values_list(*campos))
+
+        call_command('recalcular_resumos', stdout=StringIO())
+
+        self.assertEqual(list(ResumoProgresso.objects.values_list(*campos)), incremental)
+
+    def test_varios_capitulos_na_mesma_transacao_reconstroem_uma_vez(self):
+        outro = Curso.objects.create(nome="Excel", descricao="Curso")
+        with mock.patch('cursos.signals.reconstruir_resumos') as reconstruir:
+            with self.captureOnCommitCallbacks(execute=True):
+                for ordem in (3, 4, 5):
+                    Capitulo.objects.create(curso=self.curso, ordem=ordem, tipo='aula', titulo="Aula", url="x")
+                Capitulo.objects.create(curso=outro, ordem=1, tipo='aula', titulo="Aula", url="x")
+                Capitulo.objects.filter(curso=self.curso, ordem__gte=3).delete()
+        self.assertEqual(reconstruir.call_args_list, [mock.call([self.curso.id]), mock.call([outro.id])])
+
+    def test_rollback_nao_impede_a_proxima_reconstrucao(self):
+        with mock.patch('cursos.signals.reconstruir_resumos') as reconstruir:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(ValueError), transaction.atomic():
+                    Capitulo.objects.create(curso=self.curso, ordem=3, tipo='aula', titulo="Aula", url="x")
+                    raise ValueError
+            reconstruir.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                Capitulo.objects.create(curso=self.curso, ordem=3, tipo='aula', titulo="Aula", url="x")
+        reconstruir.assert_called_once_with([self.curso.id])
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class RegistrarNotasLoteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = Usuario.objects.create_user(username='lms', password='senha123', is_staff=True)
+        cls.aluno = Usuario.objects.create_user(username='aluno_teste', password='senha123', tipo='aluno')
+        cls.fora = Usuario.objects.create_user(username='fora_teste', password='senha123', tipo='aluno')
+        cls.curso = Curso.objects.create(nome="Power BI", descricao="Curso")
+        cls.curso.alunos.add(cls.aluno)
+        cls.aula1 = Capitulo.objects.create(curso=cls.curso, ordem=1, tipo='aula', titulo="Aula 1", url="cap01")
+        cls.ex1 = Capitulo.objects.create(curso=cls.curso, ordem=1.5, tipo='exercicio', titulo="Ex 1", url="cap01_ex")
+        cls.aula2 = Capitulo.objects.create(curso=cls.curso, ordem=2, tipo='aula', titulo="Aula 2", url="cap02")
+        cls.ex2 = Capitulo.objects.create(curso=cls.curso, ordem=2.5, tipo='exercicio', titulo="Ex 2", url="cap02_ex")
+
+    def enviar(self, notas, usuario=None):
+        self.client.force_login(usuario or self.equipe)
+        return self.client.post('/api/notas/lote/', json.dumps({'notas': notas}), content_type='application/json')
+
+    def test_lote_com_resultados_por_item(self):
+        resposta = self.enviar([
+            {'user_id': self.aluno.id, 'capitulo_id': self.ex1.id, 'nota': 9},
+            {'user_id': self.aluno.id, 'capitulo_id': self.ex2.id, 'nota': 5},
+            {'user_id': self.fora.id, 'capitulo_id': self.ex1.id, 'nota': 10},
+            {'user_id': self.aluno.id, 'capitulo_id': 999999, 'nota': 10},
+            {'user_id': self.aluno.id, 'capitulo_id': self.ex1.id, 'nota': 11},
+        ]).json()
+
+        self.assertEqual(resposta['gravados'], 2)
+        self.assertEqual([r['status'] for r in resposta['resultados']],
+                         ['success', 'success', 'error', 'error', 'error'])
+        self.assertTrue(Progresso.objects.get(aluno=self.aluno, capitulo=self.aula1).concluido)
+        self.assertFalse(Progresso.objects.get(aluno=self.aluno, capitulo=self.ex2).concluido)
+        self.assertFalse(Progresso.objects.filter(aluno=self.fora).exists())
+        self.assertEqual(ResumoProgresso.objects.get(aluno=self.aluno, curso=self.curso).percentual, 50)
+
+    def test_exige_token_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.equipe)
+        corpo = json.dumps({'notas': [{'user_id': self.aluno.id, 'capitulo_id': self.ex1.id, 'nota': 0}]})
+        # Um POST forjado por outro site, com o cookie de sessão da equipe, é recusado
+        self.assertEqual(client.post('/api/notas/lote/', corpo, content_type='text/plain').status_code, 403)
+        self.assertFalse(Progresso.objects.filter(aluno=self.aluno).exists())
+
+        client.get('/admin/')
+        resposta = client.post('/api/notas/lote/', corpo, content_type='application/json',
+                               HTTP_X_CSRFTOKEN=client.cookies['csrftoken'].value)
+        self.assertEqual(resposta.json()['gravados'], 1)
+
+    def test_ultima_nota_do_lote_prevalece(self):
+        self.enviar([
+            {'user_id': self.aluno.id, 'capitulo_id': self.ex1.id, 'nota': 6},
+            {'user_id': self.aluno.id, 'capitulo_id': self.ex1.id, 'nota': 8.5},
+        ])
+        self.assertEqual(Progresso.objects.get(aluno=self.aluno, capitulo=self.ex1).nota, Decimal('8.5'))
+
+    def test_aluno_so_envia_as_proprias_notas(self):
+        resposta = self.enviar([
+            {'user_id': self.fora.id, 'capitulo_id': self.ex1.id, 'nota': 9},
+        ], usuario=self.aluno).json()
+        self.assertEqual(resposta['resultados'][0]['status'], 'error')
+
+
+@override_settings(CACHES=CACHE_LOCAL, NOTAS_ASSINCRONAS=True)
+class FilaNotasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = Usuario.objects.create_user(username='aluno_teste', password='senha123', tipo='aluno')
+        cls.curso = Curso.objects.create(nome="Power BI", descricao="Curso")
+        cls.curso.alunos.add(cls.aluno)
+        cls.aula1 = Capitulo.objects.create(curso=cls.curso, ordem=1, tipo='aula', titulo="Aula 1", url="cap01")
+        cls.ex1 = Capitulo.objects.create(curso=cls.curso, ordem=1.5, tipo='exercicio', titulo="Ex 1", url="cap01_ex")
+        cls.aula2 = Capitulo.objects.create(curso=cls.curso, ordem=2, tipo='aula', titulo="Aula 2", url="cap02")
+
+    def enviar_nota(self, capitulo, nota):
+        return self.client.post('/api/nota/', json.dumps({
+            'user_id': self.aluno.id, 'capitulo_id': capitulo.id, 'nota': nota
+        }), content_type='application/json')
+
+    def test_nota_vai_para_a_fila(self):
+        resposta = self.enviar_nota(self.ex1, 9).json()
+        self.assertTrue(resposta['data']['enfileirada'])
+        self.assertEqual(NotaPendente.objects.count(), 1)
+        self.assertFalse(Progresso.objects.exists())
+
+    def test_proxima_aula_liberada_apos_confirmacao(self):
+        self.enviar_nota(self.ex1, 9)
+        self.client.force_login(self.aluno)
+        resposta = self.client.get(f'/cursos/aula/{self.aula2.id}/')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertFalse(NotaPendente.objects.exists())
+        self.assertTrue(Progresso.objects.get(aluno=self.aluno, capitulo=self.aula1).concluido)
+
+    def test_worker_esvazia_a_fila_e_registra_erros(self):
+        fora = Usuario.objects.create_user(username='fora_teste', password='senha123', tipo='aluno')
+        NotaPendente.objects.create(aluno=fora, capitulo=self.ex1, nota=Decimal('9'))
+        self.enviar_nota(self.ex1, 10)
+
+        call_command('processar_notas', '--uma-vez', stdout=StringIO())
+
+        self.assertEqual(ResumoProgresso.objects.get(aluno=self.aluno, curso=self.curso).percentual, 50)
+        pendente = NotaPendente.objects.get()
+        self.assertEqual(pendente.aluno, fora)
+        self.assertIsNotNone(pendente.processada_em)
+        self.assertEqual(pendente.erro, 'Aluno não matriculado neste curso')
+
+    def test_outros_endpoints_de_nota_tambem_enfileiram(self):
+        self.client.post('/cursos/api/nota/', {'user_id': self.aluno.id, 'capitulo_id': self.ex1.id, 'nota': 9})
+        self.client.post('/cursos/api/receber-nota/', {
+            'aluno_id': self.aluno.id, 'capitulo_id': self.ex1.id, 'nota': 7
+        })
+        self.assertEqual(list(NotaPendente.objects.values_list('nota', flat=True)), [Decimal('9'), Decimal('7')])
+        self.assertFalse(Progresso.objects.exists())
+
+    def test_falha_no_lote_nao_trava_as_outras_notas(self):
+        fora = Usuario.objects.create_user(username='fora_teste', password='senha123', tipo='aluno')
+        ruim = NotaPendente.objects.create(aluno=fora, capitulo=self.ex1, nota=Decimal('9'))
+        NotaPendente.objects.create(aluno=self.aluno, capitulo=self.ex1, nota=Decimal('9'))
+        def falhar_com_o_aluno_de_fora(itens):
+            if any(aluno_id == fora.id for aluno_id, _, _ in itens):
+                raise RuntimeError('falhou')
+            return aplicar_notas(itens)
+
+        with mock.patch('cursos.fila.aplicar_notas', side_effect=falhar_com_o_aluno_de_fora), \
+                self.assertLogs('cursos.fila', 'WARNING'):
+            self.assertEqual(processar_lote(), 2)
+
+        self.assertTrue(Progresso.objects.get(aluno=self.aluno, capitulo=self.ex1).concluido)
+        ruim.refresh_from_db()
+        self.assertIsNotNone(ruim.processada_em)
+        self.assertEqual(ruim.erro, 'Erro interno: falhou')
+
+    @override_settings(NOTAS_ASSINCRONAS=False)
+    def test_worker_fica_ocioso_sem_o_modo_assincrono(self):
+        NotaPendente.objects.create(aluno=self.aluno, capitulo=self.ex1, nota=Decimal('9'))
+
+        class Parar(Exception):
+            pass
+
+        with mock.patch('cursos.management.commands.processar_notas.time.sleep', side_effect=Parar) as dormir:
+            with self.assertRaises(Parar):
+                call_command('processar_notas', stdout=StringIO())
+
+        self.assertFalse(NotaPendente.objects.exists())
+        dormir.assert_called_once_with(INTERVALO_OCIOSO)
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class LiberacaoCursoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = Usuario.objects.create_user(username='aluno_teste', password='senha123', tipo='aluno')
+        cls.curso = Curso.objects.create(nome="Power BI", descricao="Curso")
+        cls.curso.alunos.add(cls.aluno)
+        cls.aula1 = Capitulo.objects.create(curso=cls.curso, ordem=1, tipo='aula', titulo="Aula 1", url="cap01")
+        cls.ex1 = Capitulo.objects.create(curso=cls.curso, ordem=1.5, tipo='exercicio', titulo="Ex 1", url="cap01_ex")
+        cls.aula2 = Capitulo.objects.create(curso=cls.curso, ordem=2, tipo='aula', titulo="Aula 2", url="cap02")
+        cls.aula3 = Capitulo.objects.create(curso=cls.curso, ordem=3, tipo='aula', titulo="Aula 3", url="cap03")
+
+    def test_situacao_de_todos_os_capitulos_em_uma_consulta(self):
+        Progresso.objects.create(aluno=self.aluno, capitulo=self.aula1, concluido=True)
+        Progresso.objects.create(aluno=self.aluno, capitulo=self.ex1, nota=9, concluido=True)
+        obter_estrutura(self.curso.id)
+
+        with self.assertNumQueries(1):
+            liberacao = calcular_liberacao(self.aluno, self.curso.id)
+
+        self.assertEqual(liberacao.concluidas, {self.aula1.id})
+        self.assertTrue(liberacao.situacao(self.ex1.id).concluido)
+        self.assertEqual(liberacao.capitulos_liberados, [self.aula1.id, self.aula2.id])
+        self.assertEqual(liberacao.mensagens_bloqueio, {self.aula3.id: "Complete o capítulo anterior"})
+        self.assertEqual(liberacao.percentual, 33)
+
+    def test_exercicio_bloqueado_ate_concluir_a_aula(self):
+        liberacao = calcular_liberacao(self.aluno, self.curso.id)
+        self.assertFalse(liberacao.situacao(self.ex1.id).liberado)
+        self.assertEqual(liberacao.situacao(self.aula2.id).motivo, "Complete o exercício anterior com nota ≥ 8")
+
+    def test_link_direto_para_aula_bloqueada(self):
+        self.client.force_login(self.aluno)
+        resposta = self.client.get(f'/cursos/aula/{self.aula2.id}/')
+        self.assertRedirects(resposta, f'/cursos/{self.curso.id}/')
+        self.assertContains(self.client.get(f'/cursos/{self.curso.id}/'), "Complete o exercício anterior")
+
+    def test_aula_fora_da_estrutura_em_cache(self):
+        self.client.force_login(self.aluno)
+        obter_estrutura(self.curso.id)
+        # bulk_create não dispara os signals: a estrutura em cache ainda não tem a aula
+        aula, = Capitulo.objects.bulk_create([
+            Capitulo(curso=self.curso, ordem=4, tipo='aula', titulo="Aula 4", url="cap04")
+        ])
+        resposta = self.client.get(f'/cursos/aula/{aula.id}/')
+        self.assertRedirects(resposta, f'/cursos/{self.curso.id}/', fetch_redirect_response=False)
+
+
+class PublicacaoPacotesTests(TestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.origem = Path(pasta.name) / 'origem'
+        self.destino = Path(pasta.name) / 'destino'
+        self.pacote = self.origem / 'Power_bi' / 'cap01'
+        (self.pacote / 'assets').mkdir(parents=True)
+        (self.pacote / 'index.html').write_text('<html>' + 'aula ' * 200 + '</html>')
+        (self.pacote / 'assets' / 'audio.mp3').write_bytes(b'\x00' * 100)
+        self.configuracao = override_settings(PACOTES_ROOT=self.destino)
+        self.configuracao.enable()
+        self.addCleanup(self.configuracao.disable)
+
+    def test_publica_versao_por_hash_com_texto_comprimido(self):
+        versao, publicado = publicar_pacotes(self.origem, self.destino, processos=1).pacotes['Power_bi/cap01']
+        self.assertTrue(publicado)
+        publicada = self.destino / 'Power_bi' / 'cap01' / versao
+        self.assertTrue((publicada / 'index.html.gz').exists())
+        self.assertFalse((publicada / 'assets' / 'audio.mp3.gz').exists())
+        self.assertEqual(
+            url_pacote('cursos/captivate_packages/Power_bi/cap01/index.html'),
+            f'/pacotes/Power_bi/cap01/{versao}/index.html'
+        )
+
+    def test_republica_apenas_o_que_mudou(self):
+        versao, _ = publicar_pacotes(self.origem, self.destino, processos=1).pacotes['Power_bi/cap01']
+        relatorio = publicar_pacotes(self.origem, self.destino, processos=1)
+        self.assertEqual(relatorio.pacotes['Power_bi/cap01'], (versao, False))
+        self.assertEqual(relatorio.alterados, 0)
+
+        # Clone novo no build: mesmo conteúdo com outros mtimes não é tratado como mudança
+        for arquivo in self.pacote.rglob('*'):
+            os.utime(arquivo, (time.time() + 60, time.time() + 60))
+        relatorio = publicar_pacotes(self.origem, self.destino, processos=1)
+        self.assertEqual((relatorio.pacotes['Power_bi/cap01'], relatorio.alterados), ((versao, False), 0))
+
+        (self.pacote / 'index.html').write_text('<html>nova versão</html>')
+        relatorio = publicar_pacotes(self.origem, self.destino, processos=1)
+        nova, publicado = relatorio.pacotes['Power_bi/cap01']
+        self.assertTrue(publicado)
+        self.assertNotEqual(nova, versao)
+        self.assertEqual((relatorio.alterados, relatorio.comprimidos), (1, 1))
+        self.assertIn(nova, url_pacote('cursos/captivate_packages/Power_bi/cap01/index.html'))
+
+        # O arquivo que não mudou é reaproveitado da versão anterior
+        audio = 'Power_bi/cap01/{}/assets/audio.mp3'
+        self.assertTrue(os.path.samefile(self.destino / audio.format(versao), self.destino / audio.format(nova)))
+
+    def test_middleware_serve_versoes_mas_nao_manifesto_e_indice(self):
+        versao, _ = publicar_pacotes(self.origem, self.destino, processos=1).pacotes['Power_bi/cap01']
+        middleware = PacotesWhiteNoiseMiddleware(lambda request: None)
+        self.assertIsNotNone(middleware.files.get(f'/pacotes/Power_bi/cap01/{versao}/index.html'))
+        self.assertIsNone(middleware.files.get('/pacotes/manifest.json'))
+        self.assertIsNone(middleware.files.get('/pacotes/indice.json'))
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ImportPackagesTests(TestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.origem = Path(pasta.name)
+        self.curso = Curso.objects.create(nome="Power BI", descricao="Curso")
+        for nome in ['cap01', 'cap01_ex', 'cap02']:
+            (self.origem / 'Power_BI' / nome).mkdir(parents=True)
+            (self.origem / 'Power_BI' / nome / 'index.html').write_text('<html></html>')
+        (self.origem / 'Power_BI' / 'cap03').mkdir()
+
+    def importar(self, *args):
+        saida = StringIO()
+        call_command('import_packages', '--origem', str(self.origem), *args, stdout=saida)
+        return saida.getvalue()
+
+    def test_dry_run_nao_grava(self):
+        saida = self.importar('--dry-run')
+        self.assertIn('3 a criar', saida)
+        self.assertIn('cap03: pasta sem index.html', saida)
+        self.assertFalse(Capitulo.objects.exists())
+
+    def test_cria_atualiza_e_remove_em_lote(self):
+        antigo = Capitulo.objects.create(curso=self.curso, ordem=9, tipo='aula', titulo="Antigo", url="x")
+        Capitulo.objects.create(curso=self.curso, ordem=2, tipo='aula', titulo="Capítulo 2 (Aula)", url="velha")
+
+        self.assertIn('1 sem pasta (mantidos)', self.importar())
+        self.assertTrue(Capitulo.objects.filter(id=antigo.id).exists())
+
+        self.importar('--remover')
+
+        capitulos = Capitulo.objects.filter(curso=self.curso)
+        self.assertEqual(sorted(capitulos.values_list('codigo', flat=True)), ['cap01', 'cap01_ex', 'cap02'])
+        self.assertFalse(Capitulo.objects.filter(id=antigo.id).exists())
+        self.assertEqual(
+            capitulos.get(codigo='cap02').url, 'cursos/captivate_packages/Power_BI/cap02/index.html'
+        )
+        self.assertEqual(capitulos.get(codigo='cap01_ex').ordem, Decimal('1.5'))
+        self.assertEqual(len(obter_estrutura(self.curso.id)), 2)
+
+    def test_pasta_sem_index_nao_remove_capitulo_nem_progresso(self):
+        self.importar()
+        aluno = Usuario.objects.create_user(username='aluno', password='senha123', tipo='aluno')
+        capitulo = Capitulo.objects.get(curso=self.curso, codigo='cap02')
+        Progresso.objects.create(aluno=aluno, capitulo=capitulo, concluido=True)
+        # Pacote sendo reenviado: a pasta existe, mas ainda sem index.html
+        (self.origem / 'Power_BI' / 'cap02' / 'index.html').unlink()
+
+        saida = self.importar('--remover')
+
+        self.assertIn('cap02: pasta sem index.html', saida)
+        self.assertIn('0 a remover', saida)
+        self.assertTrue(Progresso.objects.filter(aluno=aluno, capitulo=capitulo).exists())
+
+    def test_curso_sem_pasta_nao_perde_capitulos(self):
+        outro = Curso.objects.create(nome="Java", descricao="Curso")
+        Capitulo.objects.create(curso=outro, ordem=1, tipo='aula', titulo="Aula 1", url="cap01")
+        self.assertIn('Pasta não encontrada', self.importar('--curso', str(outro.id)))
+        self.assertTrue(Capitulo.objects.filter(curso=outro).exists())
+
+
+class BoletimApiV2Tests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = Usuario.objects.create_user(username='aluno_teste', password='senha123', tipo='aluno')
+        cls.cursos = [Curso.objects.create(nome=f"Curso {i}", descricao="Curso") for i in range(2)]
+        for curso in cls.cursos:
+            for ordem in range(1, 6):
+                Capitulo.objects.create(curso=curso, ordem=ordem, tipo='aula', titulo=f"Aula {ordem}", url="a")
+                exercicio = Capitulo.objects.create(
+                    curso=curso, ordem=ordem + 0.5, tipo='exercicio', titulo=f"Ex {ordem}", url="e"
+                )
+                Progresso.objects.create(aluno=cls.aluno, capitulo=exercicio, nota=ordem + 4)
+
+    def setUp(self):
+        self.client.force_login(self.aluno)
+
+    def test_percorre_todas_as_paginas_em_ordem(self):
+        url = '/api/v2/boletim/?limite=3'
+        itens = []
+        while url:
+            resposta = self.client.get(url).json()
+            itens.extend(resposta['results'])
+            url = resposta['next']
+        self.assertEqual(len(itens), 10)
+        self.assertEqual(
+            [(item['curso_id'], item['capitulo_ordem']) for item in itens],
+            sorted((item['curso_id'], item['capitulo_ordem']) for item in itens)
+        )
+
+    def test_quantidade_de_consultas_nao_depende_das_notas(self):
+        self.client.get('/api/v2/boletim/?limite=2')
+        with self.assertNumQueries(1):
+            self.client.get('/api/v2/boletim/?limite=2')
+        with self.assertNumQueries(1):
+            self.client.get('/api/v2/boletim/?limite=10')
+
+    def test_filtra_por_curso(self):
+        resposta = self.client.get(f'/api/v2/boletim/?curso={self.cursos[1].id}').json()
+        self.assertEqual({item['curso_id'] for item in resposta['results']}, {self.cursos[1].id})
+        self.assertIsNone(resposta['next'])
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.client.get('/api/v2/boletim/?cursor=xyz').status_code, 400)
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ExportacaoBoletimTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.escola = Usuario.objects.create_user(username='escola_teste', password='senha123', tipo='escola')
+        cls.curso = Curso.objects.create(nome="Power BI", descricao="Curso")
+        cls.curso.escolas.add(cls.escola)
+        Capitulo.objects.create(curso=cls.curso, ordem=1, tipo='aula', titulo="Aula 1", url="cap01")
+        cls.ex1 = Capitulo.objects.create(curso=cls.curso, ordem=1.5, tipo='exercicio', titulo="Ex 1", url="cap01_ex")
+        Capitulo.objects.create(curso=cls.curso, ordem=2, tipo='aula', titulo="Aula 2", url="cap02")
+        cls.ex2 = Capitulo.objects.create(curso=cls.curso, ordem=2.5, tipo='exercicio', titulo="Ex 2", url="cap02_ex")
+        for nome, notas in [('ana', [9, None]), ('bia', [None, None]), ('caio', [7, 10])]:
+            aluno = Usuario.objects.create_user(username=nome, password='senha123', tipo='aluno', escola=cls.escola)
+            for exercicio, nota in zip([cls.ex1, cls.ex2], notas):
+                if nota is not None:
+                    Progresso.objects.create(aluno=aluno, capitulo=exercicio, nota=nota)
+        Usuario.objects.create_user(username='outra_escola', password='senha123', tipo='aluno')
+
+    def exportar(self, formato):
+        self.client.force_login(self.escola)
+        resposta = self.client.get(f'/cursos/boletim/exportar/?formato={formato}')
+        self.assertTrue(resposta.streaming)
+        return b''.join(resposta.streaming_content)
+
+    def test_csv_com_uma_coluna_por_exercicio(self):
+        linhas = self.exportar('csv').decode('utf-8-sig').splitlines()
+        self.assertEqual(linhas, [
+            'Aluno,Nome,Power BI - Ex 1,Power BI - Ex 2',
+            'ana,,9.00,',
+            'bia,,,',
+            'caio,,7.00,10.00',
+        ])
+
+    def test_csv_neutraliza_formulas(self):
+        Usuario.objects.filter(username='ana').update(first_name='=HYPERLINK("http://x")', last_name='')
+        Usuario.objects.filter(username='bia').update(first_name='@SOMA(A1)', last_name='')
+        linhas = self.exportar('csv').decode('utf-8-sig').splitlines()
+        self.assertEqual(linhas[1], 'ana,"\'=HYPERLINK(""http://x"")",9.00,')
+        self.assertEqual(linhas[2], "bia,'@SOMA(A1),,")
+
+    def test_xlsx_valido(self):
+        with zipfile.ZipFile(BytesIO(self.exportar('xlsx'))) as arquivo:
+            planilha = arquivo.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(planilha.count('<row>'), 4)
+        self.assertIn('<c><v>10.00</v></c>', planilha)
+
+    def test_apenas_escolas(self):
+        self.client.force_login(Usuario.objects.get(username='ana'))
+        self.assertEqual(self.client.get('/cursos/boletim/exportar/').status_code, 302)
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class OrcamentoConsultasTests(ConsultasTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = Usuario.objects.create_user(username='aluno_teste', password='senha123', tipo='aluno')
+        cls.curso = Curso.objects.create(nome="Curso", descricao="Curso")
+        cls.curso.alunos.add(cls.aluno)
+        for ordem in range(1, 6):
+            aula = Capitulo.objects.create(curso=cls.curso, ordem=ordem, tipo='aula', titulo=f"Aula {ordem}", url="a")
+            exercicio = Capitulo.objects.create(
+                curso=cls.curso, ordem=ordem + 0.5, tipo='exercicio', titulo=f"Ex {ordem}", url="e"
+            )
+            Progresso.objects.create(aluno=cls.aluno, capitulo=aula, concluido=True)
+            Progresso.objects.create(aluno=cls.aluno, capitulo=exercicio, nota=9)
+        # Os resumos já existem em produção (gravados com as notas); o cálculo na leitura é só o fallback
+        reconstruir_resumos([cls.curso.id])
+
+    def setUp(self):
+        self.client.force_login(self.aluno)
+
+    def test_views_dentro_do_orcamento(self):
+        for url in [
+            '/cursos/meus-cursos/',
+            f'/cursos/meus-cursos/{self.curso.id}/',
+            f'/cursos/{self.curso.id}/',
+            '/cursos/boletim/',
+            '/api/v2/boletim/',
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(self.assertDentroDoOrcamento(url).status_code, 200)
+
+    def test_detecta_n_mais_1(self):
+        with MonitorConsultas() as monitor:
+            for progresso in Progresso.objects.filter(aluno=self.aluno):
+                progresso.capitulo.titulo
+        self.assertEqual(monitor.total, 11)
+        [(formato, vezes, origem)] = monitor.repetidas
+        self.assertEqual(vezes, 10)
+        self.assertIn('cursos/tests.py', origem)
+
+        with self.assertSemNMais1():
+            list(Progresso.objects.filter(aluno=self.aluno).select_related('capitulo'))
+
+    def test_formato_ignora_parametros(self):
+        self.assertEqual(
+            formato_consulta("SELECT * FROM t WHERE id IN (%s, %s, %s) AND nome = 'x' LIMIT 21"),
+            formato_consulta("SELECT * FROM t WHERE id IN (%s) AND nome = 'outro' LIMIT 1"),
+        )
+
+    @override_settings(CONSULTAS_AMOSTRAGEM=1.0)
+    def test_middleware_registra_requisicao(self):
+        with self.assertLogs('cursos.consultas', level='INFO') as logs:
+            self.client.get('/api/v2/boletim/')
+        dados = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(dados['url_name'], 'boletim_notas_api_v2')
+        self.assertEqual(dados['orcamento'], 5)
+        self.assertEqual(dados['n_mais_1'], [])
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class BenchmarkViewsTests(TestCase):
+    def test_mede_todas_as_views(self):
+        dados = popular_banco(alunos=5, cursos=2, aulas=4)
+        resultado = executar_benchmark(dados, iteracoes=3, aquecimento=1)
+        self.assertEqual(resultado['meta']['alunos'], 5)
+        self.assertEqual(set(resultado['views']), {
+            'meus_cursos', 'detalhes_curso', 'assistir_aula', 'registrar_nota', 'boletim_notas', 'dashboard_escola'
+        })
+        for nome, metricas in resultado['views'].items():
+            self.assertLessEqual(metricas['p50_ms'], metricas['p95_ms'])
+            self.assertLessEqual(metricas['p95_ms'], metricas['p99_ms'])
+            if nome == 'dashboard_escola':
+                # Depois do aquecimento, as estatísticas e o usuário vêm do cache
+                self.assertEqual(metricas['consultas'], 0)
+            else:
+                self.assertGreater(metricas['consultas'], 0)
+
+    def test_percentil(self):
+        self.assertEqual(percentil(list(range(101)), 95), 95)
+        self.assertEqual(percentil([1, 3], 50), 2)
+
+    def test_compara_com_baseline(self):
+        baseline = {'views': {'meus_cursos': {'p95_ms': 10, 'p99_ms': 12, 'consultas': 4, 'memoria_kb': 40}}}
+        igual = {'views': {'meus_cursos': {'p95_ms': 10.5, 'p99_ms': 12.5, 'consultas': 4, 'memoria_kb': 41}}}
+        pior = {'views': {'meus_cursos': {'p95_ms': 20, 'p99_ms': 12, 'consultas': 5, 'memoria_kb': 40}}}
+        self.assertEqual(comparar(igual, baseline), [])
+        self.assertEqual(comparar(pior, baseline), [
+            ('meus_cursos', 'consultas', 4, 5),
+            ('meus_cursos', 'p95_ms', 10, 20),
+        ])
+
+
+class GenerateLoadDataTests(TestCase):
+    def _notas(self, prefixo):
+        return list(
+            Progresso.objects.filter(aluno__username__startswith=f'{prefixo}_')
+            .order_by('aluno__username', 'capitulo__curso__nome', 'capitulo__ordem')
+            .values_list('aluno__username', 'capitulo__ordem', 'concluido', 'nota')
+        )
+
+    def test_mesma_semente_gera_os_mesmos_dados(self):
+        argumentos = dict(escolas=2, professores=2, alunos=15, cursos=4, aulas=5, cursos_por_aluno=2, seed=7)
+        resumo = gerar_carga(prefixo='a', **argumentos)
+        gerar_carga(prefixo='b', **argumentos)
+
+        self.assertEqual((resumo.escolas, resumo.professores, resumo.alunos, resumo.matriculas), (2, 4, 30, 60))
+        self.assertEqual(Progresso.objects.filter(aluno__username__startswith='a_').count(), resumo.progressos)
+        self.assertFalse(Progresso.objects.exclude(curso=F('capitulo__curso')).exists())
+        self.assertEqual(
+            [(username[2:], *linha) for username, *linha in self._notas('a')],
+            [(username[2:], *linha) for username, *linha in self._notas('b')],
+        )
+        self.assertEqual(ResumoProgresso.objects.filter(aluno__username__startswith='a_').count(), 60)
+
+    def test_copy_distingue_string_vazia_de_null(self):
+        campos = [Usuario._meta.get_field(nome) for nome in ('username', 'telefone', 'cpf', 'escola')]
+        dados = _serializar_copy(campos, [Usuario(username='x', telefone='', cpf=None, escola_id=None)])
+        self.assertEqual(dados, 'x,,\\N,\\N\r\n')
+
+    def test_usuarios_gerados_fazem_login(self):
+        call_command('generate_load_data', escolas=1, professores=1, alunos=2, cursos=2, aulas=2, stdout=StringIO())
+        self.assertTrue(self.client.login(username='carga_e000_aluno_000000', password='senha123'))
+        aluno = Usuario.objects.get(username='carga_e000_aluno_000000')
+        self.assertEqual(aluno.tipo, 'aluno')
+        self.assertEqual(set(aluno.cursos_matriculados.values_list('escolas', flat=True)), {aluno.escola_id})
+
+
+class CacheForaDoAr(BaseCache):
+    """Backend de cache que falha em toda operação, como um Redis fora do ar"""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+
+    def _falhar(self, *args, **kwargs):
+        raise ConnectionError('cache fora do ar')
+
+    add = get = set = delete = incr = get_many = set_many = clear = _falhar
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class FragmentosCursoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = Usuario.objects.create_user(username='aluno_teste', password='senha123', tipo='aluno')
+        cls.curso = Curso.objects.create(nome="Curso", descricao="Curso")
+        cls.curso.alunos.add(cls.aluno)
+        cls.aula1 = Capitulo.objects.create(curso=cls.curso, ordem=1, tipo='aula', titulo="Aula 1", url="a")
+        cls.aula2 = Capitulo.objects.create(curso=cls.curso, ordem=2, tipo='aula', titulo="Aula 2", url="b")
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client.force_login(self.aluno)
+        self.url = f'/cursos/meus-cursos/{self.curso.id}/'
+
+    def test_segunda_visita_usa_o_cache(self):
+        antes = estatisticas_fragmentos()
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            resposta = self.client.get(self.url)
+        self.assertContains(resposta, "0%")
+        depois = estatisticas_fragmentos()
+        self.assertEqual(depois['faltas'] - antes['faltas'], 1)
+        self.assertEqual(depois['acertos'] - antes['acertos'], 1)
+
+    def test_gravar_progresso_invalida_o_fragmento(self):
+        self.assertContains(self.client.get(self.url), "Complete o capítulo anterior")
+        Progresso.objects.create(aluno=self.aluno, capitulo=self.aula1, concluido=True)
+        resposta = self.client.get(self.url)
+        self.assertNotContains(resposta, "Complete o capítulo anterior")
+        self.assertContains(resposta, "50%")
+        self.assertContains(self.client.get('/cursos/meus-cursos/'), "50%")
+
+    def test_renomear_curso_invalida_a_lista(self):
+        self.assertContains(self.client.get('/cursos/meus-cursos/'), "Curso")
+        self.curso.nome = "Curso Renomeado"
+        self.curso.save()
+        self.assertContains(self.client.get('/cursos/meus-cursos/'), "Curso Renomeado")
+
+    @override_settings(
+        CACHES={**CACHE_LOCAL, 'fragmentos': {'BACKEND': 'cursos.tests.CacheForaDoAr'}},
+        FRAGMENTOS_CACHE='fragmentos'
+    )
+    def test_cache_fora_do_ar_renderiza_direto(self):
+        erros = estatisticas_fragmentos()['erros']
+        with self.assertLogs('cursos.fragmentos', level='WARNING'):
+            Progresso.objects.create(aluno=self.aluno, capitulo=self.aula1, concluido=True)
+            resposta = self.client.get(self.url)
+        self.assertContains(resposta, "50%")
+        self.assertGreater(estatisticas_fragmentos()['erros'], erros)
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class MatriculasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = Usuario.objects.create_user(username='aluno_teste', password='senha123', tipo='aluno')
+        cls.escola = Usuario.objects.create_user(username='escola_teste', password='senha123', tipo='escola')
+        cls.curso = Curso.objects.create(nome="Curso", descricao="Curso")
+        cls.outro = Curso.objects.create(nome="Outro", descricao="Curso")
+        cls.curso.escolas.add(cls.escola)
+        Capitulo.objects.create(curso=cls.curso, ordem=1, tipo='aula', titulo="Aula 1", url="a")
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_conjunto_em_cache_e_invalidado_pelas_alteracoes(self):
+        self.assertEqual(cursos_matriculados(self.aluno.id), frozenset())
+        self.curso.alunos.add(self.aluno)
+        with self.assertNumQueries(1):
+            self.assertEqual(cursos_matriculados(self.aluno.id), {self.curso.id})
+        with self.assertNumQueries(0):
+            cursos_matriculados(self.aluno.id)
+
+        self.aluno.cursos_matriculados.add(self.outro)
+        self.assertEqual(cursos_matriculados(self.aluno.id), {self.curso.id, self.outro.id})
+        self.outro.alunos.remove(self.aluno)
+        self.assertEqual(cursos_matriculados(self.aluno.id), {self.curso.id})
+        self.curso.alunos.clear()
+        self.assertEqual(cursos_matriculados(self.aluno.id), frozenset())
+        self.assertFalse(esta_matriculado(self.aluno.id, self.curso.id))
+
+    def test_custo_nao_depende_do_tamanho_da_turma(self):
+        self.curso.alunos.add(self.aluno)
+        self.client.force_login(self.aluno)
+        url = f'/cursos/aula/{Capitulo.objects.get(curso=self.curso).id}/'
+
+        def consultas():
+            caches['default'].clear()
+            caches['sessoes'].clear()
+            with MonitorConsultas() as monitor:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            return monitor.total
+
+        antes = consultas()
+        self.curso.alunos.add(*Usuario.objects.bulk_create(
+            Usuario(username=f'colega_{i}', tipo='aluno') for i in range(20)
+        ))
+        self.assertEqual(consultas(), antes)
+
+    def test_acesso_da_escola(self):
+        self.client.force_login(self.escola)
+        self.assertEqual(self.client.get(f'/cursos/{self.curso.id}/').status_code, 200)
+        self.assertRedirects(
+            self.client.get(f'/cursos/{self.outro.id}/'), '/cursos/meus-cursos/', fetch_redirect_response=False
+        )
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class MatriculaEmLoteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.escola = Usuario.objects.create_user(username='escola_teste', password='senha123', tipo='escola')
+        outra = Usuario.objects.create(username='outra_escola', tipo='escola')
+        cls.curso = Curso.objects.create(nome="Curso", descricao="Curso")
+        cls.curso.escolas.add(cls.escola)
+        cls.alunos = Usuario.objects.bulk_create(
+            Usuario(username=f'aluno_{i}', email=f'aluno_{i}@escola.com', cpf=f'123.456.789-{i:02d}',
+                    tipo='aluno', escola=cls.escola)
+            for i in range(60)
+        )
+        Usuario.objects.create(username='de_fora', tipo='aluno', escola=outra)
+        cls.curso.alunos.add(cls.alunos[0])
+
+    def setUp(self):
+        self.client.force_login(self.escola)
+
+    def test_api_resolve_username_email_e_cpf(self):
+        with self.assertNumQueries(6):
+            resposta = self.client.post('/api/matriculas/lote/', json.dumps({
+                'curso_id': self.curso.id,
+                'alunos': ['aluno_0', 'aluno_1', 'ALUNO_2@escola.com', '12345678903', 'de_fora', 'ninguem', 'aluno_1'],
+            }), content_type='application/json').json()
+        self.assertEqual(resposta['adicionados'], ['aluno_1', 'ALUNO_2@escola.com', '12345678903'])
+        self.assertEqual(resposta['ja_matriculados'], ['aluno_0'])
+        self.assertEqual(resposta['desconhecidos'], ['de_fora', 'ninguem'])
+        self.assertEqual(self.curso.alunos.count(), 4)
+
+    def test_api_exige_token_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.escola)
+        corpo = json.dumps({'curso_id': self.curso.id, 'alunos': ['aluno_1']})
+        # Um POST forjado por outro site, com o cookie de sessão da escola, é recusado
+        self.assertEqual(client.post('/api/matriculas/lote/', corpo, content_type='text/plain').status_code, 403)
+        self.assertFalse(self.curso.alunos.filter(username='aluno_1').exists())
+
+        client.get(f'/cursos/curso/{self.curso.id}/matricular/')
+        resposta = client.post('/api/matriculas/lote/', corpo, content_type='application/json',
+                               HTTP_X_CSRFTOKEN=client.cookies['csrftoken'].value)
+        self.assertEqual(resposta.json()['adicionados'], ['aluno_1'])
+
+    def test_api_recusa_curso_de_outra_escola(self):
+        curso = Curso.objects.create(nome="Outro", descricao="Curso")
+        resposta = self.client.post('/api/matriculas/lote/', json.dumps({
+            'curso_id': curso.id, 'alunos': ['aluno_1']
+        }), content_type='application/json')
+        self.assertEqual(resposta.status_code, 404)
+
+    def test_upload_csv(self):
+        arquivo = SimpleUploadedFile('alunos.csv', 'nome;email\nAluno 5;aluno_5@escola.com\nX;x@y.com\n'.encode())
+        resposta = self.client.post(f'/cursos/curso/{self.curso.id}/matricular/', {'arquivo': arquivo})
+        self.assertEqual(resposta.context['resultado'].adicionados, ['aluno_5@escola.com'])
+        self.assertEqual(resposta.context['resultado'].desconhecidos, ['x@y.com'])
+        self.assertTrue(self.curso.alunos.filter(username='aluno_5').exists())
+
+    def test_busca_paginada_so_mostra_alunos_da_escola_fora_do_curso(self):
+        url = f'/cursos/curso/{self.curso.id}/matricular/'
+        pagina = self.client.get(url).context['pagina']
+        self.assertEqual(pagina.paginator.count, 59)
+        self.assertEqual(len(pagina.object_list), 50)
+        self.assertEqual([aluno.username for aluno in self.client.get(url, {'q': 'aluno_59'}).context['pagina']], ['aluno_59'])
+
+        resposta = self.client.post(url, {'alunos': [self.alunos[7].id, self.alunos[0].id]})
+        self.assertEqual(resposta.context['resultado'].adicionados, ['aluno_7'])
+        self.assertEqual(resposta.context['resultado'].ja_matriculados, ['aluno_0'])
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class CursoDoProgressoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = Usuario.objects.create_user(username='aluno_teste', password='senha123', tipo='aluno')
+        cls.curso = Curso.objects.create(nome="Power BI", descricao="Curso")
+        cls.outro = Curso.objects.create(nome="Excel", descricao="Curso")
+        cls.curso.alunos.add(cls.aluno)
+        cls.aula1 = Capitulo.objects.create(curso=cls.curso, ordem=1, tipo='aula', titulo="Aula 1", url="cap01")
+        cls.ex1 = Capitulo.objects.create(curso=cls.curso, ordem=1.5, tipo='exercicio', titulo="Ex 1", url="cap01_ex")
+
+    def test_curso_preenchido_no_save_e_no_lote(self):
+        progresso = Progresso.objects.create(aluno=self.aluno, capitulo=self.aula1, concluido=True)
+        self.assertEqual(progresso.curso_id, self.curso.id)
+
+        self.client.force_login(Usuario.objects.create_user(username='lms', password='senha123', is_staff=True))
+        self.client.post('/api/notas/lote/', json.dumps({'notas': [
+            {'user_id': self.aluno.id, 'capitulo_id': self.ex1.id, 'nota': 9},
+        ]}), content_type='application/json')
+        self.assertEqual(
+            dict(Progresso.objects.filter(aluno=self.aluno).values_list('capitulo_id', 'curso_id')),
+            {self.aula1.id: self.curso.id, self.ex1.id: self.curso.id}
+        )
+
+    def test_capitulo_que_muda_de_curso_leva_o_progresso(self):
+        Progresso.objects.create(aluno=self.aluno, capitulo=self.ex1, nota=9)
+        self.ex1.curso = self.outro
+        self.ex1.save()
+        self.assertEqual(Progresso.objects.get(capitulo=self.ex1).curso_id, self.outro.id)
+
+    def test_preenchimento_em_lotes_e_retomavel(self):
+        for ordem in range(2, 7):
+            capitulo = Capitulo.objects.create(curso=self.curso, ordem=ordem, tipo='aula', titulo="Aula", url="x")
+            Progresso.objects.create(aluno=self.aluno, capitulo=capitulo, concluido=True)
+        Progresso.objects.update(curso=None)
+
+        faixas = []
+        total = preencher_curso_progresso(Progresso, Capitulo, batch_size=2,
+                                          progresso=lambda preenchidos, ultimo_id: faixas.append(preenchidos))
+        self.assertEqual(total, 5)
+        self.assertEqual(len(faixas), 3)
+        self.assertFalse(Progresso.objects.filter(curso__isnull=True).exists())
+
+        saida = StringIO()
+        call_command('preencher_curso_progresso', stdout=saida)
+        self.assertIn('0 registros de progresso preenchidos', saida.getvalue())
+
+    def test_registros_ainda_sem_curso_continuam_contando(self):
+        # Gravados pela versão anterior durante o deploy, antes do preenchimento
+        Progresso.objects.create(aluno=self.aluno, capitulo=self.aula1, concluido=True)
+        Progresso.objects.create(aluno=self.aluno, capitulo=self.ex1, nota=9)
+        Progresso.objects.update(curso=None)
+
+        self.assertEqual(progresso_do_aluno(self.aluno, [self.curso]), {self.curso.id: 100})
+        self.assertEqual(reconstruir_resumos([self.curso.id]), 1)
+        resumo = ResumoProgresso.objects.get(aluno=self.aluno, curso=self.curso)
+        self.assertEqual((resumo.percentual, resumo.melhor_nota), (100, 9))
+        self.assertEqual(self.curso.get_progresso_aluno(self.aluno).count(), 2)
+        self.assertEqual(list(montar_mapa(self.curso.id, 1).notas), [-1, 900])
+
+        self.client.force_login(self.aluno)
+        self.assertContains(self.client.get('/cursos/boletim/'), "Power BI")
+        self.client.force_login(Usuario.objects.create_superuser(username='admin', password='senha123'))
+        self.assertContains(self.client.get('/admin/cursos/progresso/'), "Power BI")
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class EstatisticasEscolaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.escola = Usuario.objects.create_user(username='escola', password='senha123', tipo='escola')
+        outra = Usuario.objects.create_user(username='outra', password='senha123', tipo='escola')
+        cls.excel = Curso.objects.create(nome="Excel", descricao="Curso")
+        cls.word = Curso.objects.create(nome="Word", descricao="Curso")
+        cls.excel.escolas.add(cls.escola, outra)
+        cls.word.escolas.add(cls.escola)
+        aula = Capitulo.objects.create(curso=cls.excel, ordem=1, tipo='aula', titulo="Aula 1", url="cap01")
+        exercicio = Capitulo.objects.create(curso=cls.excel, ordem=1.5, tipo='exercicio', titulo="Ex 1", url="ex01")
+        Capitulo.objects.create(curso=cls.excel, ordem=2, tipo='aula', titulo="Aula 2", url="cap02")
+
+        cls.ana, cls.bia, cls.caio = [
+            Usuario.objects.create_user(username=nome, password='senha123', tipo='aluno', escola=cls.escola)
+            for nome in ('ana', 'bia', 'caio')
+        ]
+        de_fora = Usuario.objects.create_user(username='fora', password='senha123', tipo='aluno', escola=outra)
+        cls.excel.alunos.add(cls.ana, cls.bia, de_fora)
+        cls.word.alunos.add(cls.caio)
+        Usuario.objects.create_user(username='prof', password='senha123', tipo='professor', escola=cls.escola)
+
+        # Ana conclui o curso, Bia tira 6 e o aluno da outra escola (que não conta) tira 10
+        for aluno, nota in ((cls.ana, 9), (cls.bia, 6), (de_fora, 10)):
+            Progresso.objects.create(aluno=aluno, capitulo=exercicio, nota=nota)
+        Progresso.objects.create(aluno=cls.ana, capitulo=aula, concluido=True)
+        Progresso.objects.filter(aluno=cls.bia).update(atualizado_em=timezone.now() - timedelta(days=30))
+        Progresso.objects.create(aluno=cls.ana, capitulo=Capitulo.objects.get(curso=cls.excel, ordem=2), concluido=True)
+        reconstruir_resumos([cls.excel.id, cls.word.id])
+        Certificado.objects.create(aluno=cls.ana, curso=cls.excel)
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_estatisticas_por_curso_so_com_alunos_da_escola(self):
+        with self.assertNumQueries(7):
+            dados = estatisticas_escola(self.escola)
+        self.assertEqual((dados['total_alunos'], dados['total_professores'], dados['ativos']), (3, 1, 1))
+        excel, word = dados['cursos']
+        self.assertEqual(excel, {
+            'id': self.excel.id, 'nome': 'Excel', 'matriculados': 2, 'concluintes': 1, 'taxa_conclusao': 50,
+            'media_notas': 7.5, 'certificados': 1, 'ativos': 1,
+        })
+        self.assertEqual((word['matriculados'], word['taxa_conclusao'], word['media_notas']), (1, 0, None))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(estatisticas_escola(self.escola), dados)
+
+    def test_dashboard_e_api(self):
+        self.client.force_login(self.escola)
+        resposta = self.client.get('/usuarios/escola/dashboard/')
+        self.assertContains(resposta, '<td>Excel</td>', html=False)
+        self.assertContains(resposta, '50%')
+
+        dados = self.client.get('/api/escola/estatisticas/').json()
+        self.assertEqual(dados['status'], 'success')
+        self.assertEqual([curso['nome'] for curso in dados['cursos']], ['Excel', 'Word'])
+
+        self.client.force_login(self.ana)
+        self.assertEqual(self.client.get('/api/escola/estatisticas/').status_code, 403)
+
+    def test_recalculo_unico(self):
+        def nao_recalcular():
+            raise AssertionError('Recalculou em paralelo')
+
+        # Vencido e com a trava de outro processo: devolve o valor anterior
+        caches['default'].set('teste', (0, 'anterior'), 60)
+        caches['default'].add('teste:trava', 'outro', 60)
+        self.assertEqual(calcular_uma_vez('teste', nao_recalcular, 60), 'anterior')
+
+        # Sem valor nenhum: espera o recálculo em andamento em vez de calcular de novo
+        caches['default'].delete('teste')
+        temporizador = threading.Timer(0.2, caches['default'].set, ('teste', (time.time() + 60, 'novo'), 60))
+        temporizador.start()
+        self.addCleanup(temporizador.cancel)
+        self.assertEqual(calcular_uma_vez('teste', nao_recalcular, 60), 'novo')
+
+        # Sem valor e o recálculo do outro não termina: espera pouco e calcula
+        caches['default'].delete('teste')
+        with mock.patch('cursos.estatisticas.time.sleep', wraps=time.sleep) as dormir:
+            inicio = time.monotonic()
+            self.assertEqual(calcular_uma_vez('teste', lambda: 'calculado', 60), 'calculado')
+        self.assertLess(time.monotonic() - inicio, 2)
+        self.assertLess(dormir.call_count, 15)
+
+        # Vencido e sem trava: recalcula
+        caches['default'].delete('teste:trava')
+        caches['default'].set('teste', (0, 'anterior'), 60)
+        self.assertEqual(calcular_uma_vez('teste', lambda: 'recalculado', 60), 'recalculado')
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class MapaCalorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.curso = Curso.objects.create(nome="Excel", descricao="Curso")
+        cls.aula = Capitulo.objects.create(curso=cls.curso, ordem=1, tipo='aula', titulo="Aula 1", url="cap01")
+        cls.exercicio = Capitulo.objects.create(curso=cls.curso, ordem=1.5, tipo='exercicio', titulo="Ex 1", url="ex01")
+        cls.aula2 = Capitulo.objects.create(curso=cls.curso, ordem=2, tipo='aula', titulo="Aula 2", url="cap02")
+        cls.ana = Usuario.objects.create_user(username='ana', first_name='Ana', password='senha123', tipo='aluno')
+        cls.bia = Usuario.objects.create_user(username='bia', first_name='Bia', password='senha123', tipo='aluno')
+        cls.curso.alunos.add(cls.ana, cls.bia)
+        cls.professor = Usuario.objects.create_user(username='prof', password='senha123', tipo='professor')
+        cls.curso.professores.add(cls.professor)
+        Progresso.objects.create(aluno=cls.ana, capitulo=cls.aula, concluido=True)
+        Progresso.objects.create(aluno=cls.ana, capitulo=cls.exercicio, nota=Decimal('8.75'))
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_mapa_montado_com_uma_consulta_de_progresso_e_lido_do_cache(self):
+        # Nome do curso, estrutura, matrículas e progresso
+        with self.assertNumQueries(4):
+            mapa = obter_mapa(self.curso.id)
+        self.assertEqual([nome for _, nome in mapa.alunos], ['Ana', 'Bia'])
+        self.assertEqual([capitulo[0] for capitulo in mapa.capitulos], [self.aula.id, self.exercicio.id, self.aula2.id])
+        self.assertEqual(mapa.concluido.tolist(), [1, 1, -1, -1, -1, -1])
+        self.assertEqual(mapa.notas.tolist(), [-1, 875, -1, -1, -1, -1])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(obter_mapa(self.curso.id).como_dict(), mapa.como_dict())
+        # Os arrays vão comprimidos para o cache
+        self.assertEqual(pickle.loads(pickle.dumps(mapa)).notas, mapa.notas)
+
+    def test_gravacao_de_progresso_atualiza_o_mapa_sem_remontar(self):
+        versao = obter_mapa(self.curso.id).versao
+        with self.captureOnCommitCallbacks(execute=True):
+            Progresso.objects.create(aluno=self.bia, capitulo=self.aula2, concluido=True)
+        # Atualizado no lugar: nada é remontado
+        with self.assertNumQueries(0):
+            mapa = obter_mapa(self.curso.id)
+        self.assertNotEqual(mapa.versao, versao)
+        self.assertEqual(mapa.concluido[mapa.celula(self.bia.id, self.aula2.id)], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Progresso.objects.get(aluno=self.ana, capitulo=self.exercicio).delete()
+        with self.assertNumQueries(0):
+            mapa = obter_mapa(self.curso.id)
+        posicao = mapa.celula(self.ana.id, self.exercicio.id)
+        self.assertEqual((mapa.concluido[posicao], mapa.notas[posicao]), (-1, -1))
+
+    def test_notas_em_lote_atualizam_o_mapa(self):
+        obter_mapa(self.curso.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_notas([(self.bia.id, self.exercicio.id, 9)])
+        with self.assertNumQueries(0):
+            mapa = obter_mapa(self.curso.id)
+        self.assertEqual(mapa.notas[mapa.celula(self.bia.id, self.exercicio.id)], 900)
+        # Exercício aprovado conclui a aula anterior
+        self.assertEqual(mapa.concluido[mapa.celula(self.bia.id, self.aula.id)], 1)
+        # O mapa atualizado no lugar é igual ao remontado do banco
+        self.assertEqual(mapa.como_dict(), montar_mapa(self.curso.id, mapa.versao).como_dict())
+
+    def test_gravacao_sem_a_trava_nao_deixa_mapa_velho(self):
+        chave = f'cursos:mapa_calor:{self.curso.id}'
+        versao = obter_mapa(self.curso.id).versao
+        # Outro processo está atualizando o mapa: quem não pega a trava só invalida
+        caches['default'].add(f'{chave}:trava', 1)
+        atualizar_mapas([(self.curso.id, self.bia.id, self.aula2.id, True, None)])
+        caches['default'].delete(f'{chave}:trava')
+        self.assertNotEqual(versao_mapa(self.curso.id), versao)
+        self.assertNotEqual(obter_mapa(self.curso.id).versao, versao)
+
+        # Se a invalidação cair entre a leitura e a gravação de quem tem a trava,
+        # a versão dela é sobrescrita, mas a marca deixada faz o mapa ser descartado
+        caches['default'].set(f'{chave}:obsoleto', True)
+        atualizar_mapas([(self.curso.id, self.ana.id, self.aula2.id, True, None)])
+        self.assertIsNone(caches['default'].get(chave))
+        self.assertIsNone(caches['default'].get(f'{chave}:obsoleto'))
+
+    def test_curso_sem_mapa_nao_mexe_no_cache(self):
+        chave = f'cursos:mapa_calor:{self.curso.id}'
+        atualizar_mapas([(self.curso.id, self.bia.id, self.aula2.id, True, None)])
+        self.assertIsNone(caches['default'].get(f'{chave}:versao'))
+
+        # Com uma montagem em andamento, a versão muda para o mapa montado ser descartado
+        caches['default'].set(f'{chave}:montando', True)
+        atualizar_mapas([(self.curso.id, self.bia.id, self.aula2.id, True, None)])
+        self.assertIsNotNone(caches['default'].get(f'{chave}:versao'))
+
+    def test_nao_apaga_a_trava_de_outro(self):
+        trava = f'cursos:mapa_calor:{self.curso.id}:trava'
+        obter_mapa(self.curso.id)
+
+        def trava_expirou_e_outro_pegou(*args):
+            caches['default'].set(trava, 'outro')
+            return True
+
+        with mock.patch('cursos.mapa_calor.MapaCalor.atualizar', side_effect=trava_expirou_e_outro_pegou):
+            atualizar_mapas([(self.curso.id, self.bia.id, self.aula2.id, True, None)])
+        self.assertEqual(caches['default'].get(trava), 'outro')
+
+    def test_nova_matricula_descarta_o_mapa(self):
+        versao = obter_mapa(self.curso.id).versao
+        caio = Usuario.objects.create_user(username='caio', first_name='Caio', password='senha123', tipo='aluno')
+        with self.captureOnCommitCallbacks(execute=True):
+            matricular(self.curso, [caio.id])
+        self.assertNotEqual(versao_mapa(self.curso.id), versao)
+        mapa = obter_mapa(self.curso.id)
+        self.assertEqual([nome for _, nome in mapa.alunos], ['Ana', 'Bia', 'Caio'])
+        self.assertEqual(len(mapa.concluido), 9)
+
+    def test_api_comprimida_com_etag(self):
+        url = f'/api/professor/cursos/{self.curso.id}/mapa-calor/'
+        self.client.force_login(self.ana)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.professor)
+        resposta = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(resposta['Content-Encoding'], 'gzip')
+        dados = json.loads(gzip.decompress(resposta.content))
+        self.assertEqual(dados['curso']['nome'], 'Excel')
+        self.assertEqual(dados['notas'][:3], [-1, 875, -1])
+
+        resposta = self.client.get(url, HTTP_IF_NONE_MATCH=resposta['ETag'])
+        self.assertEqual(resposta.status_code, 304)
+
+        resposta = self.client.get(url)
+        self.assertNotIn('Content-Encoding', resposta)
+        self.assertEqual(resposta.json()['concluido'][:3], [1, 1, -1])
+        self.assertEqual(self.client.get('/api/professor/cursos/999999/mapa-calor/').status_code, 403)
+
+    def test_dashboard_lista_cursos_do_professor(self):
+        self.client.force_login(self.professor)
+        resposta = self.client.get('/usuarios/professor/dashboard/')
+        self.assertContains(resposta, f'/api/professor/cursos/{self.curso.id}/mapa-calor/')
@@ -12,6 +12,7 @@ urlpatterns = [
     path('<int:curso_id>/desmatricular/<int:aluno_id>/', views.desmatricular_aluno, name='desmatricular_aluno'),
     path('matricular/', views.matricular_alunos, name='matricular_alunos'),
     path('matriculados/', views.listar_matriculados, name='listar_matriculados'),
+    path('boletim/exportar/', views.exportar_boletim_escola, name='exportar_boletim_escola'),
     path('remover/<int:curso_id>/<int:aluno_id>/', views.remover_aluno, name='remover_aluno'),
 
     # URLs para aulas e exercícios - ORGANIZADAS
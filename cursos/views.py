@@ -4,20 +4,39 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django import forms
 from django.contrib.auth.decorators import user_passes_test, login_required
 from usuarios.models import Usuario
-from .models import Curso, Capitulo, Progresso
+from .models import Curso, Capitulo, Progresso, ResumoProgresso
+from .consultas import orcamento_consultas
+from .exportacao import FORMATOS, exportar_boletim
+from .fila import aplicar_pendentes_do_aluno, enfileirar_notas, modo_assincrono, notas_aplicadas
+from .fragmentos import obter_fragmento
+from .liberacao import liberacao_do_aluno
+from .matriculas import (
+    MAX_MATRICULAS_POR_LOTE, ResultadoMatricula, aluno_matriculado, escola_tem_acesso, ler_identificadores_csv,
+    matricular, matricular_em_lote
+)
+from .pacotes import url_pacote
+from .progresso import atualizar_resumo, resumos_do_aluno
 from certificados.models import Certificado
-from django.utils import timezone
-from certificados.utils import gerar_certificado
+from certificados.artefatos import url_artefato
+from certificados.emissao import emitir_certificado
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+import base64
+import binascii
 import json
-from .serializers import NotaSerializer
+from decimal import Decimal, InvalidOperation
+from .serializers import BoletimItemSerializer, NotaSerializer
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from django.urls import reverse
+from django.core.paginator import Paginator
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.contrib import messages
 
 
@@ -25,17 +44,15 @@ from django.contrib import messages
 def home(request):
     return render(request, 'cursos/home.html')
 
-# Formulário para selecionar alunos
-class MatriculaForm(forms.Form):
-    alunos = forms.ModelMultipleChoiceField(
-        queryset=Usuario.objects.filter(tipo='aluno'),
-        widget=forms.CheckboxSelectMultiple
-    )
+# Formulário para matricular a partir de um CSV (username, e-mail ou CPF por linha)
+class ArquivoMatriculaForm(forms.Form):
+    arquivo = forms.FileField(label='Arquivo CSV')
 
 # Página para listar os cursos da escola logada
 class MeusCursosView(LoginRequiredMixin, ListView):
     model = Curso
     template_name = 'cursos/meus_cursos.html'
+    orcamento_consultas = 8
 
     def get_queryset(self):
         user = self.request.user
@@ -51,29 +68,77 @@ class MeusCursosView(LoginRequiredMixin, ListView):
         print(f'Cursos encontrados para escola/professor {user}: {[curso.nome for curso in cursos]}')  # Debug
         return cursos
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if self.request.user.tipo == 'aluno':
+            aplicar_pendentes_do_aluno(self.request.user)
+            context['lista_cursos'] = _lista_cursos(self.request.user, context['object_list'])
+        else:
+            context['lista_cursos'] = render_to_string('cursos/_lista_cursos.html', {
+                'cursos': context['object_list']
+            })
+        return context
+
 
 
 # Página para matricular alunos
 class MatricularAlunosView(LoginRequiredMixin, FormView):
+    """
+    Matrícula dos alunos da escola em um curso: busca paginada dos alunos
+    ainda não matriculados (selecionados por checkbox) ou envio de um CSV.
+    """
     template_name = 'cursos/matricular_alunos.html'
-    form_class = MatriculaForm
+    form_class = ArquivoMatriculaForm
+    alunos_por_pagina = 50
 
     def dispatch(self, request, *args, **kwargs):
-        self.curso = get_object_or_404(Curso, pk=kwargs['pk'], escola=request.user)
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        self.curso = get_object_or_404(Curso, pk=kwargs['pk'], escolas=request.user)
         return super().dispatch(request, *args, **kwargs)
 
-    def form_valid(self, form):
-        alunos_selecionados = form.cleaned_data['alunos']
-        self.curso.alunos.add(*alunos_selecionados)
-        return redirect('cursos:meus_cursos')
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        busca = self.request.GET.get('q', '').strip()
+        alunos = Usuario.objects.filter(
+            tipo='aluno',
+            escola=self.request.user
+        ).exclude(cursos_matriculados=self.curso).order_by('username')
+        if busca:
+            alunos = alunos.filter(
+                Q(username__icontains=busca) | Q(first_name__icontains=busca) | Q(last_name__icontains=busca)
+                | Q(email__icontains=busca) | Q(cpf__icontains=busca)
+            )
+        context['pagina'] = Paginator(alunos, self.alunos_por_pagina).get_page(self.request.GET.get('pagina'))
+        context['busca'] = busca
+        return context
+
+    def post(self, request, *args, **kwargs):
+        if 'arquivo' in request.FILES:
+            return super().post(request, *args, **kwargs)
+
+        # Alunos marcados na busca: só valem os da própria escola
+        ids = [int(aluno_id) for aluno_id in request.POST.getlist('alunos') if aluno_id.isdigit()]
+        usernames = dict(Usuario.objects.filter(
+            id__in=ids,
+            tipo='aluno',
+            escola=request.user
+        ).values_list('id', 'username'))
+        novos, ja_matriculados = matricular(self.curso, usernames)
+        resultado = ResultadoMatricula(
+            sorted(usernames[aluno_id] for aluno_id in novos),
+            sorted(usernames[aluno_id] for aluno_id in ja_matriculados),
+            [],
+        )
+        return self.render_to_response(self.get_context_data(resultado=resultado))
 
-    def get_form(self):
-        form = super().get_form()
-        # Só mostra alunos que ainda NÃO estão matriculados
-        form.fields['alunos'].queryset = Usuario.objects.filter(
-            tipo='aluno'
-        ).exclude(cursos_matriculados=self.curso)
-        return form
+    def form_valid(self, form):
+        identificadores = ler_identificadores_csv(form.cleaned_data['arquivo'])
+        if len(identificadores) > MAX_MATRICULAS_POR_LOTE:
+            form.add_error('arquivo', f'Máximo de {MAX_MATRICULAS_POR_LOTE} alunos por arquivo')
+            return self.form_invalid(form)
+        resultado = matricular_em_lote(self.curso, identificadores, escola=self.request.user)
+        return self.render_to_response(self.get_context_data(form=form, resultado=resultado))
 
 def usuario_e_escola(usuario):
     return usuario.is_authenticated and usuario.tipo == 'escola'
@@ -81,70 +146,72 @@ def usuario_e_escola(usuario):
 @login_required
 @user_passes_test(usuario_e_escola)
 def matricular_alunos(request):
-    cursos = Curso.objects.filter(escola=request.user)
-    alunos = Usuario.objects.filter(tipo='aluno')
+    """Cursos da escola, cada um com o link para a página de matrícula"""
+    cursos = Curso.objects.filter(escolas=request.user).order_by('nome')
+    return render(request, 'cursos/matricular.html', {
+        'cursos': cursos,
+    })
 
-    if request.method == 'POST':
-        curso_id = request.POST.get('curso')
-        aluno_ids = request.POST.getlist('alunos')
 
-        curso = Curso.objects.get(id=curso_id)
+def _conteudo_curso(request, curso):
+    """
+    Capítulos e progresso do usuário no curso: {'html', 'percentual'}, em cache
+    pela versão do progresso do usuário e da estrutura do curso.
+    """
+    def gerar():
+        liberacao = liberacao_do_aluno(request, curso.id)
+        html = render_to_string('cursos/_conteudo_curso.html', {
+            'capitulos': liberacao.capitulos,
+            'capitulos_liberados': liberacao.capitulos_liberados,
+            'capitulos_concluidos': liberacao.concluidas,
+            'mensagens_bloqueio': liberacao.mensagens_bloqueio,
+            'progresso_percentual': liberacao.percentual,
+        })
+        return {'html': html, 'percentual': liberacao.percentual}
 
-        for aluno_id in aluno_ids:
-            aluno = Usuario.objects.get(id=aluno_id)
-            curso.alunos.add(aluno)
+    return obter_fragmento('conteudo_curso', request.user.id, [curso.id], gerar)
 
-        return redirect('cursos:matricular_alunos')
 
-    return render(request, 'cursos/matricular.html', {
-        'cursos': cursos,
-        'alunos': alunos,
-    })
+def _lista_cursos(aluno, cursos):
+    """HTML dos cartões de curso do aluno com o progresso, em cache como o conteúdo do curso"""
+    cursos = list(cursos)
+
+    def gerar():
+        resumos = resumos_do_aluno(aluno, cursos)
+        for curso in cursos:
+            curso.progresso = resumos[curso.id].percentual
+        return {'html': render_to_string('cursos/_lista_cursos.html', {'cursos': cursos})}
 
+    return mark_safe(obter_fragmento('lista_cursos', aluno.id, [curso.id for curso in cursos], gerar)['html'])
 
+
+@orcamento_consultas(8)
 @login_required
+@notas_aplicadas
 def curso_detalhe(request, curso_id):
     try:
         curso = get_object_or_404(Curso, id=curso_id)
 
         # Verifica se o usuário tem acesso ao curso
-        if request.user.tipo == 'aluno' and request.user not in curso.alunos.all():
+        if request.user.tipo == 'aluno' and not aluno_matriculado(request, curso.id):
             messages.error(request, "Você não está matriculado neste curso")
             return redirect('cursos:meus_cursos')
 
-        if request.user.tipo == 'escola' and request.user not in curso.escolas.all():
+        if request.user.tipo == 'escola' and not escola_tem_acesso(request, curso.id):
             messages.error(request, "Este curso não está disponível para sua escola")
             return redirect('cursos:meus_cursos')
 
-        # Só traz capítulos normais (exclui exercícios)
-        capitulos = Capitulo.objects.filter(
-            curso=curso
-        ).exclude(
-            codigo__icontains='_ex'
-        ).order_by('ordem')
-
-        alunos_matriculados = curso.alunos.all()
-
-        capitulos_concluidos = Progresso.objects.filter(
-            aluno=request.user,
-            capitulo__in=capitulos,
-            concluido=True
-        ).values_list('capitulo_id', flat=True)
+        conteudo = _conteudo_curso(request, curso)
 
-        # Progresso
-        total = capitulos.count()
-        concluidos = len(capitulos_concluidos)
-        progresso_percentual = int((concluidos / total) * 100) if total > 0 else 0
-
-        # Busca certificado se existir
-        certificado = Certificado.objects.filter(aluno=request.user, curso=curso).first()
+        # Busca certificado se existir (só é exibido com o curso concluído)
+        certificado = None
+        if conteudo['percentual'] == 100:
+            certificado = Certificado.objects.filter(aluno=request.user, curso=curso).first()
 
         return render(request, 'cursos/curso_detalhe.html', {
             'curso': curso,
-            'alunos_matriculados': alunos_matriculados,
-            'capitulos': capitulos,
-            'capitulos_concluidos': capitulos_concluidos,
-            'progresso_percentual': progresso_percentual,
+            'conteudo_curso': mark_safe(conteudo['html']),
+            'progresso_percentual': conteudo['percentual'],
             'certificado': certificado,
         })
 
@@ -163,12 +230,39 @@ def desmatricular_aluno(request, curso_id, aluno_id):
 @login_required
 @user_passes_test(usuario_e_escola)
 def listar_matriculados(request):
-    cursos = Curso.objects.filter(escola=request.user).prefetch_related('alunos')
+    cursos = Curso.objects.filter(escolas=request.user).prefetch_related('alunos')
+
+    # Uma linha de resumo por matrícula, em vez de varrer o histórico de progresso
+    resumos = {
+        (resumo.aluno_id, resumo.curso_id): resumo
+        for resumo in ResumoProgresso.objects.filter(curso__in=cursos)
+    }
+    for curso in cursos:
+        for aluno in curso.alunos.all():
+            aluno.resumo = resumos.get((aluno.id, curso.id))
 
     return render(request, 'cursos/listar_matriculados.html', {
         'cursos': cursos,
     })
 
+
+@login_required
+@user_passes_test(usuario_e_escola)
+def exportar_boletim_escola(request):
+    """Boletim de todos os alunos da escola (uma coluna por exercício), enviado em streaming"""
+    formato = request.GET.get('formato', 'csv')
+    if formato not in FORMATOS:
+        formato = 'csv'
+    cursos_ids = [int(curso_id) for curso_id in request.GET.getlist('curso') if curso_id.isdigit()] or None
+
+    tipo_conteudo, extensao = FORMATOS[formato]
+    resposta = StreamingHttpResponse(
+        exportar_boletim(request.user, formato, cursos_ids),
+        content_type=tipo_conteudo
+    )
+    resposta['Content-Disposition'] = f'attachment; filename="boletim_{request.user.username}.{extensao}"'
+    return resposta
+
 @login_required
 @user_passes_test(usuario_e_escola)
 def remover_aluno(request, curso_id, aluno_id):
@@ -178,102 +272,49 @@ def remover_aluno(request, curso_id, aluno_id):
     return redirect('listar_matriculados')
 
 
+@orcamento_consultas(8)
 @login_required
+@notas_aplicadas
 def meus_cursos(request):
-    aluno = request.user
-    cursos = Curso.objects.filter(alunos=aluno)
-
-    cursos_com_progresso = []
-    for curso in cursos:
-        cursos_com_progresso.append({
-            'curso': curso,
-            'progresso': curso.progresso_percentual(aluno)  # Já usa a nova lógica
-        })
-
+    cursos = Curso.objects.filter(alunos=request.user)
     return render(request, 'cursos/meus_cursos.html', {
-        'object_list': cursos_com_progresso
+        'lista_cursos': _lista_cursos(request.user, cursos)
     })
 
 
+@orcamento_consultas(8)
 @login_required
+@notas_aplicadas
 def detalhes_curso(request, curso_id):
     curso = get_object_or_404(Curso, id=curso_id)
 
-    if request.user.tipo == 'aluno' and request.user not in curso.alunos.all():
+    if request.user.tipo == 'aluno' and not aluno_matriculado(request, curso.id):
         messages.error(request, "Você não está matriculado neste curso")
         return redirect('cursos:meus_cursos')
 
-    capitulos_aula = curso.get_capitulos_aula()
-    progressos = Progresso.objects.filter(
-        aluno=request.user,
-        capitulo__curso=curso
-    ).select_related('capitulo')
-
-    progresso_dict = {p.capitulo_id: p for p in progressos}
-
-    capitulos_concluidos = []
-    capitulos_liberados = []
-    mensagens_bloqueio = {}
-
-    for index, capitulo in enumerate(capitulos_aula):
-        exercicio = capitulo.get_exercicio_relacionado()
-
-        # Verifica conclusão
-        if exercicio:
-            progresso_ex = progresso_dict.get(exercicio.id)
-            concluido = progresso_ex and progresso_ex.nota and float(progresso_ex.nota) >= 8
-        else:
-            progresso_aula = progresso_dict.get(capitulo.id)
-            concluido = progresso_aula and progresso_aula.concluido
-
-        if concluido:
-            capitulos_concluidos.append(capitulo.id)
-
-        # Verifica liberação
-        if index == 0:
-            liberado = True
-        else:
-            cap_anterior = capitulos_aula[index - 1]
-            ex_anterior = cap_anterior.get_exercicio_relacionado()
-
-            if ex_anterior:
-                progresso_ex_anterior = progresso_dict.get(ex_anterior.id)
-                liberado = progresso_ex_anterior and progresso_ex_anterior.nota and float(
-                    progresso_ex_anterior.nota) >= 8
-                mensagem = "Complete o exercício anterior com nota ≥ 8"
-            else:
-                progresso_aula_anterior = progresso_dict.get(cap_anterior.id)
-                liberado = progresso_aula_anterior and progresso_aula_anterior.concluido
-                mensagem = "Complete o capítulo anterior"
-
-            if not liberado:
-                mensagens_bloqueio[capitulo.id] = mensagem
-
-        if liberado:
-            capitulos_liberados.append(capitulo.id)
-
-    progresso_percentual = curso.progresso_percentual(request.user)
-    certificado = Certificado.objects.filter(aluno=request.user, curso=curso).first()
+    conteudo = _conteudo_curso(request, curso)
+    certificado = None
+    if conteudo['percentual'] == 100:
+        certificado = Certificado.objects.filter(aluno=request.user, curso=curso).first()
 
     return render(request, 'cursos/curso_detalhe.html', {
         'curso': curso,
-        'capitulos': capitulos_aula,
-        'capitulos_liberados': capitulos_liberados,
-        'capitulos_concluidos': capitulos_concluidos,
-        'mensagens_bloqueio': mensagens_bloqueio,
-        'progresso_percentual': progresso_percentual,
+        'conteudo_curso': mark_safe(conteudo['html']),
+        'progresso_percentual': conteudo['percentual'],
         'certificado': certificado,
     })
 
 
+@orcamento_consultas(8)
 @login_required
+@notas_aplicadas
 def assistir_aula(request, capitulo_id):
     capitulo = get_object_or_404(Capitulo, id=capitulo_id)
     user = request.user
     curso = capitulo.curso
 
     # Verificação de matrícula
-    if user not in curso.alunos.all():
+    if not aluno_matriculado(request, curso.id):
         messages.error(request, "Você não está matriculado neste curso")
         return redirect('cursos:meus_cursos')
 
@@ -282,72 +323,49 @@ def assistir_aula(request, capitulo_id):
         return redirect('cursos:assistir_capitulo', capitulo_id=capitulo_id)
 
     # Verifica liberação
-    capitulos_aula = curso.get_capitulos_aula()
-    index = list(capitulos_aula).index(capitulo)
-
-    if index > 0:
-        cap_anterior = capitulos_aula[index - 1]
-        ex_anterior = cap_anterior.get_exercicio_relacionado()
-
-        if ex_anterior:
-            progresso_ex = Progresso.objects.filter(
-                aluno=user,
-                capitulo=ex_anterior,
-                nota__gte=8
-            ).first()
-            if not progresso_ex:
-                messages.error(request, "Você precisa obter nota ≥ 8 no exercício anterior")
-                return redirect('cursos:curso_detalhe', curso_id=curso.id)
-        else:
-            progresso_aula = Progresso.objects.filter(
-                aluno=user,
-                capitulo=cap_anterior,
-                concluido=True
-            ).first()
-            if not progresso_aula:
-                messages.error(request, "Você precisa completar o capítulo anterior")
-                return redirect('cursos:curso_detalhe', curso_id=curso.id)
+    liberacao = liberacao_do_aluno(request, curso.id)
+    situacao = liberacao.situacao(capitulo.id)
+    if situacao is None:
+        messages.error(request, "Aula não encontrada na estrutura do curso")
+        return redirect('cursos:curso_detalhe', curso_id=curso.id)
+    if not situacao.liberado:
+        messages.error(request, situacao.motivo)
+        return redirect('cursos:curso_detalhe', curso_id=curso.id)
 
     # Renderização do conteúdo
-    base_path = f"cursos/captivate_packages/{curso.nome.replace(' ', '_')}"
-    file_name = f"cap{int(capitulo.ordem)}"
-    captivate_path = f"{base_path}/{file_name}/index.html"
-
     return render(request, 'cursos/assistir_aula.html', {
         'capitulo': capitulo,
         'is_exercicio': False,
-        'captivate_path': captivate_path,
+        'captivate_path': url_pacote(liberacao.estrutura.item(capitulo.id).aula.caminho),
         'minimo_aprovacao': 8
     })
 
 
 @login_required
+@notas_aplicadas
 def gerar_certificado(request, curso_id):
     curso = get_object_or_404(Curso, id=curso_id)
     user = request.user
 
     # Verifica se o usuário está matriculado
-    if user not in curso.alunos.all():
-        return redirect('detalhes_curso', curso_id=curso_id)
-
-    # Verifica se já existe certificado
-    if Certificado.objects.filter(aluno=user, curso=curso).exists():
-        return redirect('detalhes_curso', curso_id=curso_id)
-
-    # Cria novo certificado
-    Certificado.objects.create(
-        aluno=user,
-        curso=curso,
-        criado_em=timezone.now(),
-        codigo=f'CERT-{user.id}-{curso.id}-{timezone.now().timestamp()}'
-    )
+    if not aluno_matriculado(request, curso.id):
+        return redirect('cursos:detalhes_curso', curso_id=curso_id)
+
+    # Só emite certificado para quem concluiu todas as aulas
+    if curso.progresso_percentual(user) < 100:
+        messages.error(request, "Complete todos os capítulos para obter seu certificado")
+        return redirect('cursos:detalhes_curso', curso_id=curso_id)
+
+    # Mesmo caminho da emissão em lote: código curto único e PDF gerado
+    emitir_certificado(user, curso)
 
-    return redirect('detalhes_curso', curso_id=curso_id)
+    return redirect('cursos:detalhes_curso', curso_id=curso_id)
 
 @login_required
 def visualizar_certificado(request, certificado_id):
     certificado = get_object_or_404(Certificado, id=certificado_id, aluno=request.user)
-    return render(request, 'certificados/visualizar_certificado.html', {'certificado': certificado})
+    # PDF renderizado uma única vez e servido com cache (ver certificados.views.artefato_certificado)
+    return redirect(url_artefato(certificado.codigo))
 
 @csrf_exempt
 def receber_nota_exercicio(request):
@@ -357,15 +375,22 @@ def receber_nota_exercicio(request):
         nota = float(request.POST.get('nota', 0))  # Converta para float
 
         if aluno_id and capitulo_id and nota is not None:
+            if modo_assincrono():
+                # Como em api/nota/: o worker (processar_notas) aplica a nota
+                enfileirar_notas([(int(aluno_id), int(capitulo_id), Decimal(str(nota)))])
+                return JsonResponse({'status': 'sucesso', 'mensagem': 'Nota recebida!', 'enfileirada': True})
+
             # Usa Progresso em vez de NotaExercicio
-            progresso, created = Progresso.objects.update_or_create(
-                aluno_id=aluno_id,
-                capitulo_id=capitulo_id,
-                defaults={
-                    'nota': nota,
-                    'concluido': True  # Marca como concluído automaticamente
-                }
-            )
+            with transaction.atomic():
+                progresso, created = Progresso.objects.update_or_create(
+                    aluno_id=aluno_id,
+                    capitulo_id=capitulo_id,
+                    defaults={
+                        'nota': nota,
+                        'concluido': True  # Marca como concluído automaticamente
+                    }
+                )
+                atualizar_resumo(progresso.aluno_id, progresso.capitulo.curso_id)
             return JsonResponse({'status': 'sucesso', 'mensagem': 'Nota salva com sucesso!'})
         else:
             return JsonResponse({'status': 'erro', 'mensagem': 'Dados incompletos!'}, status=400)
@@ -390,19 +415,27 @@ def registrar_nota(request):
             usuario = Usuario.objects.get(id=user_id)  # Alterado de CustomUser para Usuario
             capitulo = Capitulo.objects.get(id=capitulo_id)
 
-            progresso, criado = Progresso.objects.get_or_create(
-                aluno=usuario,  # Alterado de 'usuario' para 'aluno'
-                capitulo=capitulo,
-                defaults={
-                    'nota': nota,
-                    'concluido': True  # Alterado de 'completou' para 'concluido'
-                }
-            )
+            if modo_assincrono():
+                # Só enfileira; o worker (processar_notas) verifica a matrícula e grava
+                enfileirar_notas([(usuario.id, capitulo.id, Decimal(str(nota)))])
+                return Response({'mensagem': 'Nota registrada com sucesso!', 'enfileirada': True})
+
+            with transaction.atomic():
+                progresso, criado = Progresso.objects.get_or_create(
+                    aluno=usuario,  # Alterado de 'usuario' para 'aluno'
+                    capitulo=capitulo,
+                    defaults={
+                        'nota': nota,
+                        'concluido': True  # Alterado de 'completou' para 'concluido'
+                    }
+                )
+
+                if not criado:
+                    progresso.nota = nota
+                    progresso.concluido = True  # Atualiza o campo correto
+                    progresso.save()
 
-            if not criado:
-                progresso.nota = nota
-                progresso.concluido = True  # Atualiza o campo correto
-                progresso.save()
+                atualizar_resumo(usuario.id, capitulo.curso_id)
 
             return Response({'mensagem': 'Nota registrada com sucesso!'})
         except Usuario.DoesNotExist:  # Alterado de CustomUser para Usuario
@@ -413,14 +446,19 @@ def registrar_nota(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@orcamento_consultas(5)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def boletim_notas_api(request):
     aluno = request.user
+    aplicar_pendentes_do_aluno(aluno)
     cursos_com_notas = {}
 
-    # Buscar todos os progressos do aluno, apenas dos capítulos com "_ex" (exercícios)
-    progressos = Progresso.objects.filter(aluno=aluno, capitulo__url__icontains='_ex')
+    # Buscar todos os progressos do aluno, apenas dos exercícios (com curso na mesma consulta)
+    progressos = Progresso.objects.filter(
+        aluno=aluno,
+        capitulo__tipo=Capitulo.TIPO_EXERCICIO
+    ).select_related('capitulo__curso')
 
     for progresso in progressos:
         curso_nome = progresso.capitulo.curso.nome
@@ -435,6 +473,67 @@ def boletim_notas_api(request):
 
     return Response({'cursos_com_notas': cursos_com_notas})
 
+
+BOLETIM_POR_PAGINA = 50
+BOLETIM_MAX_POR_PAGINA = 200
+
+
+def _codificar_cursor(progresso):
+    posicao = f"{progresso.capitulo.curso_id}:{progresso.capitulo.ordem}"
+    return base64.urlsafe_b64encode(posicao.encode()).decode()
+
+
+def _decodificar_cursor(cursor):
+    curso_id, ordem = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+    return int(curso_id), Decimal(ordem)
+
+
+@orcamento_consultas(5)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def boletim_notas_api_v2(request):
+    """
+    Notas de exercícios do aluno, em uma consulta por página. Paginação por
+    cursor (keyset) em (curso, ordem): ?cursor= da resposta anterior, ?limite=
+    e ?curso= para filtrar um curso.
+    """
+    aluno = request.user
+    aplicar_pendentes_do_aluno(aluno)
+
+    progressos = Progresso.objects.filter(
+        aluno=aluno,
+        capitulo__tipo=Capitulo.TIPO_EXERCICIO
+    ).select_related('capitulo__curso').order_by('capitulo__curso_id', 'capitulo__ordem')
+
+    try:
+        limite = min(int(request.query_params.get('limite', BOLETIM_POR_PAGINA)), BOLETIM_MAX_POR_PAGINA)
+        if request.query_params.get('curso'):
+            progressos = progressos.filter(capitulo__curso_id=int(request.query_params['curso']))
+        if request.query_params.get('cursor'):
+            curso_id, ordem = _decodificar_cursor(request.query_params['cursor'])
+            progressos = progressos.filter(
+                Q(capitulo__curso_id__gt=curso_id) |
+                Q(capitulo__curso_id=curso_id, capitulo__ordem__gt=ordem)
+            )
+    except (ValueError, InvalidOperation, binascii.Error):
+        return Response({'erro': 'Parâmetros inválidos.'}, status=status.HTTP_400_BAD_REQUEST)
+    if limite < 1:
+        return Response({'erro': 'Parâmetros inválidos.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Um item a mais indica se há próxima página
+    pagina = list(progressos[:limite + 1])
+    proximo = None
+    if len(pagina) > limite:
+        pagina = pagina[:limite]
+        parametros = request.query_params.copy()
+        parametros['cursor'] = _codificar_cursor(pagina[-1])
+        proximo = request.build_absolute_uri(f"{request.path}?{parametros.urlencode()}")
+
+    return Response({
+        'results': BoletimItemSerializer(pagina, many=True).data,
+        'next': proximo,
+    })
+
 def get_exercicio_relacionado(capitulo):
     return Capitulo.objects.filter(
         curso=capitulo.curso,
@@ -442,7 +541,9 @@ def get_exercicio_relacionado(capitulo):
     ).first()
 
 
+@orcamento_consultas(8)
 @login_required
+@notas_aplicadas
 def assistir_capitulo(request, capitulo_id):
     try:
         capitulo = get_object_or_404(Capitulo, id=capitulo_id)
@@ -452,26 +553,21 @@ def assistir_capitulo(request, capitulo_id):
             return redirect('cursos:assistir_aula', capitulo_id=capitulo_id)
 
         # Verifica aula relacionada
-        aula_relacionada = capitulo.get_aula_relacionada()
-        if not aula_relacionada:
+        liberacao = liberacao_do_aluno(request, capitulo.curso_id)
+        situacao = liberacao.situacao(capitulo.id)
+        if situacao is None:
             messages.error(request, "Exercício sem aula relacionada")
             return redirect('cursos:meus_cursos')
 
         # Verifica se a aula foi concluída
-        progresso_aula = Progresso.objects.filter(
-            aluno=request.user,
-            capitulo=aula_relacionada,
-            concluido=True
-        ).exists()
-
-        if not progresso_aula:
-            messages.error(request, "Complete a aula antes de fazer o exercício")
-            return redirect('cursos:assistir_aula', capitulo_id=aula_relacionada.id)
+        if not situacao.liberado:
+            messages.error(request, situacao.motivo)
+            return redirect('cursos:assistir_aula', capitulo_id=liberacao.estrutura.aula_do_exercicio(capitulo.id).id)
 
         return render(request, 'cursos/assistir_aula.html', {
             'capitulo': capitulo,
             'is_exercicio': True,
-            'captivate_path': f"cursos/captivate_packages/{capitulo.curso.nome.replace(' ', '_')}/cap{capitulo.ordem}_ex/index.html",
+            'captivate_path': url_pacote(liberacao.estrutura.item(capitulo.id).exercicio.caminho),
             'minimo_aprovacao': 8
         })
 
@@ -482,6 +578,7 @@ def assistir_capitulo(request, capitulo_id):
 
 @login_required
 @require_POST
+@notas_aplicadas
 def marcar_concluido(request, capitulo_id):
     try:
         capitulo = get_object_or_404(Capitulo, id=capitulo_id)
@@ -494,43 +591,45 @@ def marcar_concluido(request, capitulo_id):
                 'message': 'Ação permitida apenas para aulas'
             }, status=400)
 
-        # Marca a aula como concluída
-        Progresso.objects.update_or_create(
-            aluno=user,
-            capitulo=capitulo,
-            defaults={'concluido': True}
-        )
-
         # Busca o exercício relacionado (ordem + 0.5)
-        exercicio = capitulo.get_exercicio_relacionado()
+        estrutura = capitulo.curso.get_estrutura()
+        exercicio = estrutura.exercicio_da_aula(capitulo.id)
 
-        if exercicio:
-            # Libera o exercício mesmo se não tiver concluído aulas anteriores
-            Progresso.objects.get_or_create(
+        with transaction.atomic():
+            # Marca a aula como concluída
+            Progresso.objects.update_or_create(
                 aluno=user,
-                capitulo=exercicio
+                capitulo=capitulo,
+                defaults={'concluido': True}
             )
+
+            if exercicio:
+                # Libera o exercício mesmo se não tiver concluído aulas anteriores
+                Progresso.objects.get_or_create(
+                    aluno=user,
+                    capitulo_id=exercicio.id
+                )
+
+            atualizar_resumo(user.id, capitulo.curso_id)
+
+        if exercicio:
             return JsonResponse({
                 'status': 'success',
                 'redirect_url': reverse('cursos:assistir_capitulo', args=[exercicio.id])
             })
 
         # Se não houver exercício, busca próxima aula (para cursos sem exercícios)
-        proxima_aula = Capitulo.objects.filter(
-            curso=capitulo.curso,
-            ordem=capitulo.ordem + 1,
-            tipo=Capitulo.TIPO_AULA
-        ).first()
+        proxima = estrutura.proxima(capitulo.id)
 
-        if proxima_aula:
+        if proxima:
             return JsonResponse({
                 'status': 'success',
-                'redirect_url': reverse('cursos:assistir_aula', args=[proxima_aula.id])
+                'redirect_url': reverse('cursos:assistir_aula', args=[proxima.aula.id])
             })
 
         return JsonResponse({
             'status': 'success',
-            'redirect_url': reverse('cursos:curso_detalhe', args=[capitulo.curso.id])
+            'redirect_url': reverse('cursos:curso_detalhe', args=[capitulo.curso_id])
         })
 
     except Exception as e:
@@ -540,7 +639,9 @@ def marcar_concluido(request, capitulo_id):
         }, status=500)
 
 
+@orcamento_consultas(5)
 @login_required
+@notas_aplicadas
 def boletim_notas(request):
     aluno = request.user
     cursos_com_notas = {}
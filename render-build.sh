@@ -2,5 +2,13 @@
 # render-build.sh
 
 pip install -r requirements.txt
-python manage.py collectstatic --noinput
-python manage.py migrate
\ No newline at end of file
+python manage.py collectstatic --noinput --ignore captivate_packages
+# Incremental só se PACOTES_ROOT apontar para uma pasta que sobreviva entre os builds e seja
+# vista pelo processo web (o padrão fica dentro do checkout, que é um clone novo a cada build,
+# e aí todos os pacotes são copiados e comprimidos de novo). A mudança é detectada pelo conteúdo
+# dos arquivos, não pelo mtime, então o clone novo não invalida o que já foi publicado.
+python manage.py publicar_pacotes
+python manage.py migrate
+# Preenche o curso dos registros de Progresso gravados sem ele (retomável; não faz nada se não houver)
+python manage.py preencher_curso_progresso
+python manage.py createcachetable
\ No newline at end of file
@@ -0,0 +1,55 @@
+import os
+import random
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+
+# Intervalo mínimo, por processo e diretório, entre duas limpezas do cache
+INTERVALO_LIMPEZA = 60
+
+_proximas_limpezas = {}
+
+
+class CacheArquivos(FileBasedCache):
+    """
+    FileBasedCache para o cache 'sessoes' sem a varredura a cada gravação.
+
+    O FileBasedCache lista o diretório inteiro em todo set para contar as
+    entradas (~35 ms com 20 mil arquivos) e, passado MAX_ENTRIES, apaga um
+    terço delas ao acaso, sessões válidas inclusive. Aqui a contagem roda no
+    máximo uma vez por INTERVALO_LIMPEZA segundos em cada processo, apaga
+    primeiro as entradas expiradas e só sorteia outras se ainda passar do
+    limite. MAX_ENTRIES vira um limite aproximado (as gravações entre duas
+    limpezas podem passar dele) e deve ter folga para o pico de usuários
+    logados: cada um ocupa duas entradas (sessão e usuário em cache).
+    """
+
+    def _cull(self):
+        agora = time.monotonic()
+        if _proximas_limpezas.get(self._dir, 0) > agora:
+            return
+        _proximas_limpezas[self._dir] = agora + INTERVALO_LIMPEZA
+
+        arquivos = self._list_cache_files()
+        if len(arquivos) < self._max_entries:
+            return
+        restantes = []
+        for arquivo in arquivos:
+            try:
+                with open(arquivo, 'rb') as f:
+                    # _is_expired apaga o arquivo se ele tiver expirado
+                    if not self._is_expired(f):
+                        restantes.append(arquivo)
+            except FileNotFoundError:
+                pass
+        if len(restantes) < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+        for arquivo in random.sample(restantes, len(restantes) // self._cull_frequency):
+            self._delete(arquivo)
+
+
+def limpar_agendamento(diretorio):
+    """Faz a próxima gravação no diretório rodar a limpeza (usado pelos testes e benchmarks)"""
+    _proximas_limpezas.pop(os.path.abspath(diretorio), None)
@@ -1,6 +1,9 @@
 # usuarios/forms.py
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
+from cursos.models import Curso
+
+from .importacao import MAX_BYTES_UPLOAD
 from .models import Usuario
 
 class LoginForm(AuthenticationForm):
@@ -57,4 +60,30 @@ class AlunoForm(UserCreationForm):
         user.escola = self.escola
         if commit:
             user.save()
-        return user
\ No newline at end of file
+        return user
+
+
+class ImportarAlunosForm(forms.Form):
+    arquivo = forms.FileField(label='Arquivo CSV ou JSONL')
+    senha_padrao = forms.CharField(
+        label='Senha padrão', required=False, widget=forms.PasswordInput,
+        help_text='Usada nas linhas sem a coluna senha'
+    )
+    cursos = forms.ModelMultipleChoiceField(
+        queryset=Curso.objects.none(), required=False, widget=forms.CheckboxSelectMultiple,
+        label='Matricular os novos alunos em'
+    )
+    simular = forms.BooleanField(label='Só validar, sem importar', required=False)
+
+    def __init__(self, *args, **kwargs):
+        self.escola = kwargs.pop('escola', None)
+        super().__init__(*args, **kwargs)
+        self.fields['cursos'].queryset = Curso.objects.filter(escolas=self.escola)
+
+    def clean_arquivo(self):
+        arquivo = self.cleaned_data['arquivo']
+        if arquivo.size > MAX_BYTES_UPLOAD:
+            raise forms.ValidationError(
+                f'Arquivo maior que {MAX_BYTES_UPLOAD // (1024 * 1024)} MB: use o comando importar_alunos'
+            )
+        return arquivo
@@ -0,0 +1,235 @@
+import csv
+import io
+import json
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Usuario
+
+# Campos aceitos em cada linha do CSV/JSONL, com os nomes alternativos em português
+CAMPOS = {
+    'username': ('username', 'usuario', 'usuário'),
+    'first_name': ('first_name', 'nome'),
+    'last_name': ('last_name', 'sobrenome'),
+    'email': ('email', 'e-mail'),
+    'cpf': ('cpf',),
+    'telefone': ('telefone',),
+    'endereco': ('endereco', 'endereço'),
+    'senha': ('senha', 'password'),
+}
+
+# Abaixo disso não compensa abrir um pool de processos para os hashes
+MINIMO_PARA_POOL = 8
+
+# Limites do upload pela página da escola. Lá os hashes rodam dentro da requisição (cerca de 0,5 s cada
+# com o PBKDF2 padrão, por núcleo) e precisam caber no timeout de 30 s do gunicorn; arquivos maiores
+# vão pelo comando importar_alunos. settings.IMPORTACAO_MAX_LINHAS_UPLOAD substitui o padrão de linhas.
+MAX_BYTES_UPLOAD = 2 * 1024 * 1024
+MAX_LINHAS_UPLOAD = 40
+
+# Resultado da importação: usernames criados, erros [(linha, mensagem)] e matrículas feitas por curso
+ResultadoImportacao = namedtuple('ResultadoImportacao', ['criados', 'erros', 'matriculas'])
+
+# Linha validada, pronta para virar Usuario
+LinhaAluno = namedtuple('LinhaAluno', ['numero', 'dados', 'senha'])
+
+
+def _decodificar(conteudo):
+    if isinstance(conteudo, str):
+        return conteudo
+    try:
+        return conteudo.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return conteudo.decode('latin-1')
+
+
+def _normalizar(registro):
+    """Mapeia os nomes de coluna aceitos (CAMPOS) para os campos do Usuario"""
+    chaves = {str(chave).strip().lower(): valor for chave, valor in registro.items() if chave is not None}
+    linha = {}
+    for campo, nomes in CAMPOS.items():
+        for nome in nomes:
+            if chaves.get(nome) not in (None, ''):
+                linha[campo] = str(chaves[nome]).strip()
+                break
+    return linha
+
+
+def ler_linhas(arquivo, formato=None):
+    """
+    Lê o arquivo enviado (CSV com cabeçalho ou JSONL, um objeto por linha) e
+    gera (número da linha, dict com os campos de CAMPOS). O formato é deduzido
+    da extensão quando não informado.
+    """
+    if formato is None:
+        nome = getattr(arquivo, 'name', '') or ''
+        formato = 'jsonl' if nome.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+    texto = _decodificar(arquivo.read())
+
+    if formato == 'jsonl':
+        for numero, linha in enumerate(texto.splitlines(), start=1):
+            if not linha.strip():
+                continue
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                yield numero, None
+                continue
+            yield numero, _normalizar(registro) if isinstance(registro, dict) else None
+        return
+
+    try:
+        dialeto = csv.Sniffer().sniff(texto[:2048], delimiters=',;\t')
+    except csv.Error:
+        dialeto = csv.excel
+    leitor = csv.DictReader(io.StringIO(texto), dialect=dialeto)
+    for registro in leitor:
+        # Número da linha no arquivo, contando o cabeçalho
+        yield leitor.line_num, _normalizar(registro)
+
+
+def limite_linhas_upload():
+    """Máximo de alunos importados por upload na página da escola"""
+    return getattr(settings, 'IMPORTACAO_MAX_LINHAS_UPLOAD', None) or MAX_LINHAS_UPLOAD
+
+
+def _formatar_cpf(valor):
+    digitos = re.sub(r'\D', '', valor)
+    if len(digitos) != 11:
+        raise ValidationError(f'CPF inválido: {valor}')
+    return f'{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}'
+
+
+def validar_linhas(linhas, senha_padrao=None):
+    """
+    Valida as linhas lidas (campos obrigatórios, e-mail, CPF, senha e
+    repetições dentro do próprio arquivo). Retorna ([LinhaAluno], erros).
+    Sem username, usa o e-mail; sem senha, usa senha_padrao.
+    """
+    validas, erros = [], []
+    usernames, cpfs = set(), set()
+    for numero, linha in linhas:
+        if linha is None:
+            erros.append((numero, 'Linha mal formada'))
+            continue
+        linha.setdefault('username', linha.get('email', ''))
+        senha = linha.pop('senha', None) or senha_padrao
+        try:
+            if not linha['username']:
+                raise ValidationError('Informe o username ou o e-mail')
+            Usuario.username_validator(linha['username'])
+            if linha.get('email'):
+                validate_email(linha['email'])
+            if linha.get('cpf'):
+                linha['cpf'] = _formatar_cpf(linha['cpf'])
+            if not senha:
+                raise ValidationError('Informe a senha (coluna senha ou --senha-padrao)')
+            validate_password(senha, Usuario(**linha))
+        except ValidationError as erro:
+            erros.append((numero, ' '.join(erro.messages)))
+            continue
+
+        if linha['username'] in usernames:
+            erros.append((numero, f"Username repetido no arquivo: {linha['username']}"))
+            continue
+        if linha.get('cpf') and linha['cpf'] in cpfs:
+            erros.append((numero, f"CPF repetido no arquivo: {linha['cpf']}"))
+            continue
+        usernames.add(linha['username'])
+        if linha.get('cpf'):
+            cpfs.add(linha['cpf'])
+        validas.append(LinhaAluno(numero, linha, senha))
+    return validas, erros
+
+
+def remover_existentes(validas):
+    """Separa as linhas cujo username ou CPF já existe no banco, com uma única consulta"""
+    usernames = {linha.dados['username'] for linha in validas}
+    cpfs = {linha.dados['cpf'] for linha in validas if linha.dados.get('cpf')}
+    existentes = Usuario.objects.filter(Q(username__in=usernames) | Q(cpf__in=cpfs)).values_list('username', 'cpf')
+    usernames_existentes, cpfs_existentes = set(), set()
+    for username, cpf in existentes:
+        usernames_existentes.add(username)
+        # Usuários sem CPF voltam com cpf=None, que não pode casar com as linhas sem CPF
+        if cpf:
+            cpfs_existentes.add(cpf)
+
+    novas, erros = [], []
+    for linha in validas:
+        if linha.dados['username'] in usernames_existentes:
+            erros.append((linha.numero, f"Username já cadastrado: {linha.dados['username']}"))
+        elif linha.dados.get('cpf') and linha.dados['cpf'] in cpfs_existentes:
+            erros.append((linha.numero, f"CPF já cadastrado: {linha.dados['cpf']}"))
+        else:
+            novas.append(linha)
+    return novas, erros
+
+
+def _iniciar_processo():
+    # Com o start method 'spawn' (macOS/Windows) o processo filho começa sem o Django configurado
+    if not apps.ready:
+        django.setup()
+
+
+def hashear_senhas(senhas, processos=None):
+    """
+    Gera o hash de cada senha (com salt próprio) usando um pool de processos,
+    já que o PBKDF2 é CPU-bound e o GIL impede ganho com threads. `processos`
+    padrão: settings.IMPORTACAO_PROCESSOS ou o número de núcleos.
+    """
+    senhas = list(senhas)
+    if processos is None:
+        processos = getattr(settings, 'IMPORTACAO_PROCESSOS', None) or os.cpu_count() or 1
+    processos = min(processos, len(senhas))
+    if processos <= 1 or len(senhas) < MINIMO_PARA_POOL:
+        return [make_password(senha) for senha in senhas]
+    with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_processo) as pool:
+        return list(pool.map(make_password, senhas, chunksize=max(1, len(senhas) // (processos * 4))))
+
+
+def importar_alunos(escola, linhas, cursos=(), senha_padrao=None, processos=None, simular=False,
+                    batch_size=1000):
+    """
+    Cria os alunos da escola a partir das linhas lidas (ver ler_linhas):
+    valida, descarta usernames/CPFs já cadastrados, gera os hashes em
+    paralelo e grava tudo com bulk_create numa transação. Opcionalmente
+    matricula os novos alunos nos `cursos`. Com simular=True, só valida.
+    """
+    from cursos.matriculas import matricular
+
+    validas, erros = validar_linhas(linhas, senha_padrao)
+    novas, existentes = remover_existentes(validas)
+    erros = sorted(erros + existentes)
+    if simular or not novas:
+        return ResultadoImportacao([linha.dados['username'] for linha in novas], erros, {})
+
+    hashes = hashear_senhas([linha.senha for linha in novas], processos)
+    usernames = [linha.dados['username'] for linha in novas]
+    matriculas = {}
+    with transaction.atomic():
+        Usuario.objects.bulk_create(
+            [
+                Usuario(tipo='aluno', escola=escola, password=senha_hash, **linha.dados)
+                for linha, senha_hash in zip(novas, hashes)
+            ],
+            batch_size=batch_size
+        )
+        if cursos:
+            # bulk_create só devolve os ids no PostgreSQL; relê para funcionar também no SQLite
+            ids = list(Usuario.objects.filter(username__in=usernames).values_list('id', flat=True))
+            for curso in cursos:
+                adicionados, _ = matricular(curso, ids)
+                matriculas[curso.id] = len(adicionados)
+    return ResultadoImportacao(usernames, erros, matriculas)
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cursos.models import Curso
+from usuarios.importacao import importar_alunos, ler_linhas
+from usuarios.models import Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa alunos de uma escola a partir de um CSV (com cabeçalho) ou JSONL, com os hashes de senha '
+        'gerados em paralelo, e opcionalmente os matricula em cursos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('escola', help='Username ou ID da escola')
+        parser.add_argument('arquivo', help='Arquivo .csv ou .jsonl (colunas: username, nome, sobrenome, email, '
+                                            'cpf, telefone, endereco, senha)')
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], help='Padrão: deduzido da extensão')
+        parser.add_argument(
+            '--curso',
+            type=int,
+            action='append',
+            dest='cursos',
+            help='ID de um curso da escola em que matricular os novos alunos (pode ser repetido)'
+        )
+        parser.add_argument('--senha-padrao', help='Senha das linhas sem a coluna senha')
+        parser.add_argument('--processos', type=int, help='Processos para os hashes. Padrão: núcleos da máquina')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--simular', action='store_true', help='Só valida, sem gravar nada')
+
+    def handle(self, *args, **options):
+        escolas = Usuario.objects.filter(tipo='escola')
+        escola = escolas.filter(username=options['escola']).first()
+        if escola is None and options['escola'].isdigit():
+            escola = escolas.filter(id=options['escola']).first()
+        if escola is None:
+            raise CommandError(f"Escola não encontrada: {options['escola']}")
+
+        cursos = []
+        if options['cursos']:
+            cursos = list(Curso.objects.filter(id__in=options['cursos'], escolas=escola))
+            faltando = set(options['cursos']) - {curso.id for curso in cursos}
+            if faltando:
+                raise CommandError(f"Cursos não oferecidos pela escola: {', '.join(map(str, sorted(faltando)))}")
+
+        try:
+            with open(options['arquivo'], 'rb') as arquivo:
+                resultado = importar_alunos(
+                    escola,
+                    ler_linhas(arquivo, options['formato']),
+                    cursos=cursos,
+                    senha_padrao=options['senha_padrao'],
+                    processos=options['processos'],
+                    simular=options['simular'],
+                    batch_size=options['batch_size'],
+                )
+        except OSError as erro:
+            raise CommandError(f"Não foi possível ler {options['arquivo']}: {erro}")
+
+        for numero, mensagem in resultado.erros:
+            self.stderr.write(f'Linha {numero}: {mensagem}')
+        if options['simular']:
+            self.stdout.write(f'{len(resultado.criados)} alunos válidos, {len(resultado.erros)} linhas com erro')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(resultado.criados)} alunos importados, {len(resultado.erros)} linhas com erro'
+        ))
+        for curso in cursos:
+            self.stdout.write(f'{resultado.matriculas.get(curso.id, 0)} matriculados em {curso.nome}')
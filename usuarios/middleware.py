@@ -0,0 +1,21 @@
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.utils.functional import SimpleLazyObject
+
+from .sessoes import carregar_usuario
+
+
+def _usuario_da_requisicao(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = carregar_usuario(request)
+    return request._cached_user
+
+
+class UsuarioEmCacheMiddleware(AuthenticationMiddleware):
+    """
+    AuthenticationMiddleware que carrega request.user do cache de usuários
+    (ver usuarios.sessoes), evitando o SELECT do Usuario a cada requisição.
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: _usuario_da_requisicao(request))
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+
+from .models import Usuario
+
+TIMEOUT_USUARIOS = 60 * 30
+
+
+def _cache():
+    return caches[getattr(settings, 'USUARIOS_CACHE', 'default')]
+
+
+def _chave(usuario_id):
+    return f'usuarios:usuario:{usuario_id}'
+
+
+def invalidar_usuarios(usuarios_ids):
+    _cache().delete_many([_chave(usuario_id) for usuario_id in set(usuarios_ids)])
+
+
+def carregar_usuario(request):
+    """
+    Usuário da sessão, como django.contrib.auth.get_user, mas guardando o
+    Usuario (com tipo e escola já carregados) em cache por id junto com o
+    hash de autenticação da sessão. A entrada só vale se o hash da sessão for
+    igual ao guardado: trocar a senha derruba as sessões antigas como antes.
+    """
+    try:
+        usuario_id = Usuario._meta.pk.to_python(request.session[SESSION_KEY])
+        backend = request.session[BACKEND_SESSION_KEY]
+    except (KeyError, ValueError):
+        return AnonymousUser()
+    hash_sessao = request.session.get(HASH_SESSION_KEY)
+
+    if backend in settings.AUTHENTICATION_BACKENDS and hash_sessao:
+        guardado = _cache().get(_chave(usuario_id))
+        if guardado is not None:
+            hash_guardado, usuario = guardado
+            if constant_time_compare(hash_guardado, hash_sessao):
+                usuario.backend = backend
+                return usuario
+
+    # Falta no cache: valida pelo caminho normal do Django (backend, is_active, hash da sessão)
+    usuario = auth.get_user(request)
+    if usuario.is_authenticated:
+        if usuario.escola_id:
+            # Carrega a escola para ela ir junto no cache
+            usuario.escola
+        _cache().set(_chave(usuario.pk), (usuario.get_session_auth_hash(), usuario), TIMEOUT_USUARIOS)
+    return usuario
@@ -0,0 +1,22 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Usuario
+from .sessoes import invalidar_usuarios
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def invalidar_usuario_em_cache(sender, instance, update_fields=None, **kwargs):
+    # O login só atualiza last_login, que ninguém lê da cópia em cache: não derruba o cache a cada login
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    usuarios_ids = [instance.pk]
+    if instance.tipo == 'escola':
+        # A escola vai junto no cache dos alunos e professores dela
+        usuarios_ids.extend(Usuario.objects.filter(escola_id=instance.pk).values_list('id', flat=True))
+    invalidar_usuarios(usuarios_ids)
+    transaction.on_commit(partial(invalidar_usuarios, usuarios_ids))
@@ -1,3 +1,180 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import time
 
-# Create your tests here.
+from django.contrib.auth.hashers import check_password
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from cursos.benchmark import popular_banco, tempestade_login
+from cursos.models import Curso
+
+from .cache import CacheArquivos, limpar_agendamento
+from .importacao import hashear_senhas, importar_alunos, ler_linhas
+from .models import Usuario
+
+HASHER_RAPIDO = ['django.contrib.auth.hashers.MD5PasswordHasher']
+CACHE_LOCAL = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'sessoes': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sessoes'},
+}
+
+
+@override_settings(PASSWORD_HASHERS=HASHER_RAPIDO)
+class ImportarAlunosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.escola = Usuario.objects.create_user(username='escola_teste', password='senha123', tipo='escola')
+        cls.curso = Curso.objects.create(nome="Curso", descricao="Curso")
+        cls.curso.escolas.add(cls.escola)
+        Usuario.objects.create(username='existente', cpf='111.222.333-44', tipo='aluno', escola=cls.escola)
+
+    def _csv(self, texto, nome='alunos.csv'):
+        return SimpleUploadedFile(nome, texto.encode())
+
+    def test_importa_valida_e_detecta_duplicados(self):
+        arquivo = self._csv(
+            'username;nome;email;cpf;senha\n'
+            'ana;Ana;ana@escola.com;123.456.789-01;Abacaxi#2024\n'
+            ';Bruno;bruno@escola.com;12345678902;Abacaxi#2024\n'
+            'existente;X;x@escola.com;;Abacaxi#2024\n'
+            'carla;Carla;carla@escola.com;11122233344;Abacaxi#2024\n'
+            'ana;Ana 2;ana2@escola.com;;Abacaxi#2024\n'
+            'davi;Davi;nao-e-email;;Abacaxi#2024\n'
+            'edu;Edu;edu@escola.com;;123\n'
+        )
+        with self.assertNumQueries(9):
+            resultado = importar_alunos(self.escola, ler_linhas(arquivo), cursos=[self.curso], processos=1)
+
+        self.assertEqual(resultado.criados, ['ana', 'bruno@escola.com'])
+        self.assertEqual([numero for numero, _ in resultado.erros], [4, 5, 6, 7, 8])
+        self.assertEqual(resultado.matriculas, {self.curso.id: 2})
+        bruno = Usuario.objects.get(username='bruno@escola.com')
+        self.assertEqual((bruno.tipo, bruno.escola, bruno.cpf), ('aluno', self.escola, '123.456.789-02'))
+        self.assertTrue(check_password('Abacaxi#2024', bruno.password))
+        self.assertEqual(self.curso.alunos.count(), 2)
+
+    def test_reimportacao_sem_coluna_de_cpf(self):
+        Usuario.objects.create(username='ana', tipo='aluno', escola=self.escola)
+        arquivo = self._csv(
+            'username,email,senha\n'
+            'ana,ana@escola.com,Abacaxi#2024\n'
+            'bia,bia@escola.com,Abacaxi#2024\n'
+        )
+        resultado = importar_alunos(self.escola, ler_linhas(arquivo), processos=1)
+        self.assertEqual(resultado.criados, ['bia'])
+        self.assertEqual(resultado.erros, [(2, 'Username já cadastrado: ana')])
+
+    def test_simular_nao_grava(self):
+        arquivo = self._csv('{"username": "ana", "senha": "Abacaxi#2024"}\n', 'alunos.jsonl')
+        resultado = importar_alunos(self.escola, ler_linhas(arquivo), simular=True)
+        self.assertEqual(resultado.criados, ['ana'])
+        self.assertFalse(Usuario.objects.filter(username='ana').exists())
+
+    def test_hashes_no_pool_de_processos(self):
+        senhas = [f'Senha#{i}' for i in range(10)]
+        hashes = hashear_senhas(senhas, processos=2)
+        self.assertEqual(len(set(hashes)), 10)
+        self.assertTrue(all(check_password(senha, h) for senha, h in zip(senhas, hashes)))
+
+    def test_comando_jsonl_com_senha_padrao(self):
+        linhas = [json.dumps({'username': f'aluno_{i}', 'nome': f'Aluno {i}'}) for i in range(3)]
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as arquivo:
+            arquivo.write('\n'.join(linhas))
+        self.addCleanup(os.remove, arquivo.name)
+
+        saida = io.StringIO()
+        call_command('importar_alunos', 'escola_teste', arquivo.name, '--senha-padrao', 'Abacaxi#2024',
+                     '--curso', str(self.curso.id), '--processos', '1', stdout=saida)
+        self.assertIn('3 alunos importados', saida.getvalue())
+        self.assertEqual(self.curso.alunos.filter(first_name__startswith='Aluno').count(), 3)
+
+    def test_upload_da_escola(self):
+        self.client.force_login(self.escola)
+        resposta = self.client.post('/usuarios/escola/alunos/importar/', {
+            'arquivo': self._csv('email,senha\nfe@escola.com,Abacaxi#2024\n'),
+            'cursos': [self.curso.id],
+        })
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.context['resultado'].criados, ['fe@escola.com'])
+        self.assertTrue(self.curso.alunos.filter(username='fe@escola.com').exists())
+
+    @override_settings(IMPORTACAO_MAX_LINHAS_UPLOAD=2)
+    def test_upload_grande_vai_para_o_comando(self):
+        self.client.force_login(self.escola)
+        texto = 'email,senha\n' + ''.join(f'a{i}@escola.com,Abacaxi#2024\n' for i in range(3))
+        resposta = self.client.post('/usuarios/escola/alunos/importar/', {'arquivo': self._csv(texto)})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('importar_alunos', resposta.context['form'].errors['arquivo'][0])
+        self.assertFalse(Usuario.objects.filter(username__startswith='a0@').exists())
+
+        # Só validar não gera hashes, então não tem o limite
+        resposta = self.client.post('/usuarios/escola/alunos/importar/', {
+            'arquivo': self._csv(texto), 'simular': True
+        })
+        self.assertEqual(len(resposta.context['resultado'].criados), 3)
+
+
+@override_settings(CACHES=CACHE_LOCAL, PASSWORD_HASHERS=HASHER_RAPIDO)
+class SessoesEmCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.escola = Usuario.objects.create_user(username='escola_teste', password='senha123', tipo='escola')
+        cls.aluno = Usuario.objects.create_user(
+            username='aluno_teste', password='senha123', tipo='aluno', escola=cls.escola
+        )
+
+    def setUp(self):
+        caches['sessoes'].clear()
+        self.client.post('/usuarios/login/', {'username': 'aluno_teste', 'password': 'senha123'})
+
+    def test_usuario_vem_do_cache_com_a_escola(self):
+        self.client.get('/usuarios/redirecionar/')
+        with self.assertNumQueries(0):
+            resposta = self.client.get('/usuarios/redirecionar/')
+        usuario = resposta.wsgi_request.user
+        self.assertEqual((usuario.tipo, usuario.escola.username), ('aluno', 'escola_teste'))
+
+    def test_salvar_invalida_o_cache(self):
+        self.client.get('/usuarios/redirecionar/')
+        self.aluno.first_name = 'Novo'
+        self.aluno.save()
+        resposta = self.client.get('/usuarios/redirecionar/')
+        self.assertEqual(resposta.wsgi_request.user.first_name, 'Novo')
+
+    def test_trocar_a_senha_derruba_a_sessao(self):
+        self.client.get('/usuarios/redirecionar/')
+        self.aluno.set_password('outra-senha-456')
+        self.aluno.save()
+        resposta = self.client.get('/usuarios/redirecionar/')
+        self.assertFalse(resposta.wsgi_request.user.is_authenticated)
+
+    def test_tempestade_de_logins_consulta_menos_com_cache(self):
+        dados = popular_banco(alunos=4, cursos=1, aulas=1)
+        banco = tempestade_login(dados, 'db', alunos=4, requisicoes=3)
+        em_cache = tempestade_login(dados, 'cached_db', alunos=4, requisicoes=3)
+        self.assertLess(em_cache['consultas_por_requisicao'], banco['consultas_por_requisicao'])
+
+
+class CacheArquivosTests(TestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.cache = CacheArquivos(pasta.name, {'OPTIONS': {'MAX_ENTRIES': 10}})
+        limpar_agendamento(pasta.name)
+
+    def test_limpeza_apaga_primeiro_as_expiradas_e_nao_roda_a_cada_gravacao(self):
+        for i in range(10):
+            self.cache.set(f'expira{i}', i, 1)
+        time.sleep(1.1)
+        limpar_agendamento(self.cache._dir)
+        # A primeira gravação já encontra 10 entradas: apaga só as expiradas
+        for i in range(15):
+            self.cache.set(f'sessao{i}', i)
+        # Dentro do intervalo não há nova contagem, mesmo passando de MAX_ENTRIES
+        self.assertEqual([self.cache.get(f'sessao{i}') for i in range(15)], list(range(15)))
+        self.assertEqual(len(os.listdir(self.cache._dir)), 15)
@@ -9,6 +9,7 @@ from .views import (
     AlunoListView,
     ProfessorListView,
     AlunoCreateView,
+    AlunoImportarView,
     ProfessorCreateView,
     toggle_ativo
 )
@@ -24,6 +25,7 @@ urlpatterns = [
     path('escola/dashboard/', dashboard_escola, name='dashboard_escola'),
     path('escola/alunos/', AlunoListView.as_view(), name='aluno_list'),
     path('escola/alunos/novo/', AlunoCreateView.as_view(), name='aluno_create'),
+    path('escola/alunos/importar/', AlunoImportarView.as_view(), name='aluno_importar'),
     path('escola/professores/', ProfessorListView.as_view(), name='professor_list'),
     path('escola/professores/novo/', ProfessorCreateView.as_view(), name='professor_create'),
     path('escola/toggle-ativo/<int:pk>/', toggle_ativo, name='toggle_ativo'),
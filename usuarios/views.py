@@ -2,11 +2,13 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.utils.decorators import method_decorator
-from django.views.generic import ListView, CreateView
+from django.views.generic import ListView, CreateView, FormView
 from django.urls import reverse_lazy
 from django.contrib import messages
 from .models import Usuario
-from .forms import ProfessorForm, AlunoForm
+from .forms import ProfessorForm, AlunoForm, ImportarAlunosForm
+from .importacao import importar_alunos, ler_linhas, limite_linhas_upload
+from cursos.estatisticas import estatisticas_escola
 
 
 # Mixin para verificar se o usuário é uma escola
@@ -41,14 +43,8 @@ def redirecionar_usuario(request):
 
 @escola_required
 def dashboard_escola(request):
-    total_alunos = Usuario.objects.filter(escola=request.user, tipo='aluno').count()
-    total_professores = Usuario.objects.filter(escola=request.user, tipo='professor').count()
-
-    context = {
-        'total_alunos': total_alunos,
-        'total_professores': total_professores,
-    }
-    return render(request, 'usuarios/escola/dashboard.html', context)
+    # Estatísticas agregadas e em cache (também em /api/escola/estatisticas/)
+    return render(request, 'usuarios/escola/dashboard.html', estatisticas_escola(request.user))
 
 
 class AlunoListView(EscolaRequiredMixin, ListView):
@@ -91,6 +87,41 @@ class AlunoCreateView(EscolaRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
+class AlunoImportarView(EscolaRequiredMixin, FormView):
+    """Importação de alunos em lote a partir de um CSV ou JSONL (ver usuarios.importacao)"""
+    form_class = ImportarAlunosForm
+    template_name = 'usuarios/escola/aluno_importar.html'
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['escola'] = self.request.user
+        return kwargs
+
+    def get_context_data(self, **kwargs):
+        kwargs.setdefault('limite_linhas', limite_linhas_upload())
+        return super().get_context_data(**kwargs)
+
+    def form_valid(self, form):
+        linhas = list(ler_linhas(form.cleaned_data['arquivo']))
+        # Os hashes rodam dentro da requisição: arquivos grandes estourariam o timeout do gunicorn
+        limite = limite_linhas_upload()
+        if not form.cleaned_data['simular'] and len(linhas) > limite:
+            form.add_error('arquivo', f'O arquivo tem {len(linhas)} linhas; pela página o máximo é {limite}. '
+                                      'Divida o arquivo ou peça à equipe para usar o comando importar_alunos.')
+            return self.form_invalid(form)
+
+        resultado = importar_alunos(
+            self.request.user,
+            linhas,
+            cursos=form.cleaned_data['cursos'],
+            senha_padrao=form.cleaned_data['senha_padrao'] or None,
+            simular=form.cleaned_data['simular'],
+        )
+        if resultado.criados and not form.cleaned_data['simular']:
+            messages.success(self.request, f'{len(resultado.criados)} alunos importados com sucesso!')
+        return self.render_to_response(self.get_context_data(form=form, resultado=resultado))
+
+
 class ProfessorCreateView(EscolaRequiredMixin, CreateView):
     model = Usuario
     form_class = ProfessorForm
@@ -121,7 +152,9 @@ def toggle_ativo(request, pk):
 @login_required
 @user_passes_test(lambda u: u.tipo == 'professor', login_url='usuarios:login')
 def dashboard_professor(request):
-    return render(request, 'usuarios/professor/dashboard.html')
+    # O mapa de calor de cada curso é carregado pela página (ver cursos.mapa_calor)
+    cursos = request.user.cursos_lecionados.order_by('nome').only('id', 'nome')
+    return render(request, 'usuarios/professor/dashboard.html', {'cursos': cursos})
 
 @login_required
 @user_passes_test(lambda u: u.tipo == 'aluno', login_url='usuarios:login')